@@ -0,0 +1,266 @@
+""" Benchmarks of the wrapper run with stub aliceVision binaries (see stub_binary.py).
+
+For each dataset size, the benchmark generates a synthetic image folder and a folder of stub binaries,
+runs process.process end to end and reports:
+    - the wrapper overhead: CPU time used by the wrapper itself and wall time not spent in the stubs,
+    - the cost of the writes of the status.json and metadata.json files,
+    - the cost of the classification of the log lines,
+    - the parallel efficiency of the DepthMap groups.
+No Meshroom install is needed.
+"""
+import argparse
+import contextlib
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARKS_DIR, '..', 'python_wrapper'))
+
+import log_monitor  # noqa: E402
+import process  # noqa: E402
+import utils  # noqa: E402
+
+# Names of the stub binaries to generate. Format: {step_name: binary_name}
+BINARY_NAMES = {
+    "camera_init": "aliceVision_cameraInit",
+    "feature_extraction": "aliceVision_featureExtraction",
+    "image_matching": "aliceVision_imageMatching",
+    "feature_matching": "aliceVision_featureMatching",
+    "structure_from_motion": "aliceVision_incrementalSfM",
+    "prepare_dense_scene": "aliceVision_prepareDenseScene",
+    "camera_connection": "aliceVision_cameraConnection",
+    "depth_map": "aliceVision_depthMapEstimation",
+    "depth_map_filter": "aliceVision_depthMapFiltering",
+    "meshing": "aliceVision_meshing",
+    "mesh_filtering": "aliceVision_meshFiltering",
+    "texturing": "aliceVision_texturing"
+}
+
+# Steps whose stub cost is given per view
+STEPS_RUN_PER_VIEW = ["feature_extraction", "feature_matching", "depth_map", "depth_map_filter"]
+
+# Number of updates and of log lines used by the micro-benchmarks
+NB_OF_JSON_UPDATES = 10000
+NB_OF_LOG_LINES = 1000000
+
+
+def generate_the_stub_binaries(bin_dir, stub_config):
+    """ Install the stub script under the name of every aliceVision binary and write its configuration.
+    """
+    os.makedirs(bin_dir, exist_ok=True)
+    stub_file = os.path.join(bin_dir, 'stub_binary.py')
+    with open(os.path.join(BENCHMARKS_DIR, 'stub_binary.py'), 'r') as source:
+        stub_code = source.read()
+    with open(stub_file, 'w') as stub:
+        stub.write('#!{}\n'.format(sys.executable) + stub_code)
+    os.chmod(stub_file, 0o755)
+    for binary_name in BINARY_NAMES.values():
+        os.symlink('stub_binary.py', os.path.join(bin_dir, binary_name))
+    with open(os.path.join(bin_dir, 'stub_config.json'), 'w') as config_file:
+        json.dump(stub_config, config_file)
+    return 0
+
+
+def generate_the_images(input_dir, nb_of_images):
+    """ Write nb_of_images small and distinct JPEG files (structurally valid, not meant to be displayed).
+    """
+    os.makedirs(input_dir, exist_ok=True)
+    for image_iter in range(nb_of_images):
+        comment = 'synthetic image {}'.format(image_iter).encode()
+        image = (
+            b'\xff\xd8'                                                               # SOI
+            + b'\xff\xe0\x00\x10JFIF\x00\x01\x01\x00\x00\x01\x00\x01\x00\x00'       # APP0
+            + b'\xff\xfe' + (len(comment) + 2).to_bytes(2, 'big') + comment         # COM
+            + b'\xff\xc0\x00\x0b\x08\x00\x01\x00\x01\x01\x01\x11\x00'               # SOF0 (1x1, 1 component)
+            + b'\xff\xda\x00\x08\x01\x01\x00\x00\x3f\x00'                           # SOS
+            + b'\x00\x00'                                                            # scan data
+            + b'\xff\xd9'                                                            # EOI
+            )
+        with open(os.path.join(input_dir, 'image_{:05d}.jpg'.format(image_iter)), 'wb') as image_file:
+            image_file.write(image)
+    return 0
+
+
+def get_the_stub_time(stub_config, step_name, nb_of_views):
+    """ Returns the time a stub spends sleeping and burning CPU for the given number of views.
+    """
+    config = dict(stub_config.get("default", {}))
+    config.update(stub_config.get(BINARY_NAMES[step_name], {}))
+    return ((config.get("sleep", 0) + config.get("cpu", 0)) * nb_of_views)
+
+
+def get_the_ideal_time(metadata_dict, stub_config, nb_of_jobs):
+    """ Returns the wall time the run would take if the wrapper cost nothing: the stubs of a step divided
+    into groups run nb_of_jobs at a time.
+    """
+    ideal_time = 0
+    for step_name, step_report in metadata_dict["step_by_step_report"].items():
+        # The stages run by the wrapper itself (ingest) have no stub
+        if (step_name not in BINARY_NAMES):
+            continue
+        groups_report = step_report["report"].get("groups_report")
+        if (groups_report is None):
+            ideal_time += get_the_stub_time(stub_config, step_name, 1)
+        else:
+            group_times = sorted((get_the_stub_time(stub_config, step_name, group["range_size"]) for group in groups_report), reverse=True)
+            workers = [0] * max(1, min(nb_of_jobs, len(group_times)))
+            for group_time in group_times:
+                workers[workers.index(min(workers))] += group_time
+            ideal_time += max(workers)
+    return (ideal_time)
+
+
+def get_the_parallel_efficiency(step_report, nb_of_jobs):
+    """ Returns the parallel efficiency of a step divided into groups: time of the groups over (wall time x workers).
+    """
+    groups_report = step_report["report"].get("groups_report")
+    if (not groups_report or step_report["time_taken"] == 0):
+        return
+    nb_of_workers = max(1, min(nb_of_jobs, len(groups_report)))
+    return (sum(group["time_taken"] for group in groups_report) / (step_report["time_taken"] * nb_of_workers))
+
+
+def benchmark_the_run(work_dir, nb_of_images, quality, output_type, nb_of_jobs, stub_config):
+    """ Run the whole process on a synthetic dataset and return its figures.
+    """
+    bin_dir = os.path.join(work_dir, 'bin')
+    input_dir = os.path.join(work_dir, 'input')
+    output_dir = os.path.join(work_dir, 'output')
+    generate_the_stub_binaries(bin_dir, stub_config)
+    generate_the_images(input_dir, nb_of_images)
+    os.makedirs(output_dir)
+
+    self_usage_before = resource.getrusage(resource.RUSAGE_SELF)
+    starting_time = time.time()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        process.process(bin_dir, input_dir, output_dir, quality, output_type, nb_of_images,
+                        path_to_results_json_file=None, path_to_metadata_json_file_directory=output_dir,
+                        path_to_status_json_file_directory=output_dir, nb_of_jobs=nb_of_jobs, history_file=None)
+    wall_time = time.time() - starting_time
+    self_usage_after = resource.getrusage(resource.RUSAGE_SELF)
+
+    metadata_dict = utils.read_json_file(os.path.join(output_dir, 'metadata.json'))
+    ideal_time = get_the_ideal_time(metadata_dict, stub_config, nb_of_jobs)
+    run_report = {
+        "nb_of_images": nb_of_images,
+        "wall_time": wall_time,
+        "ideal_time": ideal_time,
+        "wall_overhead": wall_time - ideal_time,
+        "wrapper_cpu_time": (self_usage_after.ru_utime - self_usage_before.ru_utime) + (self_usage_after.ru_stime - self_usage_before.ru_stime),
+        "success": all(step_report["report"]["success"] for step_report in metadata_dict["step_by_step_report"].values()),
+        "metadata_json_size": os.path.getsize(os.path.join(output_dir, 'metadata.json')),
+        "steps": {}
+    }
+    for step_name, step_report in metadata_dict["step_by_step_report"].items():
+        run_report["steps"][step_name] = {
+            "time_taken": step_report["time_taken"],
+            "nb_of_groups": len(step_report["report"].get("groups_report") or []),
+            "parallel_efficiency": get_the_parallel_efficiency(step_report, nb_of_jobs)
+        }
+    run_report["json_write_cost"] = benchmark_the_json_writes(work_dir, metadata_dict)
+    return (run_report)
+
+
+def benchmark_the_json_writes(work_dir, metadata_dict):
+    """ Returns the cost of NB_OF_JSON_UPDATES updates of a metadata.json file (time until the last state is written)
+    and of one full serialisation of the document.
+    """
+    json_file = os.path.join(work_dir, 'benchmark_metadata.json')
+    starting_time = time.time()
+    for update_iter in range(NB_OF_JSON_UPDATES):
+        metadata_dict["global_report"]["update"] = update_iter
+        utils.update_json_file(json_file, metadata_dict)
+    utils.close_json_files(json_file)
+    updates_time = time.time() - starting_time
+    starting_time = time.time()
+    json.dumps(metadata_dict)
+    serialisation_time = time.time() - starting_time
+    return ({
+        "nb_of_updates": NB_OF_JSON_UPDATES,
+        "updates_time": updates_time,
+        "time_per_update": updates_time / NB_OF_JSON_UPDATES,
+        "full_serialisation_time": serialisation_time
+    })
+
+
+def benchmark_the_log_parsing(work_dir):
+    """ Returns the cost of reading and classifying NB_OF_LOG_LINES log lines through a pipe, as done for every step.
+    """
+    producer = subprocess.Popen(
+        [sys.executable, '-c', 'import sys\nfor i in range({}): sys.stderr.write("[debug] line %d\\n" % i if i % 100 else "[warning] line %d\\n" % i)'.format(NB_OF_LOG_LINES)],
+        stderr=subprocess.PIPE
+        )
+    starting_time = time.time()
+    log_counters = log_monitor.LogCounters()
+    monitor = log_monitor.LogMonitor(os.path.join(work_dir, 'benchmark_log.txt'), log_counters)
+    monitor.start(producer.stderr)
+    producer.wait()
+    monitor.join()
+    parsing_time = time.time() - starting_time
+    return ({
+        "nb_of_lines": log_counters.counters["lines"],
+        "parsing_time": parsing_time,
+        "lines_per_second": log_counters.counters["lines"] / parsing_time if parsing_time > 0 else None
+    })
+
+
+def get_the_default_stub_config(depth_map_group_time):
+    """ Returns a stub configuration where every stub is instantaneous but DepthMap, which takes the given time per view.
+    """
+    return ({
+        "default": {"sleep": 0.0, "cpu": 0.0, "output_size": 16, "log_lines": 100},
+        BINARY_NAMES["depth_map"]: {"sleep": depth_map_group_time}
+    })
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the wrapper with stub aliceVision binaries.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000],
+                        help='Numbers of images of the synthetic datasets (from 10 to 10000).')
+    parser.add_argument('--quality', type=str, default='DRAFT', help='Quality of the runs.')
+    parser.add_argument('--outputType', type=str, default='TEXTURED_MESH', help='Output type of the runs.')
+    parser.add_argument('--jobs', type=int, default=utils.get_the_number_of_cores(),
+                        help='Maximum number of concurrent groups.')
+    parser.add_argument('--stubConfig', metavar='JSON FILE', type=str, required=False,
+                        help='Configuration of the stub binaries (see stub_binary.py). DepthMap stubs sleeping 0.01 s per view by default.')
+    parser.add_argument('--output', metavar='JSON FILE', type=str, required=False,
+                        help='File where to write the results. Printed otherwise.')
+    parser.add_argument('--keep', action='store_true', help='Keep the generated datasets and outputs.')
+
+    args = parser.parse_args()
+
+    if (args.stubConfig is not None):
+        stub_config = utils.read_json_file(args.stubConfig)
+    else:
+        stub_config = get_the_default_stub_config(0.01)
+
+    benchmark_dir = tempfile.mkdtemp(prefix='pluggable_meshroom_benchmark_')
+    results = {
+        "quality": args.quality,
+        "output_type": args.outputType,
+        "nb_of_jobs": args.jobs,
+        "stub_config": stub_config,
+        "log_parsing": benchmark_the_log_parsing(benchmark_dir),
+        "runs": []
+    }
+    try:
+        for nb_of_images in args.sizes:
+            work_dir = os.path.join(benchmark_dir, str(nb_of_images))
+            os.makedirs(work_dir)
+            results["runs"].append(benchmark_the_run(work_dir, nb_of_images, args.quality, args.outputType, args.jobs, stub_config))
+            print ("{} images: {:.2f} s".format(nb_of_images, results["runs"][-1]["wall_time"]), file=sys.stderr)
+    finally:
+        if (not args.keep):
+            shutil.rmtree(benchmark_dir, ignore_errors=True)
+
+    if (args.output is not None):
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, indent=4)
+    else:
+        print (json.dumps(results, indent=4))
@@ -0,0 +1,134 @@
+""" Stub of the aliceVision binaries used by the benchmarks.
+
+The same script is installed under the name of every aliceVision binary run by the wrapper. It parses the
+command line the wrapper gives, writes the outputs the next steps and the wrapper checks, and simulates the
+cost of the step. The behaviour is read from the stub_config.json file placed next to the script. Format:
+    {
+        "default": {"sleep": ..., "cpu": ..., "output_size": ..., "log_lines": ...},
+        "aliceVision_depthMapEstimation": {...},
+        ...
+    }
+- sleep: time spent sleeping (in seconds, per view for the steps run on a range of views)
+- cpu: CPU time burnt (in seconds, per view for the steps run on a range of views)
+- output_size: size of each output file (in bytes)
+- log_lines: number of lines written on stderr
+"""
+import json
+import os
+import sys
+import time
+
+BINARY_NAME = os.path.basename(sys.argv[0])
+STUB_CONFIG_FILE = os.path.join(os.path.dirname(os.path.abspath(sys.argv[0])), 'stub_config.json')
+DEFAULT_CONFIG = {"sleep": 0.0, "cpu": 0.0, "output_size": 16, "log_lines": 10}
+
+
+def read_the_config():
+    config = dict(DEFAULT_CONFIG)
+    try:
+        with open(STUB_CONFIG_FILE, 'r') as config_file:
+            stub_config = json.load(config_file)
+        config.update(stub_config.get("default", {}))
+        config.update(stub_config.get(BINARY_NAME, {}))
+    except (OSError, ValueError):
+        pass
+    return (config)
+
+
+def read_the_arguments():
+    arguments = {}
+    for option, value in zip(sys.argv[1::2], sys.argv[2::2]):
+        arguments[option.lstrip('-')] = value
+    return (arguments)
+
+
+def read_the_views(sfm_file):
+    with open(sfm_file, 'r') as file:
+        return (sorted(json.load(file)["views"], key=lambda view: int(view["viewId"])))
+
+
+def select_the_range(views, arguments):
+    range_start = int(arguments.get("rangeStart", -1))
+    if (range_start < 0):
+        return (views)
+    return (views[range_start:range_start + int(arguments.get("rangeSize", len(views)))])
+
+
+def write_the_file(path, config, content=None):
+    folder = os.path.dirname(path)
+    if (folder != ''):
+        os.makedirs(folder, exist_ok=True)
+    with open(path, 'wb') as file:
+        file.write(content if content is not None else os.urandom(config["output_size"]))
+
+
+def simulate_the_cost(config, nb_of_views):
+    time.sleep(config["sleep"] * nb_of_views)
+    burning_end = time.process_time() + config["cpu"] * nb_of_views
+    while (time.process_time() < burning_end):
+        pass
+
+
+def main():
+    config = read_the_config()
+    arguments = read_the_arguments()
+    for line_iter in range(config["log_lines"]):
+        level = "warning" if (line_iter % 100 == 99) else "debug"
+        sys.stderr.write("[{}] {} line {}\n".format(level, BINARY_NAME, line_iter))
+    nb_of_views = 1
+
+    if (BINARY_NAME == "aliceVision_cameraInit"):
+        images = sorted(entry.name for entry in os.scandir(arguments["imageFolder"]) if entry.is_file())
+        views = [{"viewId": str(10000000 + image_iter), "path": os.path.join(arguments["imageFolder"], image)}
+                 for image_iter, image in enumerate(images)]
+        write_the_file(arguments["output"], config, json.dumps({"views": views}).encode())
+    elif (BINARY_NAME == "aliceVision_featureExtraction"):
+        views = select_the_range(read_the_views(arguments["input"]), arguments)
+        nb_of_views = len(views)
+        for view in views:
+            for describer_type in arguments["describerTypes"].split(','):
+                write_the_file(os.path.join(arguments["output"], '{}.{}.feat'.format(view["viewId"], describer_type)), config)
+                write_the_file(os.path.join(arguments["output"], '{}.{}.desc'.format(view["viewId"], describer_type)), config)
+    elif (BINARY_NAME == "aliceVision_imageMatching"):
+        views = read_the_views(arguments["input"])
+        lines = []
+        for view_iter, view in enumerate(views[:-1]):
+            lines.append(' '.join(other_view["viewId"] for other_view in [view] + views[view_iter+1:view_iter+6]))
+        write_the_file(arguments["output"], config, '\n'.join(lines).encode())
+    elif (BINARY_NAME == "aliceVision_featureMatching"):
+        views = select_the_range(read_the_views(arguments["input"]), arguments)
+        nb_of_views = len(views)
+        matches = ''.join('{} {}\n1\nsift 1\n0 0\n'.format(view["viewId"], int(view["viewId"]) + 1) for view in views)
+        write_the_file(os.path.join(arguments["output"], '{}.matches.txt'.format(arguments.get("rangeStart", 0))), config, matches.encode())
+    elif (BINARY_NAME == "aliceVision_incrementalSfM"):
+        views = read_the_views(arguments["input"])
+        write_the_file(arguments["output"], config, json.dumps({"views": views}).encode())
+        write_the_file(arguments["outputViewsAndPoses"], config, json.dumps({"views": views}).encode())
+        write_the_file(os.path.join(arguments["extraInfoFolder"], 'cloud_and_poses.ply'), config)
+    elif (BINARY_NAME == "aliceVision_prepareDenseScene"):
+        views = read_the_views(arguments["input"])
+        write_the_file(os.path.join(arguments["output"], 'mvs.ini'), config, json.dumps({"views": views}).encode())
+        for view in views:
+            write_the_file(os.path.join(arguments["output"], '{}.exr'.format(view["viewId"])), config)
+    elif (BINARY_NAME == "aliceVision_cameraConnection"):
+        write_the_file(os.path.join(os.path.dirname(arguments["ini"]), 'cameras.bin'), config)
+    elif (BINARY_NAME in ("aliceVision_depthMapEstimation", "aliceVision_depthMapFiltering")):
+        views = select_the_range(read_the_views(arguments["ini"]), arguments)
+        nb_of_views = len(views)
+        for view in views:
+            write_the_file(os.path.join(arguments["output"], '{}_depthMap.exr'.format(view["viewId"])), config)
+    elif (BINARY_NAME == "aliceVision_meshing"):
+        write_the_file(arguments["output"], config)
+        write_the_file(os.path.join(os.path.dirname(arguments["output"]), 'denseReconstruction.bin'), config)
+    elif (BINARY_NAME == "aliceVision_meshFiltering"):
+        write_the_file(arguments["output"], config)
+    elif (BINARY_NAME == "aliceVision_texturing"):
+        for output_file in ('texturedMesh.obj', 'texture_0.png', 'texturedMesh.mtl'):
+            write_the_file(os.path.join(arguments["output"], output_file), config)
+
+    simulate_the_cost(config, nb_of_views)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
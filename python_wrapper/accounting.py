@@ -0,0 +1,235 @@
+import asyncio
+import os
+import resource
+import time
+
+""" Accounting of the resources used by the subprocesses run by the steps.
+
+- user and system CPU time and peak RSS of a subprocess come from os.wait4 (exact, the subprocess and the children it waited for),
+or from the /proc samples of its process tree for the subprocesses run on an event loop, which reaps them itself: the user
+and system times of /proc/<pid>/stat summed over the processes of the tree (at their last sample) and the highest VmHWM
+(peak RSS kept by the kernel) of /proc/<pid>/status. Both paths give the same fields,
+- bytes read and written, peak RSS of the whole process tree and number of processes come from /proc sampling
+while the subprocess runs (a last sample is taken once it has exited, before it is reaped),
+- the CPU time used by all the children of the wrapper during a step comes from resource.getrusage(RUSAGE_CHILDREN) deltas
+(it includes the subprocesses of the other jobs in batch mode).
+"""
+
+# Time between two samples of a running subprocess (in seconds). It grows from the first value to the second one
+FIRST_SAMPLING_INTERVAL = 0.02
+MAX_SAMPLING_INTERVAL = 1.0
+
+# Fields of /proc/<pid>/io which are kept
+IO_FIELDS = ["rchar", "wchar", "read_bytes", "write_bytes"]
+
+
+class ProcessSampler():
+    """ An instance of the class ProcessSampler samples /proc for a subprocess and its descendants.
+
+    Building arguments
+    ----------
+    - pid: pid of the subprocess
+
+    Attributes
+    ----------
+    - pid: pid of the subprocess
+    - io: last bytes read and written by each process of the tree. Format: {pid: {"rchar": ..., ...}}
+    - peak_rss: highest resident set size of the process tree seen (in bytes)
+    - max_rss: highest peak resident set size of a process of the tree (VmHWM, in bytes)
+    - pids: pids of every process of the tree seen
+    - cpu_times: last user and system CPU times of each process of the tree (in seconds). Format: {pid: (user_time, system_time)}
+    """
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.io = {}
+        self.peak_rss = 0
+        self.max_rss = 0
+        self.pids = set([pid])
+        self.cpu_times = {}
+
+    def sample(self):
+        """ Read the io, memory and CPU figures of every process of the tree.
+        """
+        tree_rss = 0
+        for pid in get_the_process_tree(self.pid):
+            self.pids.add(pid)
+            io = read_the_proc_io(pid)
+            if (io is not None):
+                self.io[pid] = io
+            rss, peak_rss = read_the_proc_rss(pid)
+            tree_rss += rss
+            self.max_rss = max(self.max_rss, peak_rss)
+            cpu_times = read_the_proc_cpu_times(pid)
+            if (cpu_times is not None):
+                self.cpu_times[pid] = cpu_times
+        self.peak_rss = max(self.peak_rss, tree_rss)
+        return 0
+
+    def get_the_cpu_time(self):
+        """ Returns the CPU time used by the process tree so far (the processes which have exited count for their last sample).
+        """
+        return (sum(user_time + system_time for user_time, system_time in self.cpu_times.values()))
+
+    def report(self):
+        """ Returns the figures sampled. Format: {"rchar": ..., "wchar": ..., "read_bytes": ..., "write_bytes": ..., "peak_tree_rss": ..., "nb_of_processes": ...}
+        """
+        report = {}
+        for field in IO_FIELDS:
+            report[field] = sum(io.get(field, 0) for io in self.io.values())
+        report["peak_tree_rss"] = self.peak_rss
+        report["nb_of_processes"] = len(self.pids)
+        return (report)
+
+
+def wait_and_account(running_process, on_sample=None):
+    """ Wait for the given subprocess (instance of subprocess.Popen) to end while sampling its resources.
+    Sets the returncode of the subprocess.
+
+    Arguments
+    ----------
+    - running_process: the subprocess.Popen instance
+    - on_sample: function called with the ProcessSampler after each sample (optional)
+
+    Returns
+    ----------
+    A dictionary. Format:
+    {
+        "user_time": ..., "system_time": ..., "max_rss": (in bytes),
+        "rchar": ..., "wchar": ..., "read_bytes": ..., "write_bytes": ..., "peak_tree_rss": ..., "nb_of_processes": ...
+    }
+    """
+    sampler = ProcessSampler(running_process.pid)
+    sampling_interval = FIRST_SAMPLING_INTERVAL
+    while True:
+        # Wait for the subprocess to exit without reaping it, so that it can still be sampled
+        exit_info = os.waitid(os.P_PID, running_process.pid, os.WEXITED | os.WNOHANG | os.WNOWAIT)
+        sampler.sample()
+        if (on_sample is not None):
+            on_sample(sampler)
+        if (exit_info is not None):
+            break
+        time.sleep(sampling_interval)
+        sampling_interval = min(2*sampling_interval, MAX_SAMPLING_INTERVAL)
+    pid, exit_status, rusage = os.wait4(running_process.pid, 0)
+    if (os.WIFSIGNALED(exit_status)):
+        running_process.returncode = -os.WTERMSIG(exit_status)
+    else:
+        running_process.returncode = os.WEXITSTATUS(exit_status)
+    report = {
+        "user_time": rusage.ru_utime,
+        "system_time": rusage.ru_stime,
+        "max_rss": rusage.ru_maxrss * 1024
+        }
+    report.update(sampler.report())
+    return (report)
+
+
+async def wait_and_account_on_the_loop(running_process, on_sample=None):
+    """ Same as wait_and_account for a subprocess run on the event loop (instance of asyncio.subprocess.Process).
+    The subprocess is reaped by the event loop: its user and system CPU times and its peak memory come from the samples
+    of its process tree, taken until it exits. Same format as wait_and_account.
+    """
+    sampler = ProcessSampler(running_process.pid)
+    sampling_interval = FIRST_SAMPLING_INTERVAL
+    exit_waiting = asyncio.ensure_future(running_process.wait())
+    while (not exit_waiting.done()):
+        sampler.sample()
+        if (on_sample is not None):
+            on_sample(sampler)
+        await asyncio.wait([exit_waiting], timeout=sampling_interval)
+        sampling_interval = min(2*sampling_interval, MAX_SAMPLING_INTERVAL)
+    report = {
+        "user_time": sum(user_time for user_time, system_time in sampler.cpu_times.values()),
+        "system_time": sum(system_time for user_time, system_time in sampler.cpu_times.values()),
+        "max_rss": sampler.max_rss
+        }
+    report.update(sampler.report())
+    return (report)
+
+
+def sum_the_reports(reports):
+    """ Returns the resources used by several subprocesses: CPU times, bytes and processes are summed, peaks are maxed.
+    """
+    total = {}
+    for report in reports:
+        for key in report:
+            if (key in ("max_rss", "peak_tree_rss")):
+                total[key] = max(total.get(key, 0), report[key])
+            else:
+                total[key] = total.get(key, 0) + report[key]
+    return (total)
+
+
+def get_the_children_rusage():
+    """ Returns the CPU times used by the children of the wrapper so far. Format: {"user_time": ..., "system_time": ...}
+    """
+    rusage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return ({"user_time": rusage.ru_utime, "system_time": rusage.ru_stime})
+
+
+def get_the_rusage_delta(rusage_before, rusage_after):
+    """ Returns the difference between two results of get_the_children_rusage.
+    """
+    return (dict((key, rusage_after[key] - rusage_before[key]) for key in rusage_before))
+
+
+def get_the_process_tree(pid):
+    """ Returns the pids of the given process and of its descendants (read from /proc/<pid>/task/<tid>/children).
+    """
+    tree = []
+    pids_to_visit = [pid]
+    while (len(pids_to_visit) > 0):
+        current_pid = pids_to_visit.pop()
+        tree.append(current_pid)
+        try:
+            for tid in os.listdir('/proc/{}/task'.format(current_pid)):
+                with open('/proc/{}/task/{}/children'.format(current_pid, tid), 'r') as children:
+                    pids_to_visit.extend(int(child_pid) for child_pid in children.read().split())
+        except (OSError, ValueError):
+            continue
+    return (tree)
+
+
+def read_the_proc_io(pid):
+    """ Returns the bytes read and written by the given process. None if /proc/<pid>/io can not be read.
+    """
+    try:
+        io = {}
+        with open('/proc/{}/io'.format(pid), 'r') as proc_io:
+            for line in proc_io:
+                field, value = line.split(':')
+                if (field in IO_FIELDS):
+                    io[field] = int(value)
+        return (io)
+    except (OSError, ValueError):
+        return
+
+
+def read_the_proc_rss(pid):
+    """ Returns the resident set size of the given process and its peak (VmRSS and VmHWM) in bytes
+    (0 for the values which can not be read from /proc/<pid>/status).
+    """
+    memory = {"VmRSS": 0, "VmHWM": 0}
+    try:
+        with open('/proc/{}/status'.format(pid), 'r') as proc_status:
+            for line in proc_status:
+                field = line.split(':', 1)[0]
+                if (field in memory):
+                    memory[field] = int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    return (memory["VmRSS"], memory["VmHWM"])
+
+
+def read_the_proc_cpu_times(pid):
+    """ Returns the user and system CPU times used by the given process in seconds. None if /proc/<pid>/stat can not be read.
+    """
+    try:
+        with open('/proc/{}/stat'.format(pid), 'r') as proc_stat:
+            # The fields after the command name, which may contain spaces
+            fields = proc_stat.read().rsplit(')', 1)[1].split()
+        clock_ticks = os.sysconf('SC_CLK_TCK')
+        return (int(fields[11]) / clock_ticks, int(fields[12]) / clock_ticks)
+    except (OSError, ValueError, IndexError):
+        return
@@ -0,0 +1,202 @@
+import argparse
+import asyncio
+import concurrent.futures
+import functools
+import json
+import signal
+import sys
+import threading
+
+import deadline
+import disk_manager
+import history
+import process
+import status_server
+import utils
+import watchdog
+
+""" Importable asyncio API of the wrapper.
+
+run_pipeline runs a whole process from a coroutine, so that one long-lived service can drive many concurrent runs
+from a single event loop:
+    - the subprocesses of the steps are started on the event loop (asyncio.create_subprocess_exec), which also reads their stderr
+    and samples their resources (see Node.run_the_command_on_the_loop),
+    - the steps are chained as by process.process (cache, resume, deadline, disk manager...), in a worker thread of the run
+    which waits for its subprocesses,
+    - progress: on_progress is called on the event loop with the status.json document each time it is written
+    (at most twice per second, see json_writer.py),
+    - cancellation: cancelling the coroutine kills the subprocesses running (reason "cancelled"), the steps left are not run
+    and the run is marked as cancelled in the status.json and metadata.json files. asyncio.CancelledError is raised
+    once the worker thread is done.
+The event loop must be able to watch the subprocesses started from it: with python < 3.8, it must be the event loop of the main thread.
+The command line of the wrapper is this module (python api.py --help, see run_the_command_line): it runs run_pipeline
+until it is complete (see run_until_complete). process.py only imports this module when it is run as a script, to forward
+its command line here.
+"""
+
+
+async def run_pipeline(setups, directions, on_progress=None, **kwargs):
+    """ Run the process with the given setups and directions, stopping at the first failed step.
+
+    Arguments
+    ----------
+    - setups: an instance of the class Setups
+    - directions: an instance of the class Directions
+    - on_progress: function (or coroutine function) called on the event loop with the status.json document
+    (python dictionary) each time it is written (optional)
+    - kwargs: options of the run, see process.process (loop and cancel_event are given by run_pipeline)
+
+    Returns
+    ----------
+    0 if every step succeeded, 1 if the run stopped at a failed step, if no valid image was found
+    or if the input folder can not be read
+    (the prediction of the steps with plan).
+    """
+    loop = asyncio.get_event_loop()
+    cancel_event = threading.Event()
+
+    progress_listener = None
+    if (on_progress is not None):
+        def report_the_progress(content):
+            progress_report = on_progress(json.loads(content))
+            if (asyncio.iscoroutine(progress_report)):
+                asyncio.ensure_future(progress_report)
+
+        # Called by the writer of the status.json file, in its own thread
+        def progress_listener(content, events):
+            loop.call_soon_threadsafe(report_the_progress, content)
+
+        utils.watch_json_file(directions.status_file, progress_listener)
+
+    try:
+        # Each run has a thread of its own, so that the runs do not wait for one another
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        running = loop.run_in_executor(executor, functools.partial(process.run_the_process, setups, directions, loop=loop, cancel_event=cancel_event, **kwargs))
+        executor.shutdown(wait=False)
+        try:
+            return (await asyncio.shield(running))
+        except asyncio.CancelledError:
+            cancel_event.set()
+            # The subprocesses are killed and the reports written before the cancellation goes on
+            await asyncio.wait([running])
+            raise
+    finally:
+        # The listener refers to the event loop, which may be closed after the run
+        if (progress_listener is not None):
+            utils.unwatch_json_file(directions.status_file, progress_listener)
+
+
+def run_until_complete(loop, coroutine):
+    """ Run the given coroutine on the given event loop (not running) until it is complete. Returns its result.
+    If the calling thread is interrupted meanwhile (Ctrl-C, SIGTERM), the coroutine is cancelled and run until its cancellation
+    is complete (the subprocesses of a run are killed), then the interruption is raised again.
+    """
+    task = asyncio.ensure_future(coroutine, loop=loop)
+    try:
+        return (loop.run_until_complete(task))
+    except BaseException:
+        if (not task.done()):
+            task.cancel()
+            try:
+                loop.run_until_complete(task)
+            except BaseException:
+                # asyncio.CancelledError, or the run failed meanwhile
+                pass
+        raise
+
+
+def run_the_command_line():
+    """ Command line of the wrapper: parses the arguments of the process and runs run_pipeline until it is complete.
+    Exits with the return code of the run.
+    """
+    parser = argparse.ArgumentParser(description='Launch alicevision pipeline.')
+    parser.add_argument('--bin', metavar='FOLDER', type=str, required=True,
+                        help='Folder which contains Meshroom executable files.')
+    parser.add_argument('--input', metavar='FOLDER', type=str, required=True,
+                        help='Input folder.')
+    parser.add_argument('--output', metavar='FOLDER', type=str, required=True,
+                        help='Output folder.')
+    parser.add_argument('--quality', type=str, required=False,
+                        help='Quality desired. Possible values: DRAFT, MEDIUM, HIGH. Optional with --deadline ({} by default).'.format(deadline.DEADLINE_QUALITY))
+    parser.add_argument('--outputType', type=str, required=True,
+                        help='Output desired. Possible values: POINT_CLOUD, MESH, FILTERED_MESH, TEXTURED_MESH.')
+    parser.add_argument('--nbOfImages', type=int, required=False,
+                        help='Number of input pictures. Counted by the ingest stage if not given.')
+    parser.add_argument('--results', metavar='JSON FILE', type=str, required=False,
+                        help='results.json file address if given.')
+    parser.add_argument('--metadata', metavar='FOLDER', type=str, required=False,
+                        help='Folder where to write the metadata.json file if wanted. Gives a live report of the running process.')
+    parser.add_argument('--status', metavar='FOLDER', type=str, required=True,
+                        help='Folder where to write the status.json file. It gives a live report of the process flow')
+    parser.add_argument('--jobs', type=int, required=False,
+                        help='Maximum number of subprocesses run concurrently by a step divided into groups. Number of available cores by default.')
+    parser.add_argument('--cache', metavar='FOLDER', type=str, required=False,
+                        help='Folder where to store the step cache if wanted. Steps already run with the same inputs, parameters and binary are restored from it.')
+    parser.add_argument('--cacheSize', type=float, required=False, default=process.DEFAULT_CACHE_SIZE,
+                        help='Maximum size of the step cache in GB. The least recently used entries are evicted beyond it.')
+    parser.add_argument('--resume', action='store_true',
+                        help='Resume an interrupted run from the first step it did not complete, using the status.json and metadata.json files it left.')
+    parser.add_argument('--incremental', metavar='FOLDER', type=str, required=False,
+                        help='Folder of the feature store if wanted. Only the images and pairs of images which are not in the store are extracted and matched.')
+    parser.add_argument('--manifest', action='store_true',
+                        help='Write the size and the checksum of every output file of each step in output/manifest/<step>.json.')
+    parser.add_argument('--cleanIntermediates', type=str, required=False, choices=disk_manager.CLEANING_METHODS,
+                        help='Delete or compress the output folder of a step as soon as the last step reading it has succeeded.')
+    parser.add_argument('--keep', metavar='STEP', type=str, nargs='+', required=False,
+                        help='Steps whose output folder must not be cleaned (besides the steps giving the deliverables).')
+    parser.add_argument('--scratch', metavar='FOLDER', type=str, required=False,
+                        help='Fast local folder (local disk, tmpfs) where the feature_extraction, feature_matching, depth_map and depth_map_filter folders and the log files are written. The log files are streamed back to the output folder as each step ends.')
+    parser.add_argument('--moveResults', action='store_true',
+                        help='Move the files listed in the results.json file out of the output folder instead of linking or copying them.')
+    parser.add_argument('--noIngest', action='store_true',
+                        help='Give the input images to camera_init without checking them (--nbOfImages is then required).')
+    parser.add_argument('--history', metavar='SQLITE FILE', type=str, required=False, nargs='?', const=history.DEFAULT_HISTORY_FILE,
+                        help='Store of the past runs used to predict the time of the steps. The run is recorded in it. {} if no file is given.'.format(history.DEFAULT_HISTORY_FILE))
+    parser.add_argument('--timeLimitFactor', type=float, required=False,
+                        help='Each subprocess is killed once it runs for longer than this many times its predicted time (at least {} s). No time limit by default.'.format(watchdog.MIN_TIME_LIMIT))
+    parser.add_argument('--stallTime', metavar='MINUTES', type=float, required=False, default=watchdog.DEFAULT_STALL_TIME,
+                        help='Each subprocess is killed once it has written nothing on stderr and used no CPU time for this long. 0 for no stall detection.')
+    parser.add_argument('--deadline', metavar='MINUTES', type=float, required=False,
+                        help='Time given to the run. The parameters driving the cost of the steps are lowered from the quality chosen until the predicted time fits. Use it with --history: without past runs, the predictions are default rates.')
+    parser.add_argument('--plan', action='store_true',
+                        help='Only print the predicted time of each step and of the whole run, without running anything.')
+    parser.add_argument('--statusServer', metavar='ADDRESS', type=str, required=False,
+                        help='Serve the status.json and metadata.json documents with push updates on this Unix socket path or loopback host:port.')
+
+    args = parser.parse_args()
+    if (args.noIngest and args.nbOfImages is None):
+        parser.error('--nbOfImages is required with --noIngest')
+    if (args.quality is None and args.deadline is None):
+        parser.error('--quality is required without --deadline')
+
+    # Stop the subprocesses on SIGTERM as on an interruption
+    signal.signal(signal.SIGTERM, lambda signal_number, frame: sys.exit(128 + signal_number))
+
+    set_status_server = None
+    if (args.statusServer is not None and not args.plan):
+        set_status_server = status_server.StatusServer(args.statusServer)
+    options = dict(path_to_results_json_file=args.results, path_to_metadata_json_file_directory=args.metadata,
+                   path_to_status_json_file_directory=args.status, nb_of_jobs=args.jobs,
+                   path_to_cache_directory=args.cache, cache_size=args.cacheSize, resume=args.resume,
+                   path_to_feature_store_directory=args.incremental, ingest=not args.noIngest,
+                   move_results=args.moveResults, manifest=args.manifest,
+                   clean_intermediates=args.cleanIntermediates, keep=args.keep, scratch_dir=args.scratch,
+                   history_file=args.history, plan=args.plan, deadline=args.deadline,
+                   time_limit_factor=args.timeLimitFactor, stall_time=args.stallTime, status_server=set_status_server)
+    set_setups, set_directions = process.get_the_setups_and_directions(args.bin, args.input, args.output, args.quality, args.outputType, args.nbOfImages, **options)
+    # The run is driven by the asyncio API
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        return_code = run_until_complete(loop, run_pipeline(set_setups, set_directions, **options))
+    finally:
+        if (set_status_server is not None):
+            set_status_server.close()
+        loop.close()
+    if (not args.plan):
+        sys.exit(return_code)
+    return 0
+
+
+if __name__ == '__main__':
+    run_the_command_line()
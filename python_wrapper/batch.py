@@ -0,0 +1,156 @@
+import argparse
+import json
+import os
+import threading
+import traceback
+
+import history
+import process
+import scheduler
+import status_server
+import watchdog
+
+""" Batch mode: runs several jobs at the same time under one global budget of cores and memory.
+
+A job spec is a dictionary whose keys are the options of process.py:
+    {
+        "bin": ..., "input": ..., "output": ..., "quality": ... (or "deadline": ...), "outputType": ..., "status": ...,
+        "nbOfImages": ..., "results": ..., "metadata": ..., "jobs": ..., "cache": ..., "cacheSize": ..., "resume": ..., "incremental": ..., "noIngest": ..., "moveResults": ..., "manifest": ...,
+        "cleanIntermediates": ..., "keep": ..., "scratch": ..., "history": ..., "deadline": ...,
+        "timeLimitFactor": ..., "stallTime": ..., "name": ...
+    }
+(the keys of the second line are optional). The name of a job is the name of its run on the status server
+(name of its output folder by default).
+The job specs are read either from a .json file containing a list of job specs or from a spool folder
+in which each .json file contains one job spec. The spec files of a spool folder are renamed with a .done
+(or .failed) extension once their job has been run.
+At most max_concurrent_jobs jobs run at once, the others wait for a slot: the steps of the jobs wait for the resources
+they need from the budget, but a job also holds its wrapper thread, its .json writers and its log readers while it waits.
+
+Values
+----------
+- DEFAULT_MAX_CONCURRENT_JOBS: default number of jobs run at once. The steps which are not single-threaded get every core
+of the budget but one, so a few jobs are enough to keep the budget busy
+"""
+
+DEFAULT_MAX_CONCURRENT_JOBS = 4
+
+
+def read_the_job_specs(jobs_location):
+    """ Returns the job specs found at the given location (.json file or spool folder).
+    Format: [(job_spec, path_to_the_spec_file_to_mark_once_run or None), ...]
+    """
+    job_specs = []
+    if (os.path.isdir(jobs_location)):
+        for entry in sorted(os.scandir(jobs_location), key=lambda entry: entry.name):
+            if (entry.is_file() and entry.name.endswith('.json')):
+                with open(entry.path, 'r') as spec_file:
+                    job_specs.append((json.load(spec_file), entry.path))
+    else:
+        with open(jobs_location, 'r') as specs_file:
+            for job_spec in json.load(specs_file):
+                job_specs.append((job_spec, None))
+    return (job_specs)
+
+
+def run_the_job(job_spec, resource_budget, status_server=None):
+    """ Run one job of the batch with the given resource budget (instance of the class ResourceBudget).
+    Its status.json and metadata.json documents are served by the given status server (instance of the class StatusServer) if given.
+    """
+    return (process.process(
+        job_spec["bin"], job_spec["input"], job_spec["output"], job_spec.get("quality"), job_spec["outputType"], job_spec.get("nbOfImages"),
+        path_to_results_json_file=job_spec.get("results"),
+        path_to_metadata_json_file_directory=job_spec.get("metadata"),
+        path_to_status_json_file_directory=job_spec["status"],
+        nb_of_jobs=job_spec.get("jobs"),
+        path_to_cache_directory=job_spec.get("cache"),
+        cache_size=job_spec.get("cacheSize", process.DEFAULT_CACHE_SIZE),
+        resume=job_spec.get("resume", False),
+        path_to_feature_store_directory=job_spec.get("incremental"),
+        resource_budget=resource_budget,
+        ingest=not job_spec.get("noIngest", False),
+        move_results=job_spec.get("moveResults", False),
+        manifest=job_spec.get("manifest", False),
+        clean_intermediates=job_spec.get("cleanIntermediates"),
+        keep=job_spec.get("keep"),
+        scratch_dir=job_spec.get("scratch"),
+        history_file=get_the_history_file(job_spec.get("history")),
+        deadline=job_spec.get("deadline"),
+        time_limit_factor=job_spec.get("timeLimitFactor"),
+        stall_time=job_spec.get("stallTime", watchdog.DEFAULT_STALL_TIME),
+        status_server=status_server,
+        run_name=job_spec.get("name")
+        ))
+
+
+def get_the_history_file(history_option):
+    """ Returns the history file given by the "history" key of a job spec: a path, or true for history.DEFAULT_HISTORY_FILE
+    (None if no history is used).
+    """
+    if (history_option is True):
+        return (history.DEFAULT_HISTORY_FILE)
+    return (history_option or None)
+
+
+def run_the_batch(job_specs, resource_budget, status_server=None, max_concurrent_jobs=DEFAULT_MAX_CONCURRENT_JOBS):
+    """ Run the jobs of the batch concurrently, max_concurrent_jobs at most at once. The nodes of the jobs share the given resource budget.
+    Returns the list of the job specs which failed.
+
+    Arguments
+    ----------
+    - job_specs: list of job specs as returned by read_the_job_specs
+    - resource_budget: an instance of the class ResourceBudget
+    - status_server: an instance of the class StatusServer serving the documents of every job (optional)
+    - max_concurrent_jobs: maximum number of jobs run at once (optional)
+    """
+    failed_jobs = []
+    job_slots = threading.BoundedSemaphore(max(1, max_concurrent_jobs))
+
+    def run_the_job_of_the_batch(job_spec, spec_file):
+        try:
+            with job_slots:
+                job_success = (run_the_job(job_spec, resource_budget, status_server) == 0)
+            if (not job_success):
+                failed_jobs.append(job_spec)
+        except:
+            traceback.print_exc()
+            failed_jobs.append(job_spec)
+            job_success = False
+        if (spec_file is not None):
+            os.rename(spec_file, spec_file + ('.done' if job_success else '.failed'))
+
+    threads = []
+    for job_spec, spec_file in job_specs:
+        thread = threading.Thread(target=run_the_job_of_the_batch, args=(job_spec, spec_file))
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
+    return (failed_jobs)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Launch several alicevision pipelines under a global budget of cores and memory.')
+    parser.add_argument('--jobSpecs', metavar='FILE OR FOLDER', type=str, required=True,
+                        help='.json file containing a list of job specs, or spool folder containing one .json file per job spec.')
+    parser.add_argument('--cores', type=int, required=False,
+                        help='Number of cores shared by the jobs. Number of available cores by default.')
+    parser.add_argument('--memory', type=float, required=False,
+                        help='Memory shared by the jobs in GB. Available memory by default.')
+    parser.add_argument('--maxJobs', type=int, required=False, default=DEFAULT_MAX_CONCURRENT_JOBS,
+                        help='Maximum number of jobs run at once, the others wait for a slot. {} by default.'.format(DEFAULT_MAX_CONCURRENT_JOBS))
+    parser.add_argument('--statusServer', metavar='ADDRESS', type=str, required=False,
+                        help='Serve the status.json and metadata.json documents of every job with push updates on this Unix socket path or loopback host:port.')
+
+    args = parser.parse_args()
+
+    set_status_server = None
+    if (args.statusServer is not None):
+        set_status_server = status_server.StatusServer(args.statusServer)
+    try:
+        failed_jobs = run_the_batch(read_the_job_specs(args.jobSpecs), scheduler.ResourceBudget(args.cores, args.memory), set_status_server,
+                                    args.maxJobs)
+    finally:
+        if (set_status_server is not None):
+            set_status_server.close()
+    print ("{} job(s) failed".format(len(failed_jobs)))
@@ -0,0 +1,327 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+
+import utils
+
+""" Content-addressed cache of the step outputs.
+
+A step is identified by a key computed from:
+    - the name of the step,
+    - the identity of the binary (name and content),
+    - the parameters of the step,
+    - the intern_locations of the step, as paths relative to the root folders of the run (output, scratch and input folders),
+    so that a run in another output folder finds the same keys,
+    - the identity of the ones which are inputs of the step: the key of the step which wrote them for the outputs of the
+    previous steps (the intermediate trees are not read), the hash of their content otherwise (input images, steps resumed).
+When a step is run with a key already in the cache, its output folder is restored (by hardlink where possible)
+instead of being recomputed. The paths to the root folders of the run which stored the entry are replaced by the ones of
+the current run in the restored files which hold paths (RELOCATED_EXTENSIONS: .sfm, .ini and .json files).
+As the outputs of the previous steps are identified by their key, an entry is only valid as long as the entries of the
+steps it was computed from (its upstream keys) are in the cache: a step whose entry is gone is run again, and may give
+other outputs (structure_from_motion is not deterministic). An entry is thus not stored if one of its upstream entries
+is missing, and the entries computed from an entry are removed with it (evicted or found invalid on restore).
+
+Values
+----------
+- UNCACHEABLE_STEPS: steps which can not be cached. camera_connection writes its .bin files in the prepare_dense_scene
+folder instead of its own output folder: its key is chained to the key of the folders it reads
+- RELOCATED_EXTENSIONS: extensions of the restored files in which the paths to the root folders are replaced
+"""
+
+UNCACHEABLE_STEPS = ["camera_connection"]
+
+RELOCATED_EXTENSIONS = ['.sfm', '.ini', '.json']
+
+
+class StepCache():
+    """ An instance of the class StepCache represents a cache of the step outputs stored on disk.
+    The least recently used entries are evicted when the size of the cache exceeds max_size.
+
+    Building arguments
+    ----------
+    - cache_dir: path to the folder where the cache entries are stored
+    - max_size: maximum size of the cache on disk (in bytes)
+    - run_roots: root folders of the run. Format: {root_name: path} (optional)
+
+    Attributes
+    ----------
+    - cache_dir: path to the folder where the cache entries are stored
+    - max_size: maximum size of the cache on disk (in bytes)
+    - run_roots: root folders of the run, absolute. Format: {root_name: path}
+    - files_hashes: hashes of the files already read. Format: {(path, size, modification_time): hash}
+    - folder_keys: keys of the output folders of the steps keyed during the run. Format: {path: key}
+    - folder_entries: keys of the cache entries the content of these folders comes from. Format: {path: [key, ...]}
+    - upstream_keys: keys of the cache entries each key of the run was computed from. Format: {key: [key, ...]}
+    """
+
+    def __init__(self, cache_dir, max_size, run_roots=None):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.run_roots = dict((root_name, os.path.abspath(root)) for root_name, root in (run_roots or {}).items() if root is not None)
+        self.files_hashes = {}
+        self.folder_keys = {}
+        self.folder_entries = {}
+        self.upstream_keys = {}
+        utils.create_folder(self.cache_dir)
+
+    def get_the_key(self, node):
+        """ Returns the key of the given node (instance of the class Node). None if the node can not be cached.
+        The nodes must be keyed in the order they are run, so that the key of each node is known to the next ones.
+        """
+        key = hashlib.sha256()
+        key.update(node.name.encode())
+        key.update(os.path.basename(node.binary_name).encode())
+        key.update(self.hash_the_location(node.binary_name).encode())
+        key.update(json.dumps(node.parameters, sort_keys=True).encode())
+        key.update(json.dumps(node.selected_views).encode())
+        upstream_keys = set()
+        for location_key in sorted(node.intern_locations):
+            location = node.intern_locations[location_key]
+            key.update(location_key.encode())
+            key.update(self.get_the_relative_location(location).encode())
+            if (not is_in_folder(location, node.output_folder)):
+                key.update(self.get_the_location_identity(location).encode())
+                folder = self.get_the_keyed_folder(location)
+                if (folder is not None):
+                    upstream_keys.update(self.folder_entries[folder])
+        node_key = key.hexdigest()
+        upstream_keys = sorted(upstream_keys)
+        self.folder_keys[os.path.abspath(node.output_folder)] = node_key
+        if (node.name in UNCACHEABLE_STEPS):
+            # The step writes in the folders it reads
+            self.folder_entries[os.path.abspath(node.output_folder)] = upstream_keys
+            for location in node.intern_locations.values():
+                folder = self.get_the_keyed_folder(location)
+                if (folder is not None and not is_in_folder(location, node.output_folder)):
+                    self.folder_keys[folder] = hashlib.sha256((self.folder_keys[folder] + node_key).encode()).hexdigest()
+                    self.folder_entries[folder] = upstream_keys
+            return
+        self.folder_entries[os.path.abspath(node.output_folder)] = [node_key]
+        self.upstream_keys[node_key] = upstream_keys
+        return (node_key)
+
+    def get_the_relative_location(self, location):
+        """ Returns the given location relative to the root folder of the run it lies in ("root_name/relative_path"),
+        the absolute location if it lies in none.
+        """
+        location = os.path.abspath(location)
+        for root_name, root in sorted(self.run_roots.items(), key=lambda root_item: -len(root_item[1])):
+            if (is_in_folder(location, root)):
+                return ('{}/{}'.format(root_name, os.path.relpath(location, root)))
+        return (location)
+
+    def get_the_keyed_folder(self, location):
+        """ Returns the output folder keyed during the run in which the given location lies (None if there is none).
+        """
+        location = os.path.abspath(location)
+        for folder in self.folder_keys:
+            if (is_in_folder(location, folder)):
+                return (folder)
+        return
+
+    def get_the_location_identity(self, location):
+        """ Returns the identity of the content of the given input location: the key of the step which wrote it
+        (with the path relative to the output folder of the step), the hash of its content otherwise.
+        """
+        folder = self.get_the_keyed_folder(location)
+        if (folder is not None):
+            return ('{}:{}'.format(self.folder_keys[folder], os.path.relpath(os.path.abspath(location), folder)))
+        return (self.hash_the_location(location))
+
+    def hash_the_location(self, location):
+        """ Returns the hash of the content of the given file or folder.
+        """
+        if (os.path.isfile(location)):
+            return (self.hash_the_file(location))
+        location_hash = hashlib.sha256()
+        for root, dirs, files in os.walk(location):
+            dirs.sort()
+            for file in sorted(files):
+                file_path = os.path.join(root, file)
+                location_hash.update(os.path.relpath(file_path, location).encode())
+                location_hash.update(self.hash_the_file(file_path).encode())
+        return (location_hash.hexdigest())
+
+    def hash_the_file(self, file_path):
+        """ Returns the hash of the content of the given file. Files already hashed and not modified since are not read again.
+        """
+        file_stat = os.stat(file_path)
+        file_id = (file_path, file_stat.st_size, file_stat.st_mtime_ns)
+        if (file_id not in self.files_hashes):
+            self.files_hashes[file_id] = utils.get_the_file_hash(file_path)
+        return (self.files_hashes[file_id])
+
+    def get_the_entry_dir(self, key):
+        """ Returns the path to the folder of the cache entry of the given key.
+        """
+        return (utils.concat_and_normalize_paths(self.cache_dir, key))
+
+    def restore(self, key, output_folder):
+        """ Restore the output folder of a step from the cache. Returns True if the key was found, False otherwise.
+        """
+        entry_dir = self.get_the_entry_dir(key)
+        entry_output_dir = utils.concat_and_normalize_paths(entry_dir, 'output')
+        if (not os.path.isdir(entry_output_dir)):
+            return (False)
+        entry_file = utils.concat_and_normalize_paths(entry_dir, 'entry.json')
+        with open(entry_file, 'r') as file:
+            entry = json.load(file)
+        # The entry was computed from outputs which may not be the ones of this run if an upstream entry is gone
+        if (not all(os.path.isdir(self.get_the_entry_dir(upstream_key)) for upstream_key in entry.get("upstream_keys", []))):
+            self.remove_the_entries([key])
+            return (False)
+        shutil.rmtree(output_folder, ignore_errors=True)
+        link_the_tree(entry_output_dir, output_folder)
+        # The paths to the root folders of the run which stored the entry are replaced by the ones of this run
+        entry_run_roots = entry.get("run_roots", {})
+        relocate_the_tree(output_folder, dict(
+            (entry_run_roots[root_name], root) for root_name, root in self.run_roots.items()
+            if root_name in entry_run_roots and entry_run_roots[root_name] != root
+            ))
+        # Mark the entry as recently used
+        os.utime(entry_file)
+        return (True)
+
+    def store(self, key, step_name, output_folder):
+        """ Store the output folder of a step in the cache and evict the least recently used entries if needed.
+        """
+        entry_dir = self.get_the_entry_dir(key)
+        if (os.path.isdir(entry_dir)):
+            return 0
+        entry_size = get_the_tree_size(output_folder)
+        if (entry_size > self.max_size):
+            return 0
+        upstream_keys = self.upstream_keys.get(key, [])
+        if (not all(os.path.isdir(self.get_the_entry_dir(upstream_key)) for upstream_key in upstream_keys)):
+            # The entry could never be restored
+            return 0
+        temporary_entry_dir = '{}.tmp-{}'.format(entry_dir, os.getpid())
+        link_the_tree(output_folder, utils.concat_and_normalize_paths(temporary_entry_dir, 'output'))
+        with open(utils.concat_and_normalize_paths(temporary_entry_dir, 'entry.json'), 'w') as entry_file:
+            json.dump({"step": step_name, "size": entry_size, "creation_time": time.time(), "run_roots": self.run_roots,
+                       "upstream_keys": upstream_keys}, entry_file)
+        try:
+            os.rename(temporary_entry_dir, entry_dir)
+        except OSError:
+            # Another process stored the same entry meanwhile
+            shutil.rmtree(temporary_entry_dir, ignore_errors=True)
+        self.evict()
+        return 0
+
+    def evict(self):
+        """ Remove the least recently used entries until the size of the cache is under max_size, with the entries computed from them.
+        """
+        entries = []
+        for key, entry, last_use in self.read_the_entries():
+            entries.append((last_use, entry["size"], key))
+        cache_size = sum(entry_size for last_use, entry_size, key in entries)
+        evicted_keys = []
+        for last_use, entry_size, key in sorted(entries):
+            if (cache_size <= self.max_size):
+                break
+            evicted_keys.append(key)
+            cache_size -= entry_size
+        if (len(evicted_keys) > 0):
+            self.remove_the_entries(evicted_keys)
+        return 0
+
+    def remove_the_entries(self, keys):
+        """ Remove the entries of the given keys and, recursively, the entries computed from them.
+        """
+        removed_keys = set()
+        while (len(keys) > 0):
+            for key in keys:
+                shutil.rmtree(self.get_the_entry_dir(key), ignore_errors=True)
+                removed_keys.add(key)
+            keys = [key for key, entry, last_use in self.read_the_entries() if len(removed_keys.intersection(entry.get("upstream_keys", []))) > 0]
+        return 0
+
+    def read_the_entries(self):
+        """ Returns the entries of the cache. Format: [(key, content of entry.json, time of last use), ...]
+        """
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            entry_file = utils.concat_and_normalize_paths(entry.path, 'entry.json')
+            try:
+                with open(entry_file, 'r') as file:
+                    entries.append((entry.name, json.load(file), os.stat(entry_file).st_mtime))
+            except:
+                continue
+        return (entries)
+
+
+def detach_the_tree(folder, ignored_files=()):
+    """ Replace the files of the given folder which are shared with the cache (hardlinks) by private copies
+    so that a step run again in this folder can not overwrite the content of the cache.
+    The ignored files (paths) are left shared: they are read-only inputs of the step.
+    """
+    ignored_files = set(os.path.abspath(file_path) for file_path in ignored_files)
+    for root, dirs, files in os.walk(folder):
+        for file in files:
+            file_path = os.path.join(root, file)
+            if (os.lstat(file_path).st_nlink > 1 and os.path.abspath(file_path) not in ignored_files):
+                temporary_file_path = '{}.tmp-{}'.format(file_path, os.getpid())
+                shutil.copy2(file_path, temporary_file_path)
+                os.replace(temporary_file_path, file_path)
+    return 0
+
+
+def relocate_the_tree(folder, replacements):
+    """ Replace the given paths in the files of the given folder tree which hold paths (see RELOCATED_EXTENSIONS).
+    The files changed are rewritten, so that the files shared with the cache (hardlinks) are left untouched.
+    Format of replacements: {old_root: new_root}
+    """
+    if (len(replacements) == 0):
+        return 0
+    # Longest roots first, in case a root lies in another one
+    byte_replacements = [((old_root + os.sep).encode(), (new_root + os.sep).encode())
+                         for old_root, new_root in sorted(replacements.items(), key=lambda replacement: -len(replacement[0]))]
+    for root, dirs, files in os.walk(folder):
+        for file in files:
+            if (os.path.splitext(file)[1] not in RELOCATED_EXTENSIONS):
+                continue
+            file_path = os.path.join(root, file)
+            with open(file_path, 'rb') as relocated_file:
+                content = relocated_file.read()
+            relocated_content = content
+            for old_root, new_root in byte_replacements:
+                relocated_content = relocated_content.replace(old_root, new_root)
+            if (relocated_content != content):
+                temporary_file_path = '{}.tmp-{}'.format(file_path, os.getpid())
+                with open(temporary_file_path, 'wb') as relocated_file:
+                    relocated_file.write(relocated_content)
+                shutil.copymode(file_path, temporary_file_path)
+                os.replace(temporary_file_path, file_path)
+    return 0
+
+
+def is_in_folder(path, folder):
+    """ Returns True if the given path is the given folder or lies in it.
+    """
+    path = os.path.normpath(path)
+    folder = os.path.normpath(folder)
+    return (path == folder or path.startswith(folder + os.sep))
+
+
+def link_the_tree(source_dir, destination_dir):
+    """ Reproduce the source folder at the destination by hardlinking its files (copying them if hardlinks are not possible).
+    """
+    for root, dirs, files in os.walk(source_dir):
+        destination_root = utils.concat_and_normalize_paths(destination_dir, os.path.relpath(root, source_dir))
+        os.makedirs(destination_root, exist_ok=True)
+        for file in files:
+            utils.link_or_copy_file(os.path.join(root, file), os.path.join(destination_root, file))
+    return 0
+
+
+def get_the_tree_size(folder):
+    """ Returns the size of the files of the given folder (in bytes).
+    """
+    tree_size = 0
+    for root, dirs, files in os.walk(folder):
+        for file in files:
+            tree_size += os.lstat(os.path.join(root, file)).st_size
+    return (tree_size)
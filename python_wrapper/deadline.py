@@ -0,0 +1,175 @@
+import time
+
+import history
+
+""" Deadline-driven choice of the parameters of the steps.
+
+Instead of a quality preset, the run is given a deadline. The parameters of the steps which drive their cost
+(KNOBS) start from the ones of the quality chosen (DEADLINE_QUALITY by default) and are lowered one notch at a time
+until the time of the steps left, predicted by the cost model (see history.py), fits in the time left:
+    - at each round, the notch saving the most time is taken,
+    - the concurrency of DepthMap follows from its downscale factor, as the memory needed by each subprocess
+    limits the number of subprocesses run at once (see scheduler.plan_the_depth_map_groups),
+    - if the lowest notches do not fit either, they are used and the plan is reported as not feasible.
+When a step overruns its prediction, the steps left are planned again from the time left, their predictions
+being scaled by the slowdown measured on the steps already run.
+The steps never run on the host (no run history, see history.py) are predicted from default rates which are not
+calibrated: the plan is then a guess, which is reported (uncalibrated_steps) and printed as a warning.
+When a run is resumed, the step left partially completed keeps the parameters its completed groups were run with:
+its knobs are frozen (see DeadlinePlanner.freeze) and only the knobs of the other steps are lowered.
+
+Values
+----------
+- DEADLINE_QUALITY: quality used when only a deadline is given
+- KNOBS: parameters lowered to fit the deadline. Format: [(step_name, parameter, [values from the best to the quickest]), ...]
+- REPLAN_TOLERANCE: a step overruns when it takes more than REPLAN_TOLERANCE times its prediction
+- MIN_OVERRUN: ... and more than MIN_OVERRUN seconds over its prediction
+"""
+
+DEADLINE_QUALITY = "HIGH"
+
+KNOBS = [
+    ("depth_map", "downscale", [str(1), str(2), str(4), str(8), str(16)]),
+    ("texturing", "downscale", [str(1), str(2), str(4), str(8)]),
+    ("meshing", "maxPoints", [str(5000000), str(2000000), str(500000), str(50000)]),
+    ("feature_extraction", "describerPreset", ["high", "normal", "low"])
+]
+
+REPLAN_TOLERANCE = 1.2
+MIN_OVERRUN = 30
+
+
+class DeadlinePlanner():
+    """ An instance of the class DeadlinePlanner chooses the parameters of the steps left so that the run ends before its deadline.
+
+    Building arguments
+    ----------
+    - cost_model: an instance of the class CostModel
+    - deadline: time before which the run must end (seconds since the epoch)
+
+    Attributes
+    ----------
+    - cost_model: an instance of the class CostModel
+    - deadline: time before which the run must end
+    - preset_values: value of each knob given by the quality preset. Format: {(step_name, parameter): value}
+    - frozen_values: value of the knobs which must not be changed. Format: {(step_name, parameter): value}
+    - plans: reports of the plans made. Format: [{"after": step_name or None, "time_budget": ..., "predicted_time": ..., "feasible": ...,
+    "slowdown": ..., "settings": {"step_name.parameter": value}, "frozen": ["step_name.parameter", ...], "uncalibrated_steps": [step_name, ...], "depth_map_jobs": ...}, ...]
+    - predicted_time: time predicted for the steps run in this run. Format: {step_name: predicted time}
+    - time_taken: time taken by the steps run in this run. Format: {step_name: time taken}
+    """
+
+    def __init__(self, cost_model, deadline):
+        self.cost_model = cost_model
+        self.deadline = deadline
+        self.preset_values = {}
+        self.frozen_values = {}
+        self.plans = []
+        self.predicted_time = {}
+        self.time_taken = {}
+
+    def plan(self, pipeline, after=None):
+        """ Choose the parameters of the given nodes (the steps left) and set them. Returns the prediction of these
+        nodes with the parameters chosen (see CostModel.predict_the_pipeline).
+        """
+        nodes = dict((node.name, node) for node in pipeline)
+        for step_name, parameter, values in KNOBS:
+            if (step_name in nodes and (step_name, parameter) not in self.preset_values):
+                self.preset_values[(step_name, parameter)] = nodes[step_name].parameters[parameter]
+        # Notch of each knob of the steps left, starting from the preset
+        notches = {}
+        for step_name, parameter, values in KNOBS:
+            if (step_name in nodes and (step_name, parameter) in self.frozen_values):
+                set_the_knob(nodes[step_name], parameter, self.frozen_values[(step_name, parameter)])
+            elif (step_name in nodes):
+                preset_value = self.preset_values[(step_name, parameter)]
+                notches[(step_name, parameter)] = values.index(preset_value) if preset_value in values else 0
+                set_the_knob(nodes[step_name], parameter, values[notches[(step_name, parameter)]])
+
+        slowdown = self.get_the_slowdown()
+        time_budget = self.deadline - time.time()
+        predicted_time = self.cost_model.predict_the_pipeline(pipeline)["total"] * slowdown
+        while (predicted_time > time_budget):
+            best_knob = None
+            best_predicted_time = predicted_time
+            for step_name, parameter, values in KNOBS:
+                notch = notches.get((step_name, parameter))
+                if (notch is None or notch + 1 >= len(values)):
+                    continue
+                set_the_knob(nodes[step_name], parameter, values[notch + 1])
+                knob_predicted_time = self.cost_model.predict_the_pipeline(pipeline)["total"] * slowdown
+                set_the_knob(nodes[step_name], parameter, values[notch])
+                if (knob_predicted_time < best_predicted_time):
+                    best_knob = (step_name, parameter, values)
+                    best_predicted_time = knob_predicted_time
+            if (best_knob is None):
+                break
+            step_name, parameter, values = best_knob
+            notches[(step_name, parameter)] += 1
+            set_the_knob(nodes[step_name], parameter, values[notches[(step_name, parameter)]])
+            predicted_time = best_predicted_time
+
+        prediction = self.cost_model.predict_the_pipeline(pipeline)
+        for step_name in prediction["steps"]:
+            prediction["steps"][step_name]["predicted_time"] *= slowdown
+        prediction["total"] *= slowdown
+        plan_report = {
+            "after": after,
+            "time_budget": time_budget,
+            "predicted_time": prediction["total"],
+            "feasible": prediction["total"] <= time_budget,
+            "slowdown": slowdown,
+            "settings": dict(("{}.{}".format(step_name, parameter), nodes[step_name].parameters[parameter])
+                             for step_name, parameter, values in KNOBS if step_name in nodes),
+            "frozen": sorted("{}.{}".format(step_name, parameter) for step_name, parameter in self.frozen_values if step_name in nodes),
+            "uncalibrated_steps": [step_name for step_name in prediction["steps"] if prediction["steps"][step_name]["source"] == "default"]
+        }
+        if (len(self.plans) == 0 and len(plan_report["uncalibrated_steps"]) > 0):
+            print ("WARNING: {} of the {} steps have no past run in the run history (--history): their times are predicted from default rates, "
+                   "not calibrated on this host, so the parameters chosen to meet the deadline are guesses ({})".format(
+                       len(plan_report["uncalibrated_steps"]), len(prediction["steps"]), ", ".join(plan_report["uncalibrated_steps"])))
+        if ("depth_map" in nodes):
+            plan_report["depth_map_jobs"] = history.get_the_nb_of_cores(nodes["depth_map"])
+        self.plans.append(plan_report)
+        if (not plan_report["feasible"]):
+            print ("The deadline can not be met: {:.0f} s predicted for {:.0f} s left".format(prediction["total"], time_budget))
+        return (prediction)
+
+    def freeze(self, node, settings):
+        """ Freeze the knobs of the given node, so that the plans do not change them: their value is taken from the given
+        settings (format: {"step_name.parameter": value}, the settings of a plan) or else from the parameters of the node.
+        """
+        for step_name, parameter, values in KNOBS:
+            if (step_name == node.name):
+                self.frozen_values[(step_name, parameter)] = settings.get("{}.{}".format(step_name, parameter), node.parameters[parameter])
+        return 0
+
+    def node_done(self, node, predicted_time, time_taken):
+        """ Stack the time taken by the given node. Returns True if it overran its prediction, in which case the steps left must be planned again.
+        """
+        self.predicted_time[node.name] = predicted_time
+        self.time_taken[node.name] = time_taken
+        return (time_taken > predicted_time * REPLAN_TOLERANCE and time_taken - predicted_time > MIN_OVERRUN)
+
+    def get_the_slowdown(self):
+        """ Returns the ratio of the time taken by the steps already run to their prediction (1 if none has been run, never less than 1).
+        """
+        total_predicted_time = sum(self.predicted_time.values())
+        if (total_predicted_time <= 0):
+            return (1.0)
+        return (max(1.0, sum(self.time_taken.values()) / total_predicted_time))
+
+    def report(self):
+        """ Returns a report on the plans made. Format: {"deadline": ..., "plans": [...]}
+        """
+        return ({"deadline": self.deadline, "plans": self.plans})
+
+
+def set_the_knob(node, parameter, value):
+    """ Set the value of a parameter of the given node (its parameters are copied first, as they are shared with the presets).
+    """
+    node.parameters = dict(node.parameters)
+    node.parameters[parameter] = value
+    # The plan of the groups depends on the parameters
+    node.groups_plan = None
+    return 0
@@ -1,5 +1,11 @@
+import hashlib
+import os
+
 import utils
 
+# Step folders placed in the scratch folder when one is given (high-churn intermediates)
+SCRATCH_STEPS = ["feature_extraction", "feature_matching", "depth_map", "depth_map_filter"]
+
 
 class Directions():
 
@@ -15,6 +21,7 @@ class Directions():
         + results_dir: results.json file address
         + metadata_dir: direction to the folder where to write the metadata.json file
         + status_dir: direction to the folder where to write the status.json file
+        + scratch_dir: direction to a fast local folder where the SCRATCH_STEPS folders and the log files are written (optional)
 
     Attributes
     ----------
@@ -22,9 +29,14 @@ class Directions():
     - input_dir: direction to the input images folder
     - output_dir: direction where the output is saved
     - log_dir: location of the folder where log files are written for each step
+    - images_dir: direction to the images folder given to camera_init (the input folder, or the folder of the images kept by the ingest stage)
     - results_file: results.json file address (optionnal)
     - metadata_file: path to the metadata.json file (optionnal)
     - status_file: path to the status.json file
+    - scratch_dir: folder of the process in the scratch folder (None if no scratch folder is given). Each output folder gets its own
+    folder in the scratch folder, so that several processes can share it
+    - working_log_dir: location of the folder where the log files are written while the steps run (log_dir, or a folder in scratch_dir
+    from which the log files are streamed back to log_dir)
     """
 
     def __init__(self, bin_dir, input_dir, output_dir, log_dir, **kwargs):
@@ -32,9 +44,25 @@ class Directions():
         self.input_dir = input_dir                      # input folder address
         self.output_dir = output_dir                    # output folder address
         self.log_dir = log_dir                          # log file folder address
+        self.images_dir = input_dir                     # images folder given to camera_init
         self.results_file = kwargs["results_dir"]        # results.json file address
         self.metadata_file = utils.concat_and_normalize_paths(kwargs["metadata_dir"], 'metadata.json')      # metadata.json file address
         self.status_file = utils.concat_and_normalize_paths(kwargs["status_dir"], 'status.json')            # status.json file address
+        self.scratch_dir = None
+        self.working_log_dir = log_dir
+        if (kwargs.get("scratch_dir") is not None):
+            absolute_output_dir = os.path.abspath(output_dir)
+            scratch_folder_name = '{}-{}'.format(os.path.basename(absolute_output_dir), hashlib.sha256(absolute_output_dir.encode()).hexdigest()[:12])
+            self.scratch_dir = utils.concat_and_normalize_paths(kwargs["scratch_dir"], scratch_folder_name)
+            self.working_log_dir = utils.concat_and_normalize_paths(self.scratch_dir, 'log')
+
+    def get_the_step_dir(self, step_name):
+        """ Returns the folder where the output folder of the given step is placed: scratch_dir for the SCRATCH_STEPS
+        if a scratch folder is given, output_dir otherwise.
+        """
+        if (self.scratch_dir is not None and step_name in SCRATCH_STEPS):
+            return (self.scratch_dir)
+        return (self.output_dir)
 
     def get_the_process_directions(self):
         """ Returns the directions used to run each step of the process.
@@ -43,16 +71,16 @@ class Directions():
             "binary_direction": utils.concat_and_normalize_paths(self.bin_dir, 'aliceVision_cameraInit'),
             "output_folder": utils.concat_and_normalize_paths(self.output_dir, 'carame_init'),
             "intern_locations": {
-                "imageFolder": self.input_dir,
+                "imageFolder": self.images_dir,
                 "output": utils.concat_and_normalize_paths(self.output_dir, 'carame_init', 'camera.sfm')
             }
         }
         feature_extraction_direction_set = {
             "binary_direction": utils.concat_and_normalize_paths(self.bin_dir, 'aliceVision_featureExtraction'),
-            "output_folder": utils.concat_and_normalize_paths(self.output_dir, 'feature_extraction'),
+            "output_folder": utils.concat_and_normalize_paths(self.get_the_step_dir('feature_extraction'), 'feature_extraction'),
             "intern_locations": {
                 "input": camera_init_direction_set["intern_locations"]["output"],
-                "output": utils.concat_and_normalize_paths(self.output_dir, 'feature_extraction')
+                "output": utils.concat_and_normalize_paths(self.get_the_step_dir('feature_extraction'), 'feature_extraction')
             }
         }
         image_matching_direction_set = {
@@ -66,12 +94,12 @@ class Directions():
         }
         feature_matching_direction_set = {
             "binary_direction": utils.concat_and_normalize_paths(self.bin_dir, 'aliceVision_featureMatching'),
-            "output_folder": utils.concat_and_normalize_paths(self.output_dir, 'feature_matching'),
+            "output_folder": utils.concat_and_normalize_paths(self.get_the_step_dir('feature_matching'), 'feature_matching'),
             "intern_locations": {
                 "input": camera_init_direction_set["intern_locations"]["output"],
                 "featuresFolders": feature_extraction_direction_set["intern_locations"]["output"],
                 "imagePairsList": image_matching_direction_set["intern_locations"]["output"],
-                "output": utils.concat_and_normalize_paths(self.output_dir, 'feature_matching')
+                "output": utils.concat_and_normalize_paths(self.get_the_step_dir('feature_matching'), 'feature_matching')
             }
         }
         structure_from_motion_direction_set = {
@@ -103,19 +131,19 @@ class Directions():
         }
         depth_map_direction_set = {
             "binary_direction": utils.concat_and_normalize_paths(self.bin_dir, 'aliceVision_depthMapEstimation'),
-            "output_folder": utils.concat_and_normalize_paths(self.output_dir, 'depth_map'),
+            "output_folder": utils.concat_and_normalize_paths(self.get_the_step_dir('depth_map'), 'depth_map'),
             "intern_locations": {
                 "ini": utils.concat_and_normalize_paths(prepare_dense_scene_direction_set["intern_locations"]["output"], 'mvs.ini'),
-                "output": utils.concat_and_normalize_paths(self.output_dir, 'depth_map')
+                "output": utils.concat_and_normalize_paths(self.get_the_step_dir('depth_map'), 'depth_map')
             }
         }
         depth_map_filter_direction_set = {
             "binary_direction": utils.concat_and_normalize_paths(self.bin_dir, 'aliceVision_depthMapFiltering'),
-            "output_folder": utils.concat_and_normalize_paths(self.output_dir, 'depth_map_filter'),
+            "output_folder": utils.concat_and_normalize_paths(self.get_the_step_dir('depth_map_filter'), 'depth_map_filter'),
             "intern_locations": {
                 "ini": utils.concat_and_normalize_paths(prepare_dense_scene_direction_set["intern_locations"]["output"], 'mvs.ini'),
                 "depthMapFolder": depth_map_direction_set["intern_locations"]["output"],
-                "output": utils.concat_and_normalize_paths(self.output_dir, 'depth_map_filter')
+                "output": utils.concat_and_normalize_paths(self.get_the_step_dir('depth_map_filter'), 'depth_map_filter')
             }
         }
         meshing_direction_set = {
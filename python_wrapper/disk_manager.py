@@ -0,0 +1,187 @@
+import concurrent.futures
+import os
+import shutil
+import tarfile
+import threading
+
+import cache
+import utils
+
+""" Eager cleanup of the intermediate outputs of the pipeline.
+
+The output folder of a step is read by the next steps whose intern locations lie in it. Once the last of them
+(its last consumer) has succeeded, the output folder is deleted or compressed into <output folder>.tar.gz.
+The output folders of the steps giving the deliverables and of the steps listed in the keep allowlist are never cleaned.
+The disk usage of the output folder (and of the scratch folder) is measured after each step and the peak is reported.
+
+Values
+----------
+- DEFAULT_KEPT_STEPS: steps whose outputs can be delivered through the results.json file
+- CLEANING_METHODS: possible cleaning methods
+"""
+
+DEFAULT_KEPT_STEPS = ["structure_from_motion", "meshing", "mesh_filtering", "texturing"]
+
+CLEANING_METHODS = ["delete", "compress"]
+
+
+class DiskManager():
+    """ An instance of the class DiskManager cleans the output folders of the steps of a pipeline once they are not read anymore.
+
+    Building arguments
+    ----------
+    - pipeline: list of the nodes of the pipeline (instances of the class Node)
+    - output_dir: path to the output folder of the process
+    - keep: names of the steps whose output folder must be kept besides DEFAULT_KEPT_STEPS (optional)
+    - method: one of CLEANING_METHODS, or None to only measure the disk usage. The compressions are run in a background thread
+    - scratch_dir: path to the scratch folder of the process (optional)
+
+    Attributes
+    ----------
+    - output_dir: path to the output folder of the process
+    - scratch_dir: path to the scratch folder of the process (None if there is none)
+    - output_folders: output folder of each step. Format: {step_name: path}
+    - last_consumers: last step reading the output folder of each step. Format: {step_name: consumer_step_name}
+    - keep: names of the steps whose output folder is kept
+    - method: cleaning method
+    - cleaned_steps: steps whose output folder has been cleaned. Format: {step_name: {"method": ..., "size": ..., "after": consumer_step_name}}
+    - peak_disk_usage: highest disk usage of the output folder measured (in bytes)
+    - peak_step: step after which the peak disk usage was measured
+    - peak_scratch_usage: highest disk usage of the scratch folder measured (in bytes)
+    - executor: thread pool running the compressions
+    - lock: threading.Lock protecting cleaned_steps
+    """
+
+    def __init__(self, pipeline, output_dir, keep=None, method=None, scratch_dir=None):
+        self.output_dir = output_dir
+        self.scratch_dir = scratch_dir
+        self.output_folders = dict((node.name, node.output_folder) for node in pipeline)
+        self.last_consumers = get_the_last_consumers(pipeline)
+        self.keep = set(DEFAULT_KEPT_STEPS) | set(keep or [])
+        self.method = method
+        self.cleaned_steps = {}
+        self.peak_disk_usage = 0
+        self.peak_step = None
+        self.peak_scratch_usage = 0
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self.lock = threading.Lock()
+
+    def mark_the_cleaned_steps(self, previous_status_dict):
+        """ Mark the steps cleaned by an interrupted run (listed as "cleaned" in its status.json file) so that they are not cleaned again.
+        """
+        for step_name in self.output_folders:
+            cleaning_method = previous_status_dict.get(step_name, {}).get("cleaned")
+            if (cleaning_method is not None):
+                self.cleaned_steps[step_name] = {"method": cleaning_method, "size": 0, "after": self.last_consumers.get(step_name), "resumed": True}
+        return 0
+
+    def node_done(self, node, step_success, status_file, status_dict):
+        """ Measure the disk usage after the given node and clean the output folders whose last consumer it is if it succeeded.
+        The cleaned steps are marked in the status.json file (status_dict[step_name]["cleaned"]).
+        """
+        disk_usage = get_the_disk_usage(self.output_dir)
+        if (disk_usage > self.peak_disk_usage):
+            self.peak_disk_usage = disk_usage
+            self.peak_step = node.name
+        if (self.scratch_dir is not None):
+            self.peak_scratch_usage = max(self.peak_scratch_usage, get_the_disk_usage(self.scratch_dir))
+        if (not step_success or self.method is None):
+            return 0
+        for step_name, consumer_name in self.last_consumers.items():
+            if (consumer_name != node.name or step_name in self.keep or step_name in self.cleaned_steps):
+                continue
+            if (self.method == "compress"):
+                self.executor.submit(self.compress_the_folder, step_name, consumer_name)
+            else:
+                self.delete_the_folder(step_name, consumer_name)
+            if (step_name in status_dict):
+                status_dict[step_name]["cleaned"] = self.method
+        utils.update_json_file(status_file, status_dict)
+        return 0
+
+    def delete_the_folder(self, step_name, consumer_name):
+        """ Delete the output folder of the given step.
+        """
+        folder = self.output_folders[step_name]
+        size = cache.get_the_tree_size(folder) if os.path.isdir(folder) else 0
+        shutil.rmtree(folder, ignore_errors=True)
+        print ("{} outputs deleted after {} ({} bytes)".format(step_name, consumer_name, size))
+        with self.lock:
+            self.cleaned_steps[step_name] = {"method": "delete", "size": size, "after": consumer_name}
+        return 0
+
+    def compress_the_folder(self, step_name, consumer_name):
+        """ Compress the output folder of the given step into <folder>.tar.gz and delete it.
+        """
+        folder = self.output_folders[step_name]
+        if (not os.path.isdir(folder)):
+            return 0
+        size = cache.get_the_tree_size(folder)
+        archive = folder.rstrip(os.sep) + '.tar.gz'
+        temporary_archive = archive + '.tmp'
+        with tarfile.open(temporary_archive, 'w:gz') as tar:
+            tar.add(folder, arcname=os.path.basename(folder.rstrip(os.sep)))
+        os.replace(temporary_archive, archive)
+        shutil.rmtree(folder, ignore_errors=True)
+        print ("{} outputs compressed after {} ({} bytes)".format(step_name, consumer_name, size))
+        with self.lock:
+            self.cleaned_steps[step_name] = {"method": "compress", "size": size, "compressed_size": os.path.getsize(archive), "after": consumer_name}
+        return 0
+
+    def close(self):
+        """ Wait for the compressions and returns a report. Format:
+            {
+                "peak_disk_usage": ..., "peak_step": ..., "final_disk_usage": ..., "freed": ...,
+                "cleaned_steps": {step_name: {"method": ..., "size": ..., "after": ...}},
+                "peak_scratch_usage": ..., "final_scratch_usage": ... (with a scratch folder only)
+            }
+        """
+        self.executor.shutdown(wait=True)
+        disk_report = {
+            "peak_disk_usage": self.peak_disk_usage,
+            "peak_step": self.peak_step,
+            "final_disk_usage": get_the_disk_usage(self.output_dir),
+            "freed": sum(cleaned["size"] for cleaned in self.cleaned_steps.values()),
+            "cleaned_steps": self.cleaned_steps
+        }
+        if (self.scratch_dir is not None):
+            disk_report["peak_scratch_usage"] = self.peak_scratch_usage
+            disk_report["final_scratch_usage"] = get_the_disk_usage(self.scratch_dir)
+        return (disk_report)
+
+
+def get_the_last_consumers(pipeline):
+    """ Returns the last step reading the output folder of each step of the pipeline (a step reads a folder if one of
+    its intern locations lies in it). Format: {step_name: consumer_step_name}. The steps whose outputs are not read are left out.
+    """
+    last_consumers = {}
+    for producer in pipeline:
+        for consumer in pipeline:
+            if (consumer is producer or cache.is_in_folder(consumer.output_folder, producer.output_folder)):
+                continue
+            if (any(cache.is_in_folder(location, producer.output_folder) for location in consumer.intern_locations.values())):
+                last_consumers[producer.name] = consumer.name
+    return (last_consumers)
+
+
+def get_the_disk_usage(folder):
+    """ Returns the disk space used by the files of the given folder tree (in bytes). Hardlinked files are counted once.
+    """
+    disk_usage = 0
+    seen_inodes = set()
+    folders_to_visit = [folder]
+    while (len(folders_to_visit) > 0):
+        try:
+            with os.scandir(folders_to_visit.pop()) as entries:
+                for entry in entries:
+                    if (entry.is_dir(follow_symlinks=False)):
+                        folders_to_visit.append(entry.path)
+                        continue
+                    stat = entry.stat(follow_symlinks=False)
+                    if ((stat.st_dev, stat.st_ino) in seen_inodes):
+                        continue
+                    seen_inodes.add((stat.st_dev, stat.st_ino))
+                    disk_usage += stat.st_blocks * 512
+        except OSError:
+            continue
+    return (disk_usage)
@@ -0,0 +1,341 @@
+import json
+import math
+import os
+import platform
+import sqlite3
+import time
+
+import scheduler
+import utils
+
+""" Store of the past runs and runtime cost model of the steps.
+
+Every run given a store (no store by default, see process.py) appends its step timings, its setups and facts on the host
+to a SQLite file. The cost model predicts the time each step of a new run will take from the past runs of the same step:
+    - the time of a step times the number of cores it used (1 for the single-threaded steps), divided by the cost
+    factor of its parameters, is fitted as a * nb_of_views^b (least squares in log space, b = 1 with less than two
+    distinct numbers of views),
+    - the runs used are the ones with the same cost parameters (COST_PARAMETERS), or any run of the step if there is none,
+    - DEFAULT_STEP_RATES are used when the step has never been run.
+The steps restored from the cache, resumed or failed are not used by the model.
+
+The cost factor of a step scales its time with its cost parameters, relative to the MEDIUM parameters: the number of
+pixels for the downscale factors, the number of points for maxPoints and DESCRIBER_PRESET_FACTORS for describerPreset.
+
+Values
+----------
+- DEFAULT_HISTORY_FILE: default location of the SQLite file
+- COST_PARAMETERS: parameters of each step which change its cost
+- DEFAULT_STEP_RATES: rough time per view of each step on one core with the MEDIUM parameters (in seconds)
+- DESCRIBER_PRESET_FACTORS: cost factor of each describerPreset of feature_extraction
+"""
+
+DEFAULT_HISTORY_FILE = os.path.join(os.path.expanduser('~'), '.pluggable_meshroom', 'history.sqlite')
+
+COST_PARAMETERS = {
+    "feature_extraction": ["describerPreset"],
+    "depth_map": ["downscale"],
+    "meshing": ["maxPoints"],
+    "texturing": ["downscale"]
+}
+
+DEFAULT_STEP_RATES = {
+    "camera_init": 0.01,
+    "feature_extraction": 4,
+    "image_matching": 0.05,
+    "feature_matching": 2,
+    "structure_from_motion": 2,
+    "prepare_dense_scene": 0.5,
+    "camera_connection": 0.05,
+    "depth_map": 30,
+    "depth_map_filter": 4,
+    "meshing": 3,
+    "mesh_filtering": 0.2,
+    "texturing": 3
+}
+
+DESCRIBER_PRESET_FACTORS = {
+    "low": 0.3,
+    "medium": 0.6,
+    "normal": 1,
+    "high": 2,
+    "ultra": 5
+}
+
+# Cost parameters of the MEDIUM parameters, for which the cost factor is 1
+REFERENCE_DOWNSCALE = 2
+REFERENCE_MAX_POINTS = 5000000
+
+# Bounds of the exponent fitted
+MIN_EXPONENT = 0.5
+MAX_EXPONENT = 2.5
+
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS runs (
+        run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        start_time REAL, quality TEXT, output_type TEXT, nb_of_images INTEGER,
+        host TEXT, cpu_model TEXT, nb_of_cores INTEGER, memory REAL,
+        time_taken REAL, success INTEGER
+    )""",
+    """CREATE TABLE IF NOT EXISTS steps (
+        run_id INTEGER, step_name TEXT, cost_key TEXT, parameters TEXT,
+        nb_of_views INTEGER, nb_of_cores INTEGER, time_taken REAL, success INTEGER, reused INTEGER
+    )""",
+    """CREATE INDEX IF NOT EXISTS steps_by_name ON steps (step_name, cost_key)"""
+]
+
+
+class RunHistory():
+    """ An instance of the class RunHistory represents the SQLite store of the past runs.
+
+    Building arguments
+    ----------
+    - history_file: path to the SQLite file (created if it does not exist)
+
+    Attributes
+    ----------
+    - history_file: path to the SQLite file
+    """
+
+    def __init__(self, history_file=DEFAULT_HISTORY_FILE):
+        self.history_file = history_file
+        os.makedirs(os.path.dirname(os.path.abspath(history_file)), exist_ok=True)
+        connection = self.connect()
+        try:
+            with connection:
+                for statement in SCHEMA:
+                    connection.execute(statement)
+        finally:
+            connection.close()
+
+    def connect(self):
+        """ Returns a new connection to the SQLite file (one per operation, so that several threads and jobs can use the store).
+        """
+        return (sqlite3.connect(self.history_file, timeout=30))
+
+    def record_the_run(self, setups, pipeline, metadata_dict, starting_time):
+        """ Append the run to the store.
+
+        Arguments
+        ----------
+        - setups: an instance of the class Setups
+        - pipeline: the list of the nodes run (instances of the class Node)
+        - metadata_dict: python dictionary representing the metadata.json file of the run
+        - starting_time: time when the run started
+        """
+        step_reports = metadata_dict["step_by_step_report"]
+        success = all(step_reports.get(node.name, {}).get("report", {}).get("success", False) for node in pipeline)
+        host_facts = get_the_host_facts()
+        connection = self.connect()
+        try:
+            with connection:
+                cursor = connection.execute(
+                    "INSERT INTO runs (start_time, quality, output_type, nb_of_images, host, cpu_model, nb_of_cores, memory, time_taken, success) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (starting_time, setups.quality, setups.output_type, setups.nb_of_images, host_facts["host"], host_facts["cpu_model"],
+                     host_facts["nb_of_cores"], host_facts["memory"], metadata_dict["global_report"].get("time_taken"), int(success))
+                    )
+                run_id = cursor.lastrowid
+                for node in pipeline:
+                    step_report = step_reports.get(node.name)
+                    if (step_report is None or "time_taken" not in step_report):
+                        continue
+                    report = step_report.get("report", {})
+                    reused = step_report.get("resumed", False) or report.get("cache_report", {}).get("hit", False)
+                    connection.execute(
+                        "INSERT INTO steps (run_id, step_name, cost_key, parameters, nb_of_views, nb_of_cores, time_taken, success, reused) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (run_id, node.name, get_the_cost_key(node.name, node.parameters), json.dumps(node.parameters),
+                         get_the_nb_of_views(node), get_the_nb_of_cores(node), step_report["time_taken"], int(report.get("success", False)), int(reused))
+                        )
+        finally:
+            connection.close()
+        return (run_id)
+
+    def get_the_step_runs(self, step_name, cost_key=None):
+        """ Returns the usable past runs of the given step (with the given cost key if given).
+        Format: [(nb_of_views, nb_of_cores, time_taken, parameters as a JSON string), ...]
+        """
+        query = "SELECT nb_of_views, nb_of_cores, time_taken, parameters FROM steps WHERE step_name = ? AND success = 1 AND reused = 0 AND nb_of_views > 0"
+        arguments = [step_name]
+        if (cost_key is not None):
+            query += " AND cost_key = ?"
+            arguments.append(cost_key)
+        connection = self.connect()
+        try:
+            return (connection.execute(query, arguments).fetchall())
+        finally:
+            connection.close()
+
+
+class CostModel():
+    """ An instance of the class CostModel predicts the time taken by the steps of a run from the past runs.
+
+    Building arguments
+    ----------
+    - run_history: an instance of the class RunHistory (None to use the default rates only)
+
+    Attributes
+    ----------
+    - run_history: an instance of the class RunHistory
+    - fits: fits already computed. Format: {(step_name, cost_key): (a, b, source)}
+    """
+
+    def __init__(self, run_history=None):
+        self.run_history = run_history
+        self.fits = {}
+
+    def get_the_fit(self, step_name, cost_key):
+        """ Returns the fit of the given step: (a, b, source) with time x cores / cost factor = a * nb_of_views^b.
+        The source is "history" (runs with the same cost key), "history_of_the_step" (any run of the step) or "default".
+        """
+        if ((step_name, cost_key) in self.fits):
+            return (self.fits[(step_name, cost_key)])
+        fit = None
+        if (self.run_history is not None):
+            for runs_key, source in ((cost_key, "history"), (None, "history_of_the_step")):
+                runs = self.run_history.get_the_step_runs(step_name, runs_key)
+                if (len(runs) > 0):
+                    fit = fit_the_power_law([(nb_of_views, time_taken * get_the_used_cores(step_name, nb_of_cores)
+                                              / get_the_cost_factor(step_name, json.loads(run_parameters)))
+                                             for nb_of_views, nb_of_cores, time_taken, run_parameters in runs]) + (source,)
+                    break
+        if (fit is None):
+            fit = (DEFAULT_STEP_RATES.get(step_name, 1), 1.0, "default")
+        self.fits[(step_name, cost_key)] = fit
+        return (fit)
+
+    def predict_the_step(self, step_name, step_parameters, nb_of_views, nb_of_cores):
+        """ Returns the predicted time of the given step (in seconds) and the source of the prediction.
+        """
+        a, b, source = self.get_the_fit(step_name, get_the_cost_key(step_name, step_parameters))
+        cost_factor = get_the_cost_factor(step_name, step_parameters)
+        return (a * max(1, nb_of_views)**b * cost_factor / get_the_used_cores(step_name, nb_of_cores), source)
+
+    def predict_the_pipeline(self, pipeline):
+        """ Returns the predicted time of each node of the given pipeline (with the number of cores planned for each node). Format:
+            {
+                "steps": {step_name: {"predicted_time": ..., "source": ...}},
+                "total": ...
+            }
+        """
+        prediction = {"steps": {}, "total": 0}
+        for node in pipeline:
+            predicted_time, source = self.predict_the_step(node.name, node.parameters, get_the_nb_of_views(node), get_the_nb_of_cores(node))
+            prediction["steps"][node.name] = {"predicted_time": predicted_time, "source": source}
+            prediction["total"] += predicted_time
+        return (prediction)
+
+
+def get_the_eta(prediction, pipeline, current_node_iter, step_starting_time, step_remaining_time=None):
+    """ Returns the estimated remaining time of the run and its progress (in percent of the predicted time of the run).
+    Format: {"remaining_time": ..., "expected_end_time": ..., "progress": ...}
+
+    Arguments
+    ----------
+    - prediction: prediction of the pipeline (see CostModel.predict_the_pipeline)
+    - pipeline: the list of the nodes of the run
+    - current_node_iter: index of the node running (len(pipeline) once every node is done)
+    - step_starting_time: time when the node running started
+    - step_remaining_time: remaining time of the node running measured from its progress (see progress.py, optional)
+    """
+    remaining_time = 0
+    for node in pipeline[current_node_iter:]:
+        remaining_time += prediction["steps"][node.name]["predicted_time"]
+    if (current_node_iter < len(pipeline)):
+        current_step_prediction = prediction["steps"][pipeline[current_node_iter].name]["predicted_time"]
+        if (step_remaining_time is not None):
+            remaining_time += step_remaining_time - current_step_prediction
+        else:
+            # The running step may already have overrun its prediction
+            remaining_time -= min(current_step_prediction, time.time() - step_starting_time)
+    total_time = sum(prediction["steps"][node.name]["predicted_time"] for node in pipeline)
+    run_progress = 100 * max(0, 1 - remaining_time / total_time) if total_time > 0 else 0
+    if (current_node_iter >= len(pipeline)):
+        run_progress = 100
+    return ({"remaining_time": remaining_time, "expected_end_time": time.time() + remaining_time, "progress": run_progress})
+
+
+def fit_the_power_law(points):
+    """ Returns (a, b) such that y = a * x^b fits the given points [(x, y), ...] (least squares in log space).
+    b is 1 if there are less than two distinct x.
+    """
+    log_points = [(math.log(x), math.log(max(y, 1e-6))) for x, y in points]
+    distinct_x = set(log_x for log_x, log_y in log_points)
+    if (len(distinct_x) < 2):
+        return (sum(y / x for x, y in points) / len(points), 1.0)
+    mean_x = sum(log_x for log_x, log_y in log_points) / len(log_points)
+    mean_y = sum(log_y for log_x, log_y in log_points) / len(log_points)
+    covariance = sum((log_x - mean_x) * (log_y - mean_y) for log_x, log_y in log_points)
+    variance = sum((log_x - mean_x)**2 for log_x, log_y in log_points)
+    b = min(MAX_EXPONENT, max(MIN_EXPONENT, covariance / variance))
+    return (math.exp(mean_y - b * mean_x), b)
+
+
+def get_the_cost_key(step_name, step_parameters):
+    """ Returns the values of the cost parameters of the step as a JSON list ("[]" if the step has none).
+    """
+    return (json.dumps([step_parameters.get(parameter) for parameter in COST_PARAMETERS.get(step_name, [])]))
+
+
+def get_the_cost_factor(step_name, step_parameters):
+    """ Returns the cost factor of the given parameters of the step (1 with the MEDIUM parameters).
+    """
+    cost_factor = 1.0
+    if (step_name in ("depth_map", "texturing") and "downscale" in step_parameters):
+        cost_factor *= (REFERENCE_DOWNSCALE / float(step_parameters["downscale"]))**2
+    if (step_name == "meshing" and "maxPoints" in step_parameters):
+        cost_factor *= float(step_parameters["maxPoints"]) / REFERENCE_MAX_POINTS
+    if (step_name == "feature_extraction" and "describerPreset" in step_parameters):
+        cost_factor *= DESCRIBER_PRESET_FACTORS.get(step_parameters["describerPreset"], 1)
+    return (cost_factor)
+
+
+def get_the_nb_of_cores(node):
+    """ Returns the number of concurrent subprocesses of the given node: the number planned for the steps whose
+    groups are planned from the memory (see scheduler.plan_the_depth_map_groups), the number of jobs of the node otherwise.
+    """
+    if (node.groups_plan is not None):
+        return (node.groups_plan["nb_of_jobs"])
+    if (node.parameters.get("adaptiveGroupSize", False)):
+        available_memory = node.available_memory
+        if (available_memory is None):
+            available_memory = utils.get_the_available_memory()
+        return (scheduler.plan_the_depth_map_groups(get_the_nb_of_views(node), float(node.parameters["downscale"]), node.nb_of_jobs, available_memory)["nb_of_jobs"])
+    return (node.nb_of_jobs)
+
+
+def get_the_used_cores(step_name, nb_of_cores):
+    """ Returns the number of cores used by the given step.
+    """
+    if (step_name in scheduler.SINGLE_THREADED_STEPS):
+        return (1)
+    return (max(1, nb_of_cores))
+
+
+def get_the_nb_of_views(node):
+    """ Returns the number of views processed by the given node (the selected views only if they are given).
+    """
+    if (node.selected_views is not None):
+        return (len(node.selected_views))
+    return (node.nb_of_images)
+
+
+def get_the_host_facts():
+    """ Returns facts on the host. Format: {"host": ..., "cpu_model": ..., "nb_of_cores": ..., "memory": (in GB)}
+    """
+    cpu_model = None
+    try:
+        with open('/proc/cpuinfo', 'r') as cpuinfo:
+            for line in cpuinfo:
+                if (line.startswith('model name')):
+                    cpu_model = line.split(':', 1)[1].strip()
+                    break
+    except:
+        pass
+    return ({
+        "host": platform.node(),
+        "cpu_model": cpu_model,
+        "nb_of_cores": utils.get_the_number_of_cores(),
+        "memory": utils.get_the_available_memory()
+    })
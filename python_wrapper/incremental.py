@@ -0,0 +1,314 @@
+import fcntl
+import hashlib
+import json
+import os
+
+import utils
+
+""" Incremental reconstruction: reuse of the features and matches computed by previous runs.
+
+The feature store keeps:
+    - the .feat and .desc files of every image ever processed, keyed by the hash of the image content,
+    - the matches of every pair of images ever matched, keyed by the hashes of the two images.
+The features are kept apart for each set of feature_extraction parameters (describerPreset changes with the quality,
+the number of images and the deadline), and the matches for each set of feature_extraction and feature_matching parameters,
+so that a run never mixes features or matches computed with other parameters.
+When images are added to an existing dataset, only the new views go through feature_extraction
+and only the pairs involving a new view, or whose matches are not in the store, go through feature_matching.
+The matches file of a set of parameters is locked while it is read and appended to, so that concurrent jobs can share a store.
+"""
+
+# Name of the image pairs list given to feature_matching in incremental mode (written in the feature_matching output folder)
+INCREMENTAL_IMAGE_PAIRS_LIST = 'incremental_image_matches.txt'
+
+# Prefix of the matches file written in the feature_matching output folder with the matches reused from the store
+REUSED_MATCHES_PREFIX = 'reused'
+
+# Parameters which do not change the features nor the matches computed
+IGNORED_PARAMETERS = ["verboseLevel", "minGroupSize"]
+
+
+class FeatureStore():
+    """ An instance of the class FeatureStore represents a store of features and matches shared between runs.
+
+    Building arguments
+    ----------
+    - store_dir: path to the folder where the features and matches are stored
+
+    Attributes
+    ----------
+    - store_dir: path to the folder where the features and matches are stored
+    - features_dir: path to the folder where the .feat and .desc files computed with the feature_extraction parameters
+    of the run are stored (None until feature_extraction is prepared)
+    - matches_file: path to the file where the matches computed with the parameters of the run are stored
+    (aliceVision .txt format, with image hashes instead of view ids, None until feature_matching is prepared)
+    - features_key: key of the feature_extraction parameters of the run (see get_the_parameters_key)
+    - views: the views of the current run. Format: [(view_id, image_hash), ...] sorted as aliceVision does
+    - new_view_ids: view ids of the images which are not in the store
+    """
+
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        self.features_dir = None
+        self.matches_file = None
+        self.features_key = None
+        self.views = None
+        self.new_view_ids = None
+        utils.create_folder(self.store_dir)
+
+    def prepare_the_node(self, node):
+        """ Prepare the given node (instance of the class Node) to reuse the content of the store.
+        Only the feature_extraction and feature_matching steps are concerned.
+        """
+        if (node.name == "feature_extraction"):
+            self.prepare_the_feature_extraction(node)
+        elif (node.name == "feature_matching"):
+            self.prepare_the_feature_matching(node)
+        return 0
+
+    def update_the_store(self, node):
+        """ Stack the features or the matches computed by the given node (instance of the class Node) in the store.
+        """
+        if (node.name == "feature_extraction"):
+            self.store_the_features(node)
+        elif (node.name == "feature_matching"):
+            self.store_the_matches(node)
+        return 0
+
+    def read_the_views(self, sfm_file_direction):
+        """ Read the views of the current run from the camera_init output and hash their images.
+        """
+        view_paths = utils.get_the_view_paths(sfm_file_direction)
+        self.views = [(view_id, utils.get_the_file_hash(view_paths[view_id])) for view_id in utils.get_the_view_ids(sfm_file_direction)]
+        return 0
+
+    def get_the_feature_file(self, image_hash, describer_type, extension):
+        """ Returns the path to the given feature file in the store.
+        """
+        return (utils.concat_and_normalize_paths(self.features_dir, '{}.{}{}'.format(image_hash, describer_type, extension)))
+
+    def prepare_the_feature_extraction(self, node):
+        """ Link the features of the images already in the store in the feature_extraction output folder
+        (listed in node.store_linked_files) and restrict the step to the new views.
+        """
+        self.read_the_views(node.intern_locations["input"])
+        self.features_key = get_the_parameters_key(node.parameters)
+        self.features_dir = utils.concat_and_normalize_paths(self.store_dir, 'features', self.features_key)
+        utils.create_folder(os.path.dirname(self.features_dir))
+        utils.create_folder(self.features_dir)
+        describer_types = node.parameters["describerTypes"].split(',')
+        utils.create_folder(node.output_folder)
+        self.new_view_ids = []
+        selected_views = []
+        for view_index, (view_id, image_hash) in enumerate(self.views):
+            stored_files = [
+                (self.get_the_feature_file(image_hash, describer_type, extension), '{}.{}{}'.format(view_id, describer_type, extension))
+                for describer_type in describer_types for extension in ('.feat', '.desc')
+                ]
+            if (all(os.path.isfile(stored_file) for stored_file, file_name in stored_files)):
+                for stored_file, file_name in stored_files:
+                    linked_file = utils.concat_and_normalize_paths(node.intern_locations["output"], file_name)
+                    utils.link_or_copy_file(stored_file, linked_file)
+                    node.store_linked_files.add(linked_file)
+            else:
+                self.new_view_ids.append(view_id)
+                selected_views.append(view_index)
+        node.selected_views = selected_views
+        node.incremental_report = {
+            "new_views": len(self.new_view_ids),
+            "reused_views": len(self.views) - len(self.new_view_ids)
+            }
+        return 0
+
+    def store_the_features(self, node):
+        """ Stack the features of the new views in the store.
+        """
+        describer_types = node.parameters["describerTypes"].split(',')
+        for view_id, image_hash in self.views:
+            for describer_type in describer_types:
+                for extension in ('.feat', '.desc'):
+                    computed_file = utils.concat_and_normalize_paths(node.intern_locations["output"], '{}.{}{}'.format(view_id, describer_type, extension))
+                    stored_file = self.get_the_feature_file(image_hash, describer_type, extension)
+                    if (os.path.isfile(computed_file) and not os.path.isfile(stored_file)):
+                        temporary_file = '{}.tmp-{}'.format(stored_file, os.getpid())
+                        utils.link_or_copy_file(computed_file, temporary_file)
+                        os.replace(temporary_file, stored_file)
+        return 0
+
+    def prepare_the_feature_matching(self, node):
+        """ Restrict the image pairs list given to feature_matching to the pairs involving a new view or whose matches
+        are not in the store (pairs of previous views not matched by the previous runs, e.g. a new pairing). Nothing is done if the new views are unknown (feature_extraction not prepared by the store).
+        """
+        if (self.new_view_ids is None):
+            return 0
+        # The matches depend on the features they were computed from
+        matches_key = get_the_parameters_key(dict(node.parameters, features_key=self.features_key))
+        utils.create_folder(utils.concat_and_normalize_paths(self.store_dir, 'matches'))
+        self.matches_file = utils.concat_and_normalize_paths(self.store_dir, 'matches', '{}.txt'.format(matches_key))
+        new_view_ids = set(self.new_view_ids)
+        hash_by_view_id = dict(self.views)
+        with open(self.matches_file + '.lock', 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_SH)
+            try:
+                stored_pairs = self.read_the_stored_pairs()
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+        utils.create_folder(node.output_folder)
+        incremental_image_pairs_list = utils.concat_and_normalize_paths(node.output_folder, INCREMENTAL_IMAGE_PAIRS_LIST)
+        nb_of_new_pairs = 0
+        with open(node.intern_locations["imagePairsList"], 'r') as image_pairs_list:
+            with open(incremental_image_pairs_list, 'w') as incremental_pairs_list:
+                for line in image_pairs_list:
+                    view_ids = line.split()
+                    if (len(view_ids) < 2):
+                        continue
+                    if (view_ids[0] in new_view_ids):
+                        paired_view_ids = view_ids[1:]
+                    else:
+                        paired_view_ids = [view_id for view_id in view_ids[1:] if view_id in new_view_ids
+                                           or frozenset((hash_by_view_id.get(view_ids[0]), hash_by_view_id.get(view_id))) not in stored_pairs]
+                    if (len(paired_view_ids) > 0):
+                        incremental_pairs_list.write(' '.join([view_ids[0]] + paired_view_ids) + '\n')
+                        nb_of_new_pairs += len(paired_view_ids)
+        node.intern_locations = dict(node.intern_locations, imagePairsList=incremental_image_pairs_list)
+        # Views without new pairs must not be run
+        if (nb_of_new_pairs == 0):
+            node.selected_views = []
+        node.incremental_report = {"new_pairs": nb_of_new_pairs}
+        return 0
+
+    def store_the_matches(self, node):
+        """ Stack the matches computed by feature_matching in the store and write the matches of the pairs
+        of previous views found in the store in the feature_matching output folder.
+        """
+        if (self.new_view_ids is None):
+            return 0
+        hash_by_view_id = dict(self.views)
+        view_id_by_hash = dict((image_hash, view_id) for view_id, image_hash in self.views)
+        new_view_ids = set(self.new_view_ids)
+        matches_files = get_the_matches_files(node.output_folder)
+
+        with open(self.matches_file + '.lock', 'a') as lock_file:
+            # Other jobs sharing the store wait until the matches of this one are stacked and read
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                nb_of_reused_pairs = self.stack_and_reuse_the_matches(
+                    matches_files, node.output_folder, hash_by_view_id, view_id_by_hash, new_view_ids)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+        node.incremental_report["reused_pairs"] = nb_of_reused_pairs
+        return 0
+
+    def read_the_stored_pairs(self):
+        """ Returns the pairs of images whose matches are in the store. Format: {frozenset((image_hash_i, image_hash_j)), ...}
+        The store must be locked.
+        """
+        stored_pairs = set()
+        if (os.path.isfile(self.matches_file)):
+            for image_hash_i, image_hash_j, descriptors_matches in read_the_matches(self.matches_file):
+                stored_pairs.add(frozenset((image_hash_i, image_hash_j)))
+        return (stored_pairs)
+
+    def stack_and_reuse_the_matches(self, matches_files, output_folder, hash_by_view_id, view_id_by_hash, new_view_ids):
+        """ Stack the new matches in the store and write the matches of the pairs of previous views found in the store
+        in the given feature_matching output folder. Returns the number of pairs reused. The store must be locked.
+        """
+        stored_pairs = self.read_the_stored_pairs()
+
+        # Stack the new matches in the store
+        computed_pairs = set()
+        with open(self.matches_file, 'a') as store:
+            for matches_file in matches_files:
+                for view_id_i, view_id_j, descriptors_matches in read_the_matches(matches_file):
+                    image_hashes = (hash_by_view_id.get(view_id_i), hash_by_view_id.get(view_id_j))
+                    if (None in image_hashes):
+                        continue
+                    computed_pairs.add(frozenset(image_hashes))
+                    if (frozenset(image_hashes) in stored_pairs):
+                        continue
+                    write_the_matches(store, image_hashes[0], image_hashes[1], descriptors_matches)
+                    stored_pairs.add(frozenset(image_hashes))
+
+        # Write the matches reused from the store
+        nb_of_reused_pairs = 0
+        if (len(matches_files) > 0):
+            reused_matches_file = get_the_reused_matches_file(matches_files[0])
+        else:
+            reused_matches_file = utils.concat_and_normalize_paths(output_folder, REUSED_MATCHES_PREFIX + '.matches.txt')
+        with open(reused_matches_file, 'w') as reused_matches:
+            for image_hash_i, image_hash_j, descriptors_matches in read_the_matches(self.matches_file):
+                view_id_i = view_id_by_hash.get(image_hash_i)
+                view_id_j = view_id_by_hash.get(image_hash_j)
+                if (view_id_i is None or view_id_j is None or view_id_i in new_view_ids or view_id_j in new_view_ids
+                        or frozenset((image_hash_i, image_hash_j)) in computed_pairs):
+                    continue
+                if (int(view_id_i) > int(view_id_j)):
+                    view_id_i, view_id_j = view_id_j, view_id_i
+                    descriptors_matches = [
+                        (describer_type, [' '.join(reversed(match.split())) + '\n' for match in matches])
+                        for describer_type, matches in descriptors_matches
+                        ]
+                write_the_matches(reused_matches, view_id_i, view_id_j, descriptors_matches)
+                nb_of_reused_pairs += 1
+        return (nb_of_reused_pairs)
+
+
+def get_the_parameters_key(step_parameters):
+    """ Returns a key of the given parameters, leaving out the ones which do not change the outputs (IGNORED_PARAMETERS).
+    """
+    key_parameters = dict((name, value) for name, value in step_parameters.items() if name not in IGNORED_PARAMETERS)
+    return (hashlib.sha256(json.dumps(key_parameters, sort_keys=True).encode()).hexdigest()[:16])
+
+
+def get_the_matches_files(folder):
+    """ Returns the matches files computed by feature_matching in the given folder (the reused matches are ignored).
+    """
+    matches_files = []
+    for entry in sorted(os.scandir(folder), key=lambda entry: entry.name):
+        if (entry.is_file() and 'matches' in entry.name and entry.name.endswith('.txt')
+                and entry.name != INCREMENTAL_IMAGE_PAIRS_LIST and not entry.name.startswith(REUSED_MATCHES_PREFIX + '.')):
+            matches_files.append(entry.path)
+    return (matches_files)
+
+
+def get_the_reused_matches_file(matches_file):
+    """ Returns the path to the file of the reused matches, named like the matches files computed by feature_matching
+    (e.g. 0.matches.txt -> reused.matches.txt) so that the next steps read it too.
+    """
+    folder, file_name = os.path.split(matches_file)
+    return (utils.concat_and_normalize_paths(folder, REUSED_MATCHES_PREFIX + file_name[file_name.index('.'):]))
+
+
+def read_the_matches(matches_file):
+    """ Read the pairs of a matches file (aliceVision .txt format) one by one. Format of the file:
+        I J
+        number_of_describer_types
+        describer_type number_of_matches
+        feature_index_in_I feature_index_in_J
+        ...
+
+    Returns
+    ----------
+    A generator of (I, J, [(describer_type, [match_line, ...]), ...])
+    """
+    with open(matches_file, 'r') as file:
+        for pair_line in file:
+            pair = pair_line.split()
+            if (len(pair) != 2):
+                continue
+            descriptors_matches = []
+            for descriptor_iter in range(int(file.readline())):
+                describer_type, nb_of_matches = file.readline().split()
+                matches = [file.readline() for match_iter in range(int(nb_of_matches))]
+                descriptors_matches.append((describer_type, matches))
+            yield (pair[0], pair[1], descriptors_matches)
+
+
+def write_the_matches(file, view_i, view_j, descriptors_matches):
+    """ Write the matches of a pair of views in an opened matches file (aliceVision .txt format).
+    """
+    file.write('{} {}\n{}\n'.format(view_i, view_j, len(descriptors_matches)))
+    for describer_type, matches in descriptors_matches:
+        file.write('{} {}\n'.format(describer_type, len(matches)))
+        file.writelines(matches)
+    return 0
@@ -0,0 +1,343 @@
+import concurrent.futures
+import os
+import shutil
+import struct
+import zlib
+
+import utils
+
+""" Ingest stage run before camera_init.
+
+The input folder is scanned and every image is checked in a pool of threads:
+    - JPEG: markers and segments down to the start of the scan, a frame header and an end of image marker after the scan,
+    - PNG: signature, CRC of every chunk, header, image data inflated to the size given by the header and end chunk,
+    - TIFF: byte order, first IFD inside the file and width and length tags,
+    - other image formats supported by aliceVision are only checked not to be empty.
+Only what is checked is read: the JPEG segments are skipped over by seeking and the end of image marker is looked for
+from the end of the file, the TIFF header and first IFD are read by seeking. The PNG chunks are read one at a time,
+as their CRCs and the image data cover the whole file.
+The pool is made of threads rather than forked processes: the wrapper runs other threads by then (writers of the .json
+files, status server), which a forked process would inherit in an unknown state. The reads, CRCs, inflations and hashes
+release the GIL.
+Empty, corrupt and unsupported files and exact duplicates (same content) are dropped. Only the valid images of the
+same size can be duplicates: the content of the others is not hashed. The images kept are linked into a clean folder
+given to camera_init (hardlinked, or symlinked when the images folder is on another filesystem, so that the dataset is
+never copied), and their number is the number of images of the process.
+
+Values
+----------
+- CHECKED_EXTENSIONS: extensions of the images whose structure is checked. Format: {extension: format}
+- OTHER_IMAGE_EXTENSIONS: extensions of the other images supported by aliceVision
+- JPEG_TRAILER_BLOCK_SIZE: size of the blocks read from the end of a JPEG file to find its end of image marker (in bytes)
+"""
+
+CHECKED_EXTENSIONS = {
+    ".jpg": "JPEG",
+    ".jpeg": "JPEG",
+    ".png": "PNG",
+    ".tif": "TIFF",
+    ".tiff": "TIFF"
+}
+
+OTHER_IMAGE_EXTENSIONS = [".exr", ".dng", ".cr2", ".nef", ".arw", ".orf", ".rw2", ".raf", ".heic", ".bmp"]
+
+JPEG_TRAILER_BLOCK_SIZE = 64 * 1024
+
+# JPEG markers of the frame headers (SOF0 to SOF15 but DHT, JPG and DAC) and markers without length
+JPEG_FRAME_MARKERS = [marker for marker in range(0xc0, 0xd0) if marker not in (0xc4, 0xc8, 0xcc)]
+JPEG_STANDALONE_MARKERS = [0x01] + list(range(0xd0, 0xd8))
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+# Number of channels of each PNG color type
+PNG_CHANNELS = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}
+
+
+def ingest_the_images(input_dir, images_dir, nb_of_workers, on_progress=None):
+    """ Check every file of the input folder and link the valid images into the images folder.
+
+    Arguments
+    ----------
+    - input_dir: path to the input images folder
+    - images_dir: path to the folder where the valid images are linked (emptied first)
+    - nb_of_workers: number of threads checking the images
+    - on_progress: function called with the number of files checked and the number of files (optional)
+
+    Returns
+    ----------
+    A report. Format:
+    {
+        "success": True if at least one image is kept,
+        "nb_of_files": ..., "nb_of_images": ...,
+        "images_folder": images_dir,
+        "dropped": {file_name: reason, ...},
+        "formats": {format: number of images kept, ...},
+        "link_methods": {"hardlink" | "symlink": number of images kept linked so, ...},
+        "error": why the input folder can not be read (only if it can not)
+    }
+    """
+    report = {
+        "nb_of_files": 0,
+        "nb_of_images": 0,
+        "images_folder": images_dir,
+        "dropped": {},
+        "formats": {}
+    }
+    try:
+        file_paths = sorted(entry.path for entry in os.scandir(input_dir) if entry.is_file())
+    except OSError as error:
+        report["error"] = "input folder unreadable ({})".format(error.strerror)
+        report["success"] = False
+        return (report)
+    checks = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, nb_of_workers)) as executor:
+        futures = dict((executor.submit(check_the_image, file_path), file_path) for file_path in file_paths)
+        for future in concurrent.futures.as_completed(futures):
+            checks[futures[future]] = future.result()
+            if (on_progress is not None):
+                on_progress(len(checks), len(file_paths))
+        # Only the valid images of the same size can be duplicates
+        paths_by_size = {}
+        for file_path in file_paths:
+            image_format, reason, file_size = checks[file_path]
+            if (reason is None):
+                paths_by_size.setdefault(file_size, []).append(file_path)
+        hashed_paths = [file_path for same_size_paths in paths_by_size.values() if len(same_size_paths) > 1 for file_path in same_size_paths]
+        content_hashes = dict(zip(hashed_paths, executor.map(get_the_content_hash, hashed_paths)))
+
+    if (os.path.isdir(images_dir)):
+        shutil.rmtree(images_dir)
+    os.makedirs(images_dir)
+    report["nb_of_files"] = len(file_paths)
+    report["link_methods"] = {}
+    kept_hashes = {}
+    # The first file in name order is kept among duplicates
+    for file_path in file_paths:
+        file_name = os.path.basename(file_path)
+        image_format, reason, file_size = checks[file_path]
+        content_hash = content_hashes.get(file_path)
+        if (reason is None and content_hash is not None and content_hash in kept_hashes):
+            reason = "duplicate of {}".format(kept_hashes[content_hash])
+        if (reason is not None):
+            report["dropped"][file_name] = reason
+            continue
+        if (content_hash is not None):
+            kept_hashes[content_hash] = file_name
+        link_method = link_the_image(file_path, os.path.join(images_dir, file_name))
+        report["link_methods"][link_method] = report["link_methods"].get(link_method, 0) + 1
+        report["formats"][image_format] = report["formats"].get(image_format, 0) + 1
+        report["nb_of_images"] += 1
+    if ("symlink" in report["link_methods"]):
+        print ("{} images symlinked into {}: they can not be hardlinked from {} (other filesystem)".format(
+            report["link_methods"]["symlink"], images_dir, input_dir))
+    report["success"] = (report["nb_of_images"] > 0)
+    return (report)
+
+
+def count_the_images(input_dir):
+    """ Returns the number of files of the input folder with an image extension (without checking them).
+    0 if the input folder can not be read.
+    """
+    nb_of_images = 0
+    try:
+        with os.scandir(input_dir) as entries:
+            for entry in entries:
+                extension = os.path.splitext(entry.name)[1].lower()
+                if (entry.is_file() and (extension in CHECKED_EXTENSIONS or extension in OTHER_IMAGE_EXTENSIONS)):
+                    nb_of_images += 1
+    except OSError as error:
+        print ("The input folder can not be read: {}".format(error.strerror))
+    return (nb_of_images)
+
+
+def check_the_image(file_path):
+    """ Check the given file (run in a worker thread).
+    Returns its format, the reason why it must be dropped (None if it is a valid image) and its size.
+    """
+    extension = os.path.splitext(file_path)[1].lower()
+    if (extension in CHECKED_EXTENSIONS):
+        image_format = CHECKED_EXTENSIONS[extension]
+    elif (extension in OTHER_IMAGE_EXTENSIONS):
+        image_format = extension[1:].upper()
+    else:
+        return (None, "not an image", None)
+    try:
+        with open(file_path, 'rb') as image_file:
+            file_size = os.fstat(image_file.fileno()).st_size
+            if (file_size == 0):
+                return (image_format, "empty file", file_size)
+            if (image_format == "JPEG"):
+                reason = check_the_jpeg(image_file, file_size)
+            elif (image_format == "PNG"):
+                reason = check_the_png(image_file, file_size)
+            elif (image_format == "TIFF"):
+                reason = check_the_tiff(image_file, file_size)
+            else:
+                reason = None
+    except OSError as error:
+        return (image_format, "unreadable ({})".format(error.strerror), None)
+    return (image_format, reason, file_size)
+
+
+def get_the_content_hash(file_path):
+    """ Returns the hash of the content of the given file (run in a worker thread). None if it can not be read.
+    """
+    try:
+        return (utils.get_the_file_hash(file_path))
+    except OSError:
+        return
+
+
+def link_the_image(file_path, image_path):
+    """ Hardlink the image at the given path, symlink it if hardlinks are not possible (other filesystem):
+    the images are only read, so copying them would only duplicate the dataset.
+    Returns the method used: "hardlink" or "symlink".
+    """
+    try:
+        os.link(file_path, image_path)
+        return ("hardlink")
+    except OSError:
+        os.symlink(os.path.abspath(file_path), image_path)
+        return ("symlink")
+
+
+def check_the_jpeg(image_file, file_size):
+    """ Returns the reason why the given JPEG file (binary file object of the given size) is corrupt. None if it is valid.
+    """
+    image_file.seek(0)
+    if (image_file.read(2) != b'\xff\xd8'):
+        return ("not a JPEG file")
+    position = 2
+    frame_found = False
+    while True:
+        image_file.seek(position)
+        marker_data = image_file.read(4)
+        if (len(marker_data) < 2 or marker_data[0] != 0xff):
+            return ("truncated or corrupt segments")
+        marker = marker_data[1]
+        # Fill bytes
+        if (marker == 0xff):
+            position += 1
+            continue
+        if (marker in JPEG_STANDALONE_MARKERS):
+            position += 2
+            continue
+        if (marker == 0xd9):
+            return ("end of image before the scan")
+        if (len(marker_data) < 4):
+            return ("truncated segment")
+        segment_length = struct.unpack('>H', marker_data[2:4])[0]
+        if (segment_length < 2 or position + 2 + segment_length > file_size):
+            return ("truncated segment")
+        if (marker in JPEG_FRAME_MARKERS):
+            if (segment_length < 8):
+                return ("invalid frame header")
+            # Precision, height and width
+            frame_header = image_file.read(5)
+            width = struct.unpack('>H', frame_header[3:5])[0]
+            if (width == 0):
+                return ("invalid image width")
+            frame_found = True
+        position += 2 + segment_length
+        # Start of the scan: the entropy-coded data follows
+        if (marker == 0xda):
+            break
+    if (not frame_found):
+        return ("no frame header")
+    if (not has_an_end_of_image(image_file, position, file_size)):
+        return ("truncated scan (no end of image)")
+    return
+
+
+def has_an_end_of_image(image_file, start, file_size):
+    """ Returns True if a JPEG end of image marker lies in the given file after start.
+    The file is read backwards by blocks of JPEG_TRAILER_BLOCK_SIZE bytes, so that only its last block is read
+    when the marker ends the file or is followed by a short trailer.
+    """
+    end = file_size
+    while (end > start):
+        block_start = max(start, end - JPEG_TRAILER_BLOCK_SIZE)
+        image_file.seek(block_start)
+        # One byte more, for a marker across two blocks
+        if (image_file.read(min(end + 1, file_size) - block_start).find(b'\xff\xd9') >= 0):
+            return (True)
+        end = block_start
+    return (False)
+
+
+def check_the_png(image_file, file_size):
+    """ Returns the reason why the given PNG file (binary file object of the given size) is corrupt. None if it is valid.
+    The chunks are read one at a time.
+    """
+    image_file.seek(0)
+    if (image_file.read(8) != PNG_SIGNATURE):
+        return ("not a PNG file")
+    position = 8
+    header = None
+    decompressor = zlib.decompressobj()
+    nb_of_inflated_bytes = 0
+    while True:
+        if (position + 12 > file_size):
+            return ("truncated file (no IEND chunk)")
+        chunk_length, chunk_type = struct.unpack('>I4s', image_file.read(8))
+        if (position + 12 + chunk_length > file_size):
+            return ("truncated {} chunk".format(chunk_type.decode('latin-1')))
+        chunk_data = image_file.read(chunk_length)
+        chunk_crc = struct.unpack('>I', image_file.read(4))[0]
+        if (zlib.crc32(chunk_type + chunk_data) & 0xffffffff != chunk_crc):
+            return ("bad CRC in {} chunk".format(chunk_type.decode('latin-1')))
+        position += 12 + chunk_length
+        if (header is None):
+            if (chunk_type != b'IHDR' or chunk_length != 13):
+                return ("no IHDR chunk")
+            header = struct.unpack('>IIBBBBB', chunk_data)
+            width, height, bit_depth, color_type = header[:4]
+            if (width == 0 or height == 0 or color_type not in PNG_CHANNELS):
+                return ("invalid IHDR chunk")
+        elif (chunk_type == b'IDAT'):
+            try:
+                nb_of_inflated_bytes += len(decompressor.decompress(chunk_data))
+            except zlib.error:
+                return ("corrupt image data")
+        elif (chunk_type == b'IEND'):
+            break
+    if (not decompressor.eof):
+        return ("truncated image data")
+    width, height, bit_depth, color_type, compression, filter_method, interlace = header
+    # Each row is preceded by its filter byte (the size of interlaced images is not checked)
+    expected_size = height * (1 + (width * PNG_CHANNELS[color_type] * bit_depth + 7) // 8)
+    if (interlace == 0 and nb_of_inflated_bytes != expected_size):
+        return ("image data of {} bytes instead of {}".format(nb_of_inflated_bytes, expected_size))
+    return
+
+
+def check_the_tiff(image_file, file_size):
+    """ Returns the reason why the given TIFF file (binary file object of the given size) is corrupt. None if it is valid.
+    """
+    image_file.seek(0)
+    header = image_file.read(8)
+    if (header[:4] == b'II*\x00'):
+        byte_order = '<'
+    elif (header[:4] == b'MM\x00*'):
+        byte_order = '>'
+    elif (header[:4] in (b'II+\x00', b'MM\x00+')):
+        # BigTIFF, only the header is checked
+        return
+    else:
+        return ("not a TIFF file")
+    if (len(header) < 8):
+        return ("truncated header")
+    ifd_offset = struct.unpack(byte_order + 'I', header[4:8])[0]
+    if (ifd_offset < 8 or ifd_offset + 2 > file_size):
+        return ("first IFD outside of the file")
+    image_file.seek(ifd_offset)
+    nb_of_entries = struct.unpack(byte_order + 'H', image_file.read(2))[0]
+    if (ifd_offset + 2 + 12 * nb_of_entries > file_size):
+        return ("truncated IFD")
+    entries = image_file.read(12 * nb_of_entries)
+    tags = set()
+    for entry_iter in range(nb_of_entries):
+        tags.add(struct.unpack(byte_order + 'H', entries[12 * entry_iter:12 * entry_iter + 2])[0])
+    # ImageWidth and ImageLength tags
+    if (256 not in tags or 257 not in tags):
+        return ("no image dimensions")
+    return
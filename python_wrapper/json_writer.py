@@ -0,0 +1,215 @@
+import json
+import os
+import threading
+import time
+
+""" Background writer of the .json report files (status.json, metadata.json).
+
+The updates of a file are coalesced and written by a background thread at most once every FLUSH_INTERVAL seconds.
+Each write is atomic (temporary file renamed over the .json file) so that a reader never gets a truncated file.
+Every change is also appended to an NDJSON event log next to the .json file (status.json -> status.ndjson).
+The event log is never truncated by a writer: a resumed run carries on the log of the interrupted run, a new run removes
+the previous log first (see utils.remove_json_event_logs).
+Each line of the event log is one change. Format:
+    {"time": ..., "path": [key, sub_key], "value": new_value}
+    {"time": ..., "path": [key, sub_key], "deleted": true}
+where path locates the changed value in the dictionary (second level at most).
+Listeners (such as the status server, see status_server.py) can be given each write and its changes as well.
+"""
+
+# Minimum time between two writes of the same file (in seconds)
+FLUSH_INTERVAL = 0.5
+
+# Time to wait before serialising again a dictionary modified during its serialisation (in seconds)
+RETRY_INTERVAL = 0.01
+
+
+class JsonFileWriter():
+    """ An instance of the class JsonFileWriter writes the successive states of a python dictionary in a .json file.
+
+    Building arguments
+    ----------
+    - file: path to the .json file
+    - flush_interval: minimum time between two writes of the file (in seconds)
+
+    Attributes
+    ----------
+    - file: path to the .json file
+    - events_file: path to the NDJSON event log
+    - flush_interval: minimum time between two writes of the file (in seconds)
+    - dictionary: the last dictionary given to update
+    - dirty: True if the dictionary has been updated since the last write
+    - written_parts: serialised values of the last write. Format: {(key, sub_key): json_string}
+    - last_flush_time: time of the last write
+    - closed: True once the writer has been closed
+    - condition: threading.Condition protecting the attributes above
+    - flush_lock: threading.Lock making the writes of the file sequential
+    - listeners: functions called after each write with the content written and its changes (lines of the event log)
+    - thread: background thread writing the file
+    """
+
+    def __init__(self, file, flush_interval=FLUSH_INTERVAL):
+        self.file = file
+        self.events_file = get_the_events_file(file)
+        self.flush_interval = flush_interval
+        self.dictionary = None
+        self.dirty = False
+        self.closed = False
+        self.written_parts = {}
+        self.last_flush_time = 0
+        self.condition = threading.Condition()
+        self.flush_lock = threading.Lock()
+        self.listeners = []
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def update(self, dictionary):
+        """ Ask for the given dictionary to be written. Returns immediately.
+        """
+        with self.condition:
+            self.dictionary = dictionary
+            self.dirty = True
+            self.condition.notify_all()
+        return 0
+
+    def run(self):
+        """ Loop of the background thread: write the file when it is dirty, at most once every flush_interval seconds.
+        """
+        while True:
+            with self.condition:
+                while (not self.dirty and not self.closed):
+                    self.condition.wait()
+                if (self.closed):
+                    return
+                waiting_time = self.last_flush_time + self.flush_interval - time.time()
+                if (waiting_time > 0):
+                    self.condition.wait(waiting_time)
+                    continue
+            self.flush()
+
+    def flush(self):
+        """ Write the file now if it is dirty.
+        """
+        with self.flush_lock:
+            with self.condition:
+                if (not self.dirty):
+                    return 0
+                dictionary = self.dictionary
+                self.dirty = False
+                self.last_flush_time = time.time()
+            parts = serialise_the_parts(dictionary)
+            content = assemble_the_parts(parts)
+            write_the_file(self.file, content)
+            events = self.append_the_events(parts)
+            for listener in list(self.listeners):
+                # A failing listener must not stop the writes of the file
+                try:
+                    listener(content, events)
+                except Exception as error:
+                    print ("A listener of {} failed: {!r}".format(self.file, error))
+        return 0
+
+    def add_listener(self, listener):
+        """ Call the given function after each write with the content written and its changes (lines of the event log).
+        """
+        self.listeners.append(listener)
+        return 0
+
+    def remove_listener(self, listener):
+        """ Stop calling the given function after each write.
+        """
+        if (listener in self.listeners):
+            self.listeners.remove(listener)
+        return 0
+
+    def append_the_events(self, parts):
+        """ Append the changes between the last write and the given serialised parts to the event log.
+        Returns the lines appended.
+        """
+        event_time = time.time()
+        events = []
+        for path in parts:
+            if (parts[path] is not None and self.written_parts.get(path) != parts[path]):
+                events.append('{{"time": {}, "path": {}, "value": {}}}\n'.format(event_time, json.dumps(list(path)), parts[path]))
+        for path in self.written_parts:
+            if (path not in parts):
+                events.append('{{"time": {}, "path": {}, "deleted": true}}\n'.format(event_time, json.dumps(list(path))))
+        self.written_parts = parts
+        if (len(events) > 0):
+            try:
+                with open(self.events_file, 'a') as events_file:
+                    events_file.writelines(events)
+            except:
+                pass
+        return (events)
+
+    def close(self):
+        """ Write the last state of the file and stop the background thread.
+        """
+        self.flush()
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        self.thread.join()
+        return 0
+
+
+def get_the_events_file(file):
+    """ Returns the path to the NDJSON event log of the .json file (status.json -> status.ndjson).
+    """
+    return (os.path.splitext(file)[0] + '.ndjson')
+
+
+def serialise_the_parts(dictionary):
+    """ Serialise the values of the dictionary (down to the second level). The dictionary can be modified by other threads
+    meanwhile, the serialisation is tried again in that case.
+
+    Returns
+    ----------
+    A dictionary. Format: {(key,): json_string, (key, sub_key): json_string, ...}
+    """
+    while True:
+        try:
+            parts = {}
+            for key in list(dictionary):
+                value = dictionary[key]
+                if (isinstance(value, dict)):
+                    parts[(key,)] = None
+                    for sub_key in list(value):
+                        parts[(key, sub_key)] = json.dumps(value[sub_key])
+                else:
+                    parts[(key,)] = json.dumps(value)
+            return (parts)
+        except (RuntimeError, KeyError):
+            time.sleep(RETRY_INTERVAL)
+
+
+def assemble_the_parts(parts):
+    """ Returns the json document made of the serialised parts (same output as json.dumps on the dictionary).
+    """
+    items = []
+    sub_items = {}
+    for path in parts:
+        if (len(path) == 2):
+            sub_items.setdefault(path[0], []).append('{}: {}'.format(json.dumps(str(path[1])), parts[path]))
+    for path in parts:
+        if (len(path) == 1):
+            if (parts[path] is None):
+                value = '{' + ', '.join(sub_items.get(path[0], [])) + '}'
+            else:
+                value = parts[path]
+            items.append('{}: {}'.format(json.dumps(str(path[0])), value))
+    return ('{' + ', '.join(items) + '}')
+
+
+def write_the_file(file, content):
+    """ Write the content in the file atomically (temporary file renamed over the file).
+    """
+    temporary_file = '{}.tmp-{}'.format(file, os.getpid())
+    try:
+        with open(temporary_file, 'w') as json_file:
+            json_file.write(content)
+        os.replace(temporary_file, file)
+    except:
+        print ("No such .json file.")
+    return 0
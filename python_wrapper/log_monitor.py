@@ -0,0 +1,188 @@
+import collections
+import re
+import threading
+import time
+
+""" Live monitoring of the logs written by the aliceVision binaries on stderr.
+
+The stderr of a subprocess is read through a pipe line by line: each line is written in the log file of the step
+and classified as it comes. Only the counters and the last MAX_LINES_PER_LEVEL lines of each level are kept in memory.
+The lines giving a progress ("12%", "(120/1000)", see get_the_log_progress) are caught as well.
+The pipe is read either by a thread (LogMonitor.start) or by a coroutine on an event loop (LogMonitor.consume_the_stream).
+"""
+
+# Levels of the lines which are caught. Format: (level, token found in the line)
+LEVELS = [
+    ("warning", "[warning]"),
+    ("error", "[error]"),
+    ("fatal", "[fatal]")
+]
+
+# Maximum number of lines kept in memory for each level
+MAX_LINES_PER_LEVEL = 100
+
+# Maximum length of a line read by a coroutine (in bytes, longer lines are cut)
+MAX_LINE_LENGTH = 1024**2
+
+# Progress given in a line as a percentage or as a number of items done over a number of items
+PERCENT_PATTERN = re.compile(r'(?:^|[\s(\[])(\d{1,3}(?:\.\d+)?)\s*%')
+FRACTION_PATTERN = re.compile(r'(?:^|[\s(\[])(\d+)\s*/\s*(\d+)(?=$|[\s)\],.:;])')
+
+
+class LogCounters():
+    """ An instance of the class LogCounters represents the live counters of the log lines of a step.
+    It is shared by the monitors of the groups of a step.
+
+    Building arguments
+    ----------
+    - on_update: function called (without argument) when a warning, error or fatal line is caught (optional)
+
+    Attributes
+    ----------
+    - counters: python dictionary of the counters. Format: {"lines": ..., "warning": ..., "error": ..., "fatal": ...}
+    - last_lines: the last MAX_LINES_PER_LEVEL lines of each level. Format: {level: collections.deque}
+    - on_update: function called when a warning, error or fatal line is caught
+    - progress: progress given by the last progress line (from 0 to 1, None until a progress line is caught)
+    - lock: threading.Lock protecting the attributes above
+    """
+
+    def __init__(self, on_update=None):
+        self.counters = {"lines": 0}
+        self.last_lines = {}
+        for level, token in LEVELS:
+            self.counters[level] = 0
+            self.last_lines[level] = collections.deque(maxlen=MAX_LINES_PER_LEVEL)
+        self.on_update = on_update
+        self.progress = None
+        self.lock = threading.Lock()
+
+    def classify(self, line):
+        """ Count the given line and keep it if it is a warning, error or fatal line.
+        Returns the level of the line (None if it is not a warning, error or fatal line).
+        """
+        if ('%' in line or '/' in line):
+            line_progress = get_the_log_progress(line)
+            if (line_progress is not None):
+                self.progress = line_progress
+        line_level = None
+        with self.lock:
+            self.counters["lines"] += 1
+            for level, token in LEVELS:
+                if (token in line):
+                    self.counters[level] += 1
+                    self.last_lines[level].append(line)
+                    line_level = level
+        if (line_level is not None and self.on_update is not None):
+            self.on_update()
+        return (line_level)
+
+    def log_report(self):
+        """ Returns a report on the lines classified. Format:
+            {
+                "warning": [last warning lines], "error": [...], "fatal": [...],
+                "counters": {"lines": ..., "warning": ..., "error": ..., "fatal": ...}
+            }
+        """
+        with self.lock:
+            log_report = {}
+            for level, token in LEVELS:
+                log_report[level] = list(self.last_lines[level])
+            log_report["counters"] = dict(self.counters)
+        return (log_report)
+
+
+class LogMonitor():
+    """ An instance of the class LogMonitor reads the stderr of a subprocess, writes it in a log file and classifies its lines.
+
+    Building arguments
+    ----------
+    - log_file_path: path to the log file
+    - log_counters: an instance of the class LogCounters (shared by the monitors of a step)
+    - on_fatal: function called with the line when a fatal line is caught (optional)
+    - append: if True, the lines are appended to the log file instead of overwriting it (optional)
+
+    Attributes
+    ----------
+    - log_file_path: path to the log file
+    - log_counters: an instance of the class LogCounters
+    - on_fatal: function called when a fatal line is caught
+    - append: True if the lines are appended to the log file
+    - last_line_time: time when the last line was read (None until a line is read)
+    - thread: thread reading the pipe (once started)
+    """
+
+    def __init__(self, log_file_path, log_counters, on_fatal=None, append=False):
+        self.log_file_path = log_file_path
+        self.log_counters = log_counters
+        self.on_fatal = on_fatal
+        self.append = append
+        self.last_line_time = None
+        self.thread = None
+
+    def start(self, pipe):
+        """ Start reading the given pipe (binary stderr of a subprocess) in a background thread.
+        """
+        self.thread = threading.Thread(target=self.consume, args=(pipe,), daemon=True)
+        self.thread.start()
+        return 0
+
+    def consume(self, pipe):
+        """ Read the pipe until it is closed, writing each line in the log file and classifying it.
+        The on_fatal function is called as soon as a fatal line is caught (the pipe is still read until it is closed).
+        """
+        with open(self.log_file_path, 'a' if self.append else 'w') as log:
+            for raw_line in iter(pipe.readline, b''):
+                self.read_the_line(raw_line, log)
+        pipe.close()
+        return 0
+
+    async def consume_the_stream(self, stream):
+        """ Same as consume, the stderr of the subprocess being read from the given asyncio.StreamReader on the event loop.
+        """
+        with open(self.log_file_path, 'a' if self.append else 'w') as log:
+            while True:
+                try:
+                    raw_line = await stream.readline()
+                except ValueError:
+                    # Line longer than MAX_LINE_LENGTH
+                    raw_line = await stream.read(MAX_LINE_LENGTH)
+                if (len(raw_line) == 0):
+                    break
+                self.read_the_line(raw_line, log)
+        return 0
+
+    def read_the_line(self, raw_line, log):
+        """ Write the given line (bytes) in the log file and classify it.
+        """
+        self.last_line_time = time.time()
+        line = raw_line.decode('utf-8', errors='replace')
+        log.write(line)
+        if (self.log_counters.classify(line) == "fatal" and self.on_fatal is not None):
+            log.flush()
+            self.on_fatal(line)
+        return 0
+
+    def join(self):
+        """ Wait until the whole pipe has been read.
+        """
+        if (self.thread is not None):
+            self.thread.join()
+        return 0
+
+
+def get_the_log_progress(line):
+    """ Returns the progress given by the line (from 0 to 1). None if the line gives no progress or more than one
+    (such as the scale of a progress bar: "0%   10   20 ... 100%").
+    """
+    percents = PERCENT_PATTERN.findall(line)
+    if (len(percents) == 1):
+        percent = float(percents[0])
+        return (percent / 100 if percent <= 100 else None)
+    if (len(percents) > 1):
+        return
+    fractions = FRACTION_PATTERN.findall(line)
+    if (len(fractions) == 1):
+        nb_of_items_done, nb_of_items = int(fractions[0][0]), int(fractions[0][1])
+        if (0 < nb_of_items and nb_of_items_done <= nb_of_items):
+            return (nb_of_items_done / nb_of_items)
+    return
@@ -1,8 +1,31 @@
+import asyncio
+import concurrent.futures
 import os
+import queue
+import signal
 import subprocess
+import threading
+import time
 
+import accounting
+import cache
+import history
+import log_monitor
 import parameters
+import progress
+import scheduler
 import utils
+import verifier
+import watchdog
+
+# Parameters dividing a step into groups (see parameters.py), which are not given to the binary
+GROUP_PARAMETERS = ["groupSize", "minGroupSize", "adaptiveGroupSize"]
+# Number of times a failed group is run again (see parameters.py), which is not given to the binary either
+RETRY_PARAMETERS = ["groupRetries"]
+# Time waited before running a failed group again (in seconds), doubled at each retry
+GROUP_RETRY_BACKOFF = 10
+# Time given to a process tree to end after SIGTERM before it is killed with SIGKILL (in seconds)
+KILL_GRACE_PERIOD = 10
 
 
 class Node():
@@ -42,7 +65,37 @@ class Node():
     - intern_locations: dictonary of the directions used to run the step
     - parameters: set of parameters use to run the step
     - nb_of_images: number of pictures
+    - nb_of_jobs: maximum number of subprocesses run concurrently when the step is divided into groups
     - log_dir: location of the folder where log files are written for each step
+    - groups_report: list of the groups run by the step and the time they took (steps divided into groups only)
+    - cache_report: report on the use of the step cache (only if a step cache is used)
+    - completed_groups: groups already completed by an interrupted run, which are not run again. Format: [(range_start, range_size), ...]
+    - selected_views: indices of the views to process (steps divided into groups only). All the views if None
+    - incremental_report: report on the reuse of the features and matches (only if a feature store is used)
+    - store_linked_files: files of the output folder linked from the feature store, which are inputs the step does not write
+    - log_counters: live counters of the log lines of the step (instance of the class LogCounters, once the step has been run)
+    - resources_reports: resources used by each subprocess run by the step (see accounting.py)
+    - children_rusage: CPU times used by the children of the wrapper while the step was running
+    - available_memory: memory available for the subprocesses of the step in GB (memory available on the host if None)
+    - groups_plan: size and number of the groups and number of concurrent subprocesses chosen (steps divided into groups only)
+    - return_code: return code of the subprocess of the step, or the first non-zero return code of its groups (None if the step has not been run)
+    - kills: subprocesses killed by the wrapper. Format: [{"pid": ..., "log_file": ..., "reason": ..., "detail": ..., "time": ...}, ...]
+    The reason is one of "fatal line", "time limit", "stalled", "step failed" (another group failed), "interrupted" and "cancelled"
+    - time_limit_factor: ratio of the time limit of each subprocess to its predicted time (see watchdog.py, no time limit if None)
+    - stall_time: time after which a subprocess with no output and no CPU time is killed (in seconds, no stall detection if None)
+    - on_kill: function called (without argument) when a subprocess is killed
+    - core_ids: ids of the cores the step may use (the cores the wrapper can run on if None)
+    - cores_report: cores given to the step and to each of its concurrent subprocesses (once the step has been run).
+    Format: {"cores": [...], "core_sets": [[...], ...] (steps divided into groups only)}
+    - predicted_time: time predicted for the step (in seconds, None if unknown), from which its progress is estimated when it can not be measured
+    - on_progress: function called with the remaining time of the step (in seconds, None if unknown) at each measure of its progress
+    - progress_tracker: instance of the class ProgressTracker measuring the progress of the step while it runs (see progress.py)
+    - loop: asyncio event loop (running in another thread) on which the subprocesses are run (see run_the_command_on_the_loop).
+    They are run from the calling thread if None
+    - cancel_event: threading.Event which cancels the step once set: its subprocesses are killed (optional)
+    - running_processes: subprocesses running. Format: {subprocess.Popen or asyncio.subprocess.Process instance: log_file_path}
+    - stopping: threading.Event set when the step has failed, so that no group is started anymore
+    - lock: threading.Lock protecting kills and running_processes
     """
 
     def __init__(self, step_name, process_directions, log_dir, setups):
@@ -52,21 +105,75 @@ class Node():
         self.intern_locations = process_directions[step_name]["intern_locations"]
         self.parameters = parameters.get_the_parameters(setups.quality, setups.nb_of_images)[step_name]
         self.nb_of_images = setups.nb_of_images
+        self.nb_of_jobs = setups.nb_of_jobs
         self.log_dir = utils.concat_and_normalize_paths(log_dir, step_name + '_log.txt')
+        self.groups_report = None
+        self.cache_report = None
+        self.completed_groups = []
+        self.selected_views = None
+        self.incremental_report = None
+        self.store_linked_files = set()
+        self.log_counters = None
+        self.resources_reports = []
+        self.children_rusage = None
+        self.available_memory = None
+        self.groups_plan = None
+        self.return_code = None
+        self.kills = []
+        self.time_limit_factor = None
+        self.stall_time = None
+        self.on_kill = None
+        self.core_ids = None
+        self.cores_report = None
+        self.predicted_time = None
+        self.on_progress = None
+        self.progress_tracker = None
+        self.loop = None
+        self.cancel_event = None
+        self.running_processes = {}
+        self.stopping = threading.Event()
+        self.lock = threading.Lock()
 
-    def run_the_node(self, status_file, status_dict):
+    def run_the_node(self, status_file, status_dict, step_cache=None):
         """ Run the step represented by the node and updates the status.json file which gives a live output of the running process.
         It uses the status_file (location of the status file) and the status_dict (python dictionary representing the status.json file)
         to give a live report of the node being processed.
+        If a step_cache (instance of the class StepCache) is given, the outputs are restored from it when the step
+        has already been run with the same inputs, and stored in it otherwise.
         """
 
-        utils.create_folder(self.output_folder)
-
         status_dict[self.name] = {}
         status_dict[self.name]["status"] = "in progress"
         status_dict[self.name]["progress"] = 0
         utils.update_json_file(status_file, status_dict)
 
+        cache_key = None
+        if (step_cache is not None):
+            cache_key = step_cache.get_the_key(self)
+            self.cache_report = {"key": cache_key, "hit": False}
+            if (cache_key is not None and step_cache.restore(cache_key, self.output_folder)):
+                print ("{} restored from the step cache ({})".format(self.name, cache_key))
+                with open(self.log_dir, 'w') as log:
+                    log.write("Outputs restored from the step cache ({})\n".format(cache_key))
+                self.cache_report["hit"] = True
+                status_dict[self.name]["status"] = "done"
+                status_dict[self.name]["progress"] = 100
+                utils.update_json_file(status_file, status_dict)
+                return 0
+            # Outputs shared with the cache must not be overwritten by the step (the files linked from the feature store are not written)
+            cache.detach_the_tree(self.output_folder, ignored_files=self.store_linked_files)
+
+        utils.create_folder(self.output_folder)
+
+        # Live counters of the log lines, exposed in the status.json file
+        self.log_counters = log_monitor.LogCounters(on_update=lambda: utils.update_json_file(status_file, status_dict))
+        status_dict[self.name]["log_counters"] = self.log_counters.counters
+        # Subprocesses killed, exposed in the status.json file as well
+        status_dict[self.name]["kills"] = self.kills
+        self.on_kill = lambda: utils.update_json_file(status_file, status_dict)
+
+        rusage_before = accounting.get_the_children_rusage()
+
         cmd_line = []
         cmd_line.append(self.binary_name)
         for option, value in self.add_locations_to_command_line():
@@ -76,29 +183,39 @@ class Node():
             cmd_line.append(option)
             cmd_line.append(value)
 
-        log = open(self.log_dir, 'w')
-        # Dealing with DepthMap particular case
-        if (self.name == "depth_map"):
-            # Dividing the task if needed
-            group_size = self.parameters["groupSize"]
-            number_of_groups = (self.nb_of_images + (group_size-1)) // group_size
-            for group_iter in range(number_of_groups):
-                range_start = group_size * group_iter
-                range_size = min(group_size, self.nb_of_images-range_start)
-                print("DepthMap Group {}/{} : {}, {}".format(group_iter+1, number_of_groups, range_start, range_size))
-                cmd = cmd_line + ['--rangeStart', str(range_start), '--rangeSize', str(range_size)]
-                print (cmd)
-                subprocess.run(cmd, stderr=log)
-                status_dict[self.name]["progress"] = ((group_iter+1)/number_of_groups)*100
-                print (status_dict)
-                utils.update_json_file(status_file, status_dict)
-        else:
-            print (cmd_line)
-            subprocess.run(cmd_line, stderr=log)
-            status_dict[self.name]["progress"] = 100
+        # Cores the subprocesses are pinned to
+        self.cores_report = {"cores": scheduler.get_the_step_cores(self.name, self.core_ids or scheduler.get_the_available_cores())}
+
+        # Live progress and remaining time of the step, exposed in the status.json file
+        def update_the_progress(step_progress, remaining_time, source):
+            status_dict[self.name]["progress"] = step_progress
+            status_dict[self.name]["eta"] = {"remaining_time": remaining_time, "source": source}
+            if (remaining_time is not None):
+                status_dict[self.name]["eta"]["expected_end_time"] = time.time() + remaining_time
+            if (self.on_progress is not None):
+                self.on_progress(remaining_time)
             utils.update_json_file(status_file, status_dict)
 
-        log.close()
+        self.progress_tracker = progress.ProgressTracker(self, update_the_progress, self.predicted_time)
+        self.progress_tracker.start()
+        try:
+            # Dealing with the steps divided into groups
+            if (is_divided_into_groups(self.parameters)):
+                # Dividing the task if needed
+                self.run_the_groups(cmd_line, status_file, status_dict)
+            else:
+                print (cmd_line)
+                time_limit = watchdog.get_the_time_limit(self.name, self.parameters, history.get_the_nb_of_views(self), self.nb_of_jobs, self.time_limit_factor)
+                self.return_code = self.run_the_command(cmd_line, self.log_dir, time_limit=time_limit, cores=self.cores_report["cores"])[0]
+        finally:
+            self.progress_tracker.stop()
+        status_dict[self.name].pop("eta", None)
+
+        self.children_rusage = accounting.get_the_rusage_delta(rusage_before, accounting.get_the_children_rusage())
+
+        # A subprocess failed or killed may have left partial outputs, which must not be restored by the next runs
+        if (cache_key is not None and self.return_code == 0 and len(self.kills) == 0 and self.check_locations_existence_and_step_success()[0]):
+            step_cache.store(cache_key, self.name, self.output_folder)
 
         status_dict[self.name]["status"] = "done"
         status_dict[self.name]["progress"] = 100
@@ -106,13 +223,284 @@ class Node():
 
         return 0
 
+    def get_the_groups(self):
+        """ Returns the list of the groups the step is divided into. Format: [(range_start, range_size), ...]
+        The size of the groups is either:
+            - given by the "groupSize" parameter,
+            - chosen to spread the images on the available cores, each group containing at least "minGroupSize" images,
+            - planned from the number of images, the downscale factor, the cores and the memory available if the
+            "adaptiveGroupSize" parameter is set (see scheduler.plan_the_depth_map_groups).
+        Only the views listed in selected_views are put in the groups if it is given, and the views of the
+        completed_groups are left out. The plan chosen is stacked in groups_plan.
+        """
+        if (self.selected_views is None):
+            view_indices = list(range(self.nb_of_images))
+        else:
+            view_indices = sorted(self.selected_views)
+        completed_views = set()
+        for range_start, range_size in self.completed_groups:
+            completed_views.update(range(range_start, range_start + range_size))
+        view_indices = [view_index for view_index in view_indices if view_index not in completed_views]
+        nb_of_views = len(view_indices)
+        if (self.parameters.get("adaptiveGroupSize", False)):
+            available_memory = self.available_memory
+            if (available_memory is None):
+                available_memory = utils.get_the_available_memory()
+            self.groups_plan = scheduler.plan_the_depth_map_groups(nb_of_views, float(self.parameters["downscale"]), self.nb_of_jobs, available_memory)
+            group_size = self.groups_plan["group_size"]
+        elif ("groupSize" in self.parameters):
+            group_size = self.parameters["groupSize"]
+        else:
+            min_group_size = self.parameters["minGroupSize"]
+            number_of_groups = min((nb_of_views + (min_group_size-1)) // min_group_size, utils.get_the_number_of_cores())
+            number_of_groups = max(1, number_of_groups)
+            group_size = (nb_of_views + (number_of_groups-1)) // number_of_groups
+        group_size = max(1, group_size)
+        # Contiguous views are put together, groups can not contain more than group_size views
+        groups = []
+        for view_index in view_indices:
+            if (len(groups) > 0 and groups[-1][0] + groups[-1][1] == view_index and groups[-1][1] < group_size):
+                groups[-1] = (groups[-1][0], groups[-1][1] + 1)
+            else:
+                groups.append((view_index, 1))
+        if (self.groups_plan is None):
+            self.groups_plan = {
+                "group_size": group_size,
+                "nb_of_groups": len(groups),
+                "nb_of_jobs": max(1, min(self.nb_of_jobs, len(groups)))
+            }
+        else:
+            self.groups_plan["nb_of_groups"] = len(groups)
+        return (groups)
+
+    def run_the_groups(self, cmd_line, status_file, status_dict):
+        """ Divide the step into groups of images and run them on a pool of concurrent subprocesses (as many as planned in groups_plan).
+        Each group writes its own log file. The progress in the status.json file is measured again as each group completes (in any order)
+        and the group log files are merged into the log file of the step once every group is done.
+        The time taken by each group is stacked in groups_report.
+        The views of the groups listed in completed_groups are not run again and the completed groups are listed in the status.json file
+        so that an interrupted run can be resumed from them.
+        A failed group is run again on its own up to "groupRetries" times (see run_the_group). Once a group has failed for good,
+        the step fails: the groups running are killed and the groups left are not started.
+        """
+        groups = self.get_the_groups()
+        self.groups_report = []
+        status_dict[self.name]["completed_groups"] = [list(group) for group in self.completed_groups]
+        status_dict[self.name]["groups_plan"] = self.groups_plan
+        nb_of_completed_groups = len(self.completed_groups)
+        number_of_groups = nb_of_completed_groups + len(groups)
+        self.progress_tracker.update()
+        if (nb_of_completed_groups > 0):
+            print("{} {} groups already completed".format(self.name, nb_of_completed_groups))
+
+        # Each concurrent subprocess takes a set of cores of its own
+        core_sets = queue.Queue()
+        self.cores_report["core_sets"] = scheduler.split_the_cores(self.cores_report["cores"], self.groups_plan["nb_of_jobs"])
+        for core_set in self.cores_report["core_sets"]:
+            core_sets.put(core_set)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.groups_plan["nb_of_jobs"]) as executor:
+            futures = {}
+            for group_iter, (range_start, range_size) in enumerate(groups):
+                print("{} Group {}/{} : {}, {}".format(self.name, group_iter+1, len(groups), range_start, range_size))
+                cmd = cmd_line + ['--rangeStart', str(range_start), '--rangeSize', str(range_size)]
+                time_limit = watchdog.get_the_time_limit(self.name, self.parameters, range_size, 1, self.time_limit_factor)
+                future = executor.submit(self.run_the_group, cmd, self.get_the_group_log_dir(range_start), self.parameters.get("groupRetries", 0), time_limit, core_sets)
+                futures[future] = group_iter
+            self.return_code = 0
+            try:
+                for future in concurrent.futures.as_completed(futures):
+                    group_iter = futures[future]
+                    return_code, time_taken, resources, nb_of_attempts = future.result()
+                    # Group not started as the step had already failed
+                    if (return_code is None):
+                        continue
+                    self.groups_report.append({
+                        "group": group_iter+1,
+                        "range_start": groups[group_iter][0],
+                        "range_size": groups[group_iter][1],
+                        "return_code": return_code,
+                        "time_taken": time_taken,
+                        "nb_of_attempts": nb_of_attempts,
+                        "resources": resources
+                    })
+                    if (return_code == 0):
+                        status_dict[self.name]["completed_groups"].append(list(groups[group_iter]))
+                    elif (self.return_code == 0):
+                        print ("{} Group {} failed (return code {}), the step is stopped".format(self.name, group_iter+1, return_code))
+                        self.return_code = return_code
+                    self.progress_tracker.update()
+                    print (status_dict)
+            except BaseException:
+                # The groups running must not outlive the wrapper
+                self.stop_the_groups("interrupted")
+                raise
+        self.groups_report.sort(key=lambda group_report: group_report["group"])
+
+        # Merge the group log files into the log file of the step (the ones left by an interrupted run too)
+        with open(self.log_dir, 'w') as log:
+            for group_iter, (range_start, range_size) in enumerate(sorted(set(self.completed_groups) | set(groups))):
+                group_log_dir = self.get_the_group_log_dir(range_start)
+                log.write("{} Group {}/{} : {}, {}\n".format(self.name, group_iter+1, number_of_groups, range_start, range_size))
+                try:
+                    with open(group_log_dir, 'r') as group_log:
+                        for line in group_log:
+                            log.write(line)
+                    os.remove(group_log_dir)
+                except:
+                    pass
+        return 0
+
+    def run_the_group(self, cmd, group_log_dir, nb_of_retries=0, time_limit=None, core_sets=None):
+        """ Run one group of the step and write its stderr in its own log file. If the group fails, it is run again
+        up to nb_of_retries times, after GROUP_RETRY_BACKOFF seconds doubled at each retry (the log file keeps every attempt).
+        Returns the return code of the last attempt (None if the group was not started as the step had failed),
+        the time it took, the resources it used and the number of attempts. Each attempt is given the time limit (in seconds) if given,
+        and one of the core_sets (queue.Queue of lists of core ids) if given, put back once the attempt is over.
+        """
+        group_starting_time = time.time()
+        return_code = None
+        resources = {}
+        nb_of_attempts = 0
+        while (not self.stopping.is_set()):
+            print (cmd)
+            cores = core_sets.get() if core_sets is not None else None
+            try:
+                return_code, resources = self.run_the_command(cmd, group_log_dir, append=(nb_of_attempts > 0), time_limit=time_limit, cores=cores)
+            finally:
+                if (cores is not None):
+                    core_sets.put(cores)
+            nb_of_attempts += 1
+            if (return_code == 0 or self.stopping.is_set()):
+                break
+            if (nb_of_attempts > nb_of_retries):
+                # The group has failed for good: so has the step
+                self.stop_the_groups()
+                break
+            backoff = GROUP_RETRY_BACKOFF * 2**(nb_of_attempts-1)
+            print ("{} failed (return code {}), run again in {} s".format(os.path.basename(group_log_dir), return_code, backoff))
+            # Stop waiting if the step fails meanwhile
+            if (self.stopping.wait(backoff)):
+                break
+        group_ending_time = time.time()
+        return (return_code, group_ending_time - group_starting_time, resources, nb_of_attempts)
+
+    def stop_the_groups(self, reason="step failed"):
+        """ Mark the step as failed so that no group is started anymore and kill the groups running for the given reason.
+        """
+        self.stopping.set()
+        with self.lock:
+            running_processes = list(self.running_processes.items())
+        for running_process, log_file_path in running_processes:
+            self.kill_the_process(running_process, reason, None, log_file_path)
+        return 0
+
+    def run_the_command(self, cmd, log_file_path, append=False, time_limit=None, cores=None):
+        """ Run the command in a subprocess, in a session of its own so that its whole process tree can be killed.
+        Its stderr is read through a pipe, written in the given log file and classified on the fly in log_counters.
+        The subprocess is killed as soon as a fatal line is caught, once it runs for longer than the time limit (in seconds),
+        once it is stalled (see watchdog.py) or once the step is cancelled. The resources used by the subprocess are stacked in resources_reports.
+        If cores (list of core ids) are given, the subprocess is pinned to them and its OMP_NUM_THREADS is their number.
+        The subprocess is run on the event loop of the node if it has one (see run_the_command_on_the_loop).
+        Returns the return code of the subprocess and the resources it used.
+        """
+        if (self.loop is not None):
+            return (asyncio.run_coroutine_threadsafe(self.run_the_command_on_the_loop(cmd, log_file_path, append, time_limit, cores), self.loop).result())
+        running_process = subprocess.Popen(cmd, stderr=subprocess.PIPE, start_new_session=True, **get_the_popen_arguments(cores))
+        pin_the_process(running_process.pid, cores)
+        monitor, process_watchdog = self.watch_the_process(running_process, log_file_path, append, time_limit)
+        monitor.start(running_process.stderr)
+        try:
+            resources = accounting.wait_and_account(running_process, on_sample=lambda sampler: self.check_the_process(running_process, process_watchdog, sampler, log_file_path))
+        except BaseException:
+            # The subprocess must not outlive the wrapper
+            self.kill_the_process(running_process, "interrupted", None, log_file_path)
+            raise
+        monitor.join()
+        with self.lock:
+            del self.running_processes[running_process]
+        self.resources_reports.append(resources)
+        return (running_process.returncode, resources)
+
+    async def run_the_command_on_the_loop(self, cmd, log_file_path, append=False, time_limit=None, cores=None):
+        """ Same as run_the_command, the subprocess being run on the event loop (asyncio.create_subprocess_exec):
+        its stderr is read and its resources are sampled by the loop instead of threads of their own. As the subprocess is
+        reaped by the loop, its user and system CPU times and peak memory come from the samples of its process tree (see accounting.wait_and_account_on_the_loop).
+        """
+        running_process = await asyncio.create_subprocess_exec(
+            *cmd, stderr=asyncio.subprocess.PIPE, start_new_session=True, limit=log_monitor.MAX_LINE_LENGTH, **get_the_popen_arguments(cores)
+            )
+        pin_the_process(running_process.pid, cores)
+        monitor, process_watchdog = self.watch_the_process(running_process, log_file_path, append, time_limit)
+        reading = asyncio.ensure_future(monitor.consume_the_stream(running_process.stderr))
+        try:
+            resources = await accounting.wait_and_account_on_the_loop(running_process, on_sample=lambda sampler: self.check_the_process(running_process, process_watchdog, sampler, log_file_path))
+            await reading
+        except BaseException:
+            # The subprocess must not outlive the wrapper (the coroutine may be cancelled as well)
+            self.kill_the_process(running_process, "interrupted", None, log_file_path)
+            reading.cancel()
+            raise
+        with self.lock:
+            del self.running_processes[running_process]
+        self.resources_reports.append(resources)
+        return (running_process.returncode, resources)
+
+    def watch_the_process(self, running_process, log_file_path, append, time_limit):
+        """ Register the subprocess just started. Returns the LogMonitor which must read its stderr and its Watchdog.
+        """
+        with self.lock:
+            self.running_processes[running_process] = log_file_path
+        # The step may have failed while the subprocess was starting
+        if (self.stopping.is_set()):
+            self.kill_the_process(running_process, "step failed", None, log_file_path)
+        monitor = log_monitor.LogMonitor(
+            log_file_path,
+            self.log_counters,
+            on_fatal=lambda line: self.kill_the_process(running_process, "fatal line", line.strip(), log_file_path),
+            append=append
+            )
+        return (monitor, watchdog.Watchdog(time_limit, self.stall_time, monitor))
+
+    def check_the_process(self, running_process, process_watchdog, sampler, log_file_path):
+        """ Check the subprocess after each sample of its process tree: the step is stopped if it has been cancelled,
+        and the subprocess is killed if its watchdog says so.
+        """
+        if (self.cancel_event is not None and self.cancel_event.is_set()):
+            self.stop_the_groups("cancelled")
+            return 0
+        reason, detail = process_watchdog.check(sampler)
+        if (reason is not None):
+            self.kill_the_process(running_process, reason, detail, log_file_path)
+        return 0
+
+    def kill_the_process(self, running_process, reason, detail, log_file_path=None):
+        """ Kill the process tree of the given subprocess of the step (once) and stack the reason in kills.
+        The tree is sent SIGTERM, then SIGKILL after KILL_GRACE_PERIOD seconds (at once if the wrapper is interrupted or the run cancelled).
+        """
+        with self.lock:
+            if (running_process.returncode is not None or any(kill["pid"] == running_process.pid for kill in self.kills)):
+                return 0
+            self.kills.append({"pid": running_process.pid, "log_file": log_file_path, "reason": reason, "detail": detail, "time": time.time()})
+        print ("{} killed ({}): {}".format(os.path.basename(log_file_path or self.log_dir), reason, detail))
+        kill_the_process_group(running_process.pid, 0 if reason in ("interrupted", "cancelled") else KILL_GRACE_PERIOD)
+        if (self.on_kill is not None):
+            self.on_kill()
+        return 0
+
+    def get_the_group_log_dir(self, range_start):
+        """ Returns the path to the log file of the group starting at the given view.
+        """
+        log_file_path, extension = os.path.splitext(self.log_dir)
+        return ('{}_group_{}{}'.format(log_file_path, range_start, extension))
+
     def add_parameters_to_command_line(self):
         """ Build the parameter part of the command line for a given dictionary of parameters.
-        Ignore the parameter called "groupSize" in order to deal with the DepthMap particular case.
+        Ignore the GROUP_PARAMETERS in order to deal with the steps divided into groups.
         """
         parameters_cmd_line = []
         for key in self.parameters:
-            if (key == "groupSize"):        # DepthMap particular case
+            if (key in GROUP_PARAMETERS or key in RETRY_PARAMETERS):        # Steps divided into groups
                 continue
             else:
                 parameters_cmd_line.append(('--'+key, self.parameters[key]))
@@ -131,82 +519,200 @@ class Node():
         """ Returns a full report on the run node.
         """
         step_sucess, locations_report = self.check_locations_existence_and_step_success()
+        # The outputs of a failed subprocess can not be trusted
+        if (self.return_code is not None and self.return_code != 0):
+            step_sucess = False
         log_report = self.log_report()
         report = {
             "success": step_sucess,
             "log_report": log_report,
             "locations_report": locations_report
         }
+        if (len(self.resources_reports) > 0):
+            report["resources_report"] = accounting.sum_the_reports(self.resources_reports)
+            report["resources_report"]["children_rusage"] = self.children_rusage
+        if (self.groups_report is not None):
+            report["groups_report"] = self.groups_report
+        if (self.groups_plan is not None):
+            report["groups_plan"] = self.groups_plan
+        if (self.cache_report is not None):
+            report["cache_report"] = self.cache_report
+        if (self.incremental_report is not None):
+            report["incremental_report"] = self.incremental_report
+        if (self.return_code is not None):
+            report["return_code"] = self.return_code
+        if (self.cores_report is not None):
+            report["cores_report"] = self.cores_report
+        if (len(self.kills) > 0):
+            report["kills"] = self.kills
         return (report)
 
     def log_report(self):
         """ Returns a dictionary containing a report on the log file of the step.
+        The lines classified while the step was running are used. The log file is read only if the step
+        has not been run by this node (restored from the cache or completed by an interrupted run).
         """
-        # check log.txt file existence and open it if possible
+        # check log.txt file existence
         log_report = {}
         log_file_existence_key = "log_file"
-        try:
-            log_file = open(self.log_dir, "r")
-            log_report[log_file_existence_key] = True
-        except:
-            log_report[log_file_existence_key] = False
-            return (log_report)
-        # Catch informations
-        warning_list = []
-        error_list = []
-        fatal_list = []
-        # debug_list = []
-        for line in log_file:
-            if ("[warning]" in line):
-                warning_list.append(line)
-            if ("[error]" in line):
-                error_list.append(line)
-            if ("[fatal]" in line):
-                fatal_list.append(line)
-            # if ("[debug]" in line):
-                # debug_list.append(line)
-        log_file.close()
+        log_report[log_file_existence_key] = os.path.isfile(self.log_dir)
+        if (self.log_counters is None):
+            if (not log_report[log_file_existence_key]):
+                return (log_report)
+            # Catch informations
+            log_counters = log_monitor.LogCounters()
+            with open(self.log_dir, 'r', errors='replace') as log_file:
+                for line in log_file:
+                    log_counters.classify(line)
+        else:
+            log_counters = self.log_counters
         # Stack information in the log_report
-        log_report["warning"] = warning_list
-        log_report["error"] = error_list
-        log_report["fatal"] = fatal_list
-        # log_report["debug"] = debug_list
+        log_report.update(log_counters.log_report())
 
         return (log_report)
 
-    def check_locations_existence_and_step_success(self):
+    def check_locations_existence_and_step_success(self, ignored_folders=()):
         """ Return a dictionary containing a report on the existence of the input and output files of the step.
-        Deal with the camera_connection particular case which writes .bin files in the prepare_dense_scene folder.
+        The folders are only read until a file is found in them. The locations lying in the ignored_folders
+        (output folders cleaned by the disk manager) are not checked.
+        Deal with the camera_connection particular case which writes .bin files in the prepare_dense_scene folder
+        and with the steps which must write outputs for every view (see verifier.EXPECTED_VIEW_OUTPUTS): the views missing
+        for the steps which may skip views are reported as a warning (see verifier.are_the_missing_views_tolerated).
         """
         step_success = True
         locations_to_check = self.intern_locations
         locations_existence_report = {}
         for key in locations_to_check:
-            if (os.path.isfile(locations_to_check[key])):
+            if (any(cache.is_in_folder(locations_to_check[key], folder) for folder in ignored_folders)):
+                locations_existence_report[locations_to_check[key]] = "Cleaned"
+            elif (os.path.isfile(locations_to_check[key])):
                 locations_existence_report[locations_to_check[key]] = "Found"
             elif (os.path.isdir(locations_to_check[key])):
-                for root, dirs, files in os.walk(locations_to_check[key]):
-                    if (len(files) == 0):
-                        locations_existence_report[locations_to_check[key]] = "Empty"
-                        step_success = False
-                    else:
-                        locations_existence_report[locations_to_check[key]] = "Not empty"
+                if (verifier.find_a_file(locations_to_check[key]) is None):
+                    locations_existence_report[locations_to_check[key]] = "Empty"
+                    step_success = False
+                else:
+                    locations_existence_report[locations_to_check[key]] = "Not empty"
             else:
                 locations_existence_report[locations_to_check[key]] = "No such path"
                 step_success = False
         # camera_connecion particular case
         if (self.name == 'camera_connection'):
             bin_files_existence_key = ".bin_files"
-            bin_files_existence = False
             folder = os.path.split(self.intern_locations["ini"])[0]
-            for root, dirs, files in os.walk(folder):
-                for file in files:
-                    file_path, extension = os.path.splitext(file)
-                    if (extension == '.bin'):
-                        bin_files_existence = True
-            if (bin_files_existence):
+            if (verifier.find_a_file(folder, extension='.bin') is not None):
                 locations_existence_report[bin_files_existence_key] = ".bin files found"
             else:
                 locations_existence_report[bin_files_existence_key] = "No .bin files"
                 step_success = False
+        # Steps writing outputs for every view particular case
+        if (self.name in verifier.EXPECTED_VIEW_OUTPUTS):
+            view_outputs_key = "view_outputs"
+            view_ids = self.get_the_expected_view_ids()
+            missing_views = self.get_the_missing_view_outputs(view_ids)
+            if (missing_views is None):
+                locations_existence_report[view_outputs_key] = "Views unknown"
+                step_success = False
+            elif (len(missing_views) == 0):
+                locations_existence_report[view_outputs_key] = "Found for every view"
+            elif (verifier.are_the_missing_views_tolerated(self.name, len(missing_views), len(view_ids))):
+                locations_existence_report[view_outputs_key] = "Warning: missing for {} views {}".format(
+                    len(missing_views), missing_views[:verifier.MAX_MISSING_VIEWS_REPORTED])
+            else:
+                locations_existence_report[view_outputs_key] = "Missing for {} views {}".format(
+                    len(missing_views), missing_views[:verifier.MAX_MISSING_VIEWS_REPORTED])
+                step_success = False
         return (step_success, locations_existence_report)
+
+    def get_the_expected_view_ids(self):
+        """ Returns the list of the view ids for which the step must write outputs. None if they can not be read.
+            - feature_extraction: every view of the camera_init output,
+            - prepare_dense_scene: every view reconstructed by structure_from_motion,
+            - depth_map and depth_map_filter: every view whose image has been written by prepare_dense_scene.
+        """
+        if (self.name == 'feature_extraction'):
+            return (utils.get_the_view_ids(self.intern_locations["input"]))
+        elif (self.name == 'prepare_dense_scene'):
+            return (utils.get_the_reconstructed_view_ids(self.intern_locations["input"]))
+        else:
+            view_ids = verifier.get_the_view_ids_of_the_images(os.path.split(self.intern_locations["ini"])[0])
+            if (len(view_ids) == 0):
+                return
+            return (view_ids)
+
+    def get_the_missing_view_outputs(self, view_ids=None):
+        """ Returns the list of the view ids for which an output is missing in the output folder of the step.
+        None if the views can not be read. The expected view ids are read if they are not given (see get_the_expected_view_ids).
+        """
+        if (view_ids is None):
+            view_ids = self.get_the_expected_view_ids()
+        if (view_ids is None):
+            return
+        location, patterns = verifier.EXPECTED_VIEW_OUTPUTS[self.name]
+        view_patterns = []
+        for pattern in patterns:
+            if ("{describer_type}" in pattern):
+                for describer_type in self.parameters["describerTypes"].split(','):
+                    view_patterns.append(pattern.replace("{describer_type}", describer_type))
+            else:
+                view_patterns.append(pattern)
+        return (verifier.get_the_missing_view_outputs(self.intern_locations[location], view_ids, view_patterns))
+
+
+def get_the_popen_arguments(cores):
+    """ Returns the arguments given to subprocess.Popen (or asyncio.create_subprocess_exec) to run a subprocess pinned to the
+    given cores (list of core ids, None for no pinning): a matching OMP_NUM_THREADS. The subprocess is pinned once started
+    (see pin_the_process), as a preexec_fn can deadlock in a multithreaded wrapper.
+    """
+    popen_arguments = {}
+    if (cores is not None):
+        popen_arguments["env"] = dict(os.environ, OMP_NUM_THREADS=str(len(cores)))
+    return (popen_arguments)
+
+
+def pin_the_process(process_id, cores):
+    """ Pin every thread of the given process to the given cores (list of core ids, nothing is done if None).
+    The threads it starts afterwards inherit the pinning.
+    """
+    if (cores is None or not hasattr(os, "sched_setaffinity")):
+        return 0
+    try:
+        thread_ids = [int(thread_id) for thread_id in os.listdir('/proc/{}/task'.format(process_id))]
+    except OSError:
+        thread_ids = [process_id]
+    for thread_id in thread_ids:
+        try:
+            os.sched_setaffinity(thread_id, cores)
+        except OSError:
+            # The thread (or the process) is already over
+            continue
+    return 0
+
+
+def kill_the_process_group(process_group_id, grace_period):
+    """ Send SIGTERM to the given process group, then SIGKILL after grace_period seconds (SIGKILL at once if grace_period is 0).
+    """
+
+    def force_the_kill():
+        try:
+            os.killpg(process_group_id, signal.SIGKILL)
+        except OSError:
+            pass
+
+    if (grace_period <= 0):
+        force_the_kill()
+        return 0
+    try:
+        os.killpg(process_group_id, signal.SIGTERM)
+    except OSError:
+        return 0
+    timer = threading.Timer(grace_period, force_the_kill)
+    timer.daemon = True
+    timer.start()
+    return 0
+
+
+def is_divided_into_groups(step_parameters):
+    """ Returns True if the given parameters divide the step into groups of images.
+    """
+    return (any(key in step_parameters for key in GROUP_PARAMETERS))
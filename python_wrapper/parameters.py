@@ -2,6 +2,15 @@ import copy
 
 """ Different bunches of parameters depending on the quality choosen by the user.
 
+A step can be divided into groups of images run as --rangeStart/--rangeSize subprocesses by adding one of these
+parameters to its set (they are not given to the binary):
+    - groupSize: the number of images of each group,
+    - minGroupSize: the step is divided into as many groups as there are available cores, each group containing
+    at least minGroupSize images (FeatureExtraction, FeatureMatching, DepthMapFilter),
+    - adaptiveGroupSize: the size of the groups and the number of groups run at once are planned from the number
+    of images, the downscale factor, the cores and the memory available (DepthMap).
+A failed group is run again on its own up to groupRetries times (DepthMap), which is not given to the binary either.
+
 Values
 ----------
 - MEDIUM
@@ -31,8 +40,7 @@ MEDIUM = {
         "describerPreset": "normal",
         "forceCpuExtraction": str(True),
         "verboseLevel": "debug",
-        "rangeStart": str(-1),
-        "rangeSize": str(1)
+        "minGroupSize": 40
     },
     "image_matching": {
         "tree": '""',
@@ -54,8 +62,7 @@ MEDIUM = {
         "guidedMatching": str(False),
         "exportDebugFiles": str(False),
         "verboseLevel": "debug",
-        "rangeStart": str(-1),
-        "rangeSize": str(0)
+        "minGroupSize": 20
     },
     "structure_from_motion": {
         "describerTypes": "sift",
@@ -99,7 +106,8 @@ MEDIUM = {
         "refineGammaP": str(8.0),
         "refineUseTcOrRcPixSize": str(False),
         "verboseLevel": "debug",
-        "groupSize": 3
+        "adaptiveGroupSize": True,
+        "groupRetries": 2
     },
     "depth_map_filter": {
         "nNearestCams": str(10),
@@ -108,8 +116,7 @@ MEDIUM = {
         "pixSizeBall": str(0),
         "pixSizeBallWithLowSimilarity": str(0),
         "verboseLevel": "debug",
-        "rangeStart": str(-1),
-        "rangeSize": str(-1)
+        "minGroupSize": 10
     },
     "meshing": {
         "maxInputPoints": str(50000000),
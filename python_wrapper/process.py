@@ -1,37 +1,91 @@
-import argparse
 import json
 import os
+import sqlite3
 import time
 
+import cache
+import deadline
 import directions
+import disk_manager
+import history
+import incremental
+import ingest
 import node
 import pipeline_structure
+import scheduler
 import setups
+import streamer
 import utils
+import verifier
+import watchdog
+
+# Default maximum size of the step cache (in GB)
+DEFAULT_CACHE_SIZE = 100
 
 
 def process(binary_folder_direction, input_folder_direction, output_folder_direction,
             quality_choice, output_type_choice, nb_of_images, **kwargs):
-    """ Entry point of the wrapper. Runs the process.
+    """ Entry point of the wrapper. Runs the process, stopping at the first failed step.
 
     Arguments
     ----------
     - binary_folder_direction: path to the folder that contains Meshroom binary files
     - input_folder_direction: path to the folder which contains the input images
     - output_folder_direction: path to the folder where the output will be stacked (must exist)
-    - quality_choice: quality desired. Must be one of DRAFT, MEDIUM, HIGH
+    - quality_choice: quality desired. Must be one of DRAFT, MEDIUM, HIGH (optional with a deadline, deadline.DEADLINE_QUALITY by default)
     - output_type_choice: type of output desired. Must be one of POINT_CLOUD, MESH, FILTERED_MESH, TEXTURED_MESH
-    - nb_of_images: number of input images
+    - nb_of_images: number of input images (optional with the ingest stage, which counts the valid images)
     - kwargs:
         + path_to_results_json_file: path to the results.json file (optional)
         + path_to_metadata_json_file_directory: path to the folder where the metadata.json file will be written (optional)
         + path_to_status_json_file_directory: path to the folder where the status.json file will be written
+        + nb_of_jobs: maximum number of subprocesses run concurrently by a step divided into groups (optional)
+        + path_to_cache_directory: path to the folder where the step cache is stored (optional)
+        + cache_size: maximum size of the step cache in GB (optional)
+        + resume: if True, resume an interrupted run from the status.json and metadata.json files it left (optional)
+        + path_to_feature_store_directory: path to the folder of the feature store used for incremental reconstruction (optional)
+        + resource_budget: an instance of the class ResourceBudget shared with other jobs. Each node waits for its resources before running (optional)
+        + ingest: if False, the input images are given to camera_init without being checked (optional, True by default)
+        + manifest: if True, the size and the checksum of every output file of each step are written in output/manifest/<step>.json (optional)
+        + clean_intermediates: "delete" or "compress". The output folder of a step is deleted or compressed as soon as the last step reading it has succeeded (optional)
+        + keep: names of the steps whose output folder must not be cleaned (optional)
+        + scratch_dir: path to a fast local folder where the high-churn step folders and the log files are written.
+        The log files are streamed back to the output folder as each step ends (optional)
+        + move_results: if True, the files listed in the results.json file are moved out of the output folder instead of being linked or copied (optional)
+        + history_file: path to the SQLite store of the past runs, used to predict the time of the steps and where the run is recorded
+        (optional, no store by default: the predictions use default rates)
+        + plan: if True, only returns (and prints) the predicted time of each step without running anything (optional)
+        + time_limit_factor: ratio of the time limit of each subprocess to its predicted time (optional, no time limit if None or 0)
+        + stall_time: time in minutes after which a subprocess with no output and no CPU time is killed (optional, watchdog.DEFAULT_STALL_TIME by default, no stall detection if 0)
+        + deadline: time given to the run in minutes. The cost parameters of the steps are lowered from the quality chosen
+        until the predicted time fits, and the steps left are planned again when a step overruns (optional, see deadline.py)
+        + status_server: an instance of the class StatusServer serving the status.json and metadata.json documents of the run from memory (optional)
+        + run_name: name of the run on the status server (optional, name of the output folder by default)
+        + loop: asyncio event loop (running in another thread) on which the subprocesses of the steps are run (optional, see api.py)
+        + cancel_event: threading.Event which cancels the run once set: the subprocesses running are killed and the steps left are not run (optional)
+
+    Returns
+    ----------
+    0 if every step succeeded, 1 if the run stopped at a failed step, if it was cancelled, if no valid image was found
+    or if the input folder can not be read
+    (the prediction of the steps with plan).
+    """
+    set_setups, set_directions = get_the_setups_and_directions(binary_folder_direction, input_folder_direction, output_folder_direction,
+                                                               quality_choice, output_type_choice, nb_of_images, **kwargs)
+    return (run_the_process(set_setups, set_directions, **kwargs))
+
+
+def get_the_setups_and_directions(binary_folder_direction, input_folder_direction, output_folder_direction,
+                                  quality_choice, output_type_choice, nb_of_images, **kwargs):
+    """ Returns the setups (instance of the class Setups) and the directions (instance of the class Directions) of a process.
+    See process for the arguments.
     """
     # Set setups
     set_setups = setups.Setups(
         quality_choice,
         output_type_choice,
-        nb_of_images
+        nb_of_images,
+        nb_of_jobs=kwargs.get("nb_of_jobs")
         )
     # Set directions
     set_directions = directions.Directions(
@@ -41,16 +95,87 @@ def process(binary_folder_direction, input_folder_direction, output_folder_direc
         utils.concat_and_normalize_paths(output_folder_direction, 'log'),
         results_dir=kwargs["path_to_results_json_file"],
         metadata_dir=kwargs["path_to_metadata_json_file_directory"],
-        status_dir=kwargs["path_to_status_json_file_directory"]
+        status_dir=kwargs["path_to_status_json_file_directory"],
+        scratch_dir=kwargs.get("scratch_dir")
         )
+    return (set_setups, set_directions)
+
+
+def run_the_process(set_setups, set_directions, **kwargs):
+    """ Runs the process with the given setups (instance of the class Setups) and directions (instance of the class Directions),
+    stopping at the first failed step. See process for the kwargs and the value returned.
+    """
+    process_starting_time = time.time()
+    if (set_setups.quality is None and kwargs.get("deadline") is not None):
+        set_setups.quality = deadline.DEADLINE_QUALITY
     # Set pipeline structure
     structure = pipeline_structure.get_the_pipeline_structure(
         set_setups.quality,
         set_setups.output_type
         )
 
+    # Set the store of the past runs and the cost model
+    run_history = None
+    if (kwargs.get("history_file") is not None):
+        try:
+            run_history = history.RunHistory(kwargs["history_file"])
+        except (OSError, sqlite3.Error) as error:
+            print ("The run history can not be used: {}".format(error))
+    cost_model = history.CostModel(run_history)
+
+    # Dry run: predict the time of each step
+    if (kwargs.get("plan", False)):
+        if (set_setups.nb_of_images is None):
+            set_setups.nb_of_images = ingest.count_the_images(set_directions.input_dir)
+        planned_pipeline = build_the_pipeline(set_setups, set_directions, structure, {})
+        if (kwargs.get("deadline") is not None):
+            deadline_planner = deadline.DeadlinePlanner(cost_model, process_starting_time + kwargs["deadline"] * 60)
+            prediction = deadline_planner.plan(planned_pipeline)
+            prediction["deadline_report"] = deadline_planner.report()
+        else:
+            prediction = cost_model.predict_the_pipeline(planned_pipeline)
+        print (json.dumps(prediction, indent=4))
+        return (prediction)
+
+    # Set the step cache
+    step_cache = None
+    if (kwargs.get("path_to_cache_directory") is not None):
+        step_cache = cache.StepCache(
+            kwargs["path_to_cache_directory"],
+            int(kwargs.get("cache_size", DEFAULT_CACHE_SIZE) * 1024**3),
+            run_roots={"output": set_directions.output_dir, "scratch": set_directions.scratch_dir, "input": set_directions.input_dir}
+            )
+
+    # Set the feature store
+    feature_store = None
+    if (kwargs.get("path_to_feature_store_directory") is not None):
+        feature_store = incremental.FeatureStore(kwargs["path_to_feature_store_directory"])
+
     # Create the log folder to stack the log files
     utils.create_folder(set_directions.log_dir)
+    # Stream the log files written in the scratch folder back to the log folder
+    log_streamer = None
+    if (set_directions.scratch_dir is not None):
+        os.makedirs(set_directions.working_log_dir, exist_ok=True)
+        log_streamer = streamer.Streamer()
+
+    # Read the status.json and metadata.json files of the interrupted run
+    previous_status_dict = {}
+    previous_metadata_dict = {}
+    if (kwargs.get("resume", False)):
+        previous_status_dict = utils.read_json_file(set_directions.status_file)
+        previous_metadata_dict = utils.read_json_file(set_directions.metadata_file)
+    else:
+        # A new run starts new event logs, a resumed run appends to the logs of the interrupted run
+        utils.remove_json_event_logs(set_directions.status_file, set_directions.metadata_file)
+
+    # Serve the status.json and metadata.json documents as they are written
+    served_run_name = None
+    if (kwargs.get("status_server") is not None):
+        served_run_name = kwargs["status_server"].add_the_run(
+            kwargs.get("run_name") or os.path.basename(os.path.normpath(set_directions.output_dir)),
+            {"status": set_directions.status_file, "metadata": set_directions.metadata_file}
+            )
 
     # Initialise the status.json file
     status_dict = {}
@@ -63,40 +188,254 @@ def process(binary_folder_direction, input_folder_direction, output_folder_direc
         }
     utils.update_json_file(set_directions.metadata_file, metadata_dict)
 
+    # Check the input images and count them
+    if (kwargs.get("ingest", True)):
+        ingest_report = run_under_the_budget(
+            kwargs.get("resource_budget"), "ingest", set_setups.nb_of_jobs,
+            lambda nb_of_workers: run_the_ingest_stage(set_setups, set_directions, status_dict, metadata_dict, nb_of_workers)
+            )
+        if (not ingest_report["success"]):
+            metadata_dict["global_report"]["failed_step"] = "ingest"
+            metadata_dict["global_report"]["failure_reason"] = status_dict["ingest"]["reason"]
+            utils.update_json_file(set_directions.metadata_file, metadata_dict)
+            print ("The ingest of {} failed ({})".format(set_directions.input_dir, status_dict["ingest"]["reason"]))
+            utils.close_json_files(set_directions.status_file, set_directions.metadata_file)
+            if (served_run_name is not None):
+                kwargs["status_server"].close_the_run(served_run_name)
+            return 1
+
     # Build the pipeline
     pipeline = build_the_pipeline(set_setups, set_directions, structure, status_dict)
 
-    # Run the process
-    global_starting_time = time.time()
+    # Set the disk manager
+    set_disk_manager = disk_manager.DiskManager(pipeline, set_directions.output_dir, keep=kwargs.get("keep"), method=kwargs.get("clean_intermediates"),
+                                                scratch_dir=set_directions.scratch_dir)
+
+    # Set the time limits and the stall detection of the subprocesses
+    stall_time = kwargs.get("stall_time", watchdog.DEFAULT_STALL_TIME)
     for node in pipeline:
+        node.time_limit_factor = kwargs.get("time_limit_factor")
+        node.stall_time = stall_time * 60 if stall_time else None
+        node.loop = kwargs.get("loop")
+        node.cancel_event = kwargs.get("cancel_event")
+
+    # Skip the steps already completed by the interrupted run
+    resume_point = 0
+    partially_completed_node = None
+    previous_settings = {}
+    if (kwargs.get("resume", False)):
+        set_disk_manager.mark_the_cleaned_steps(previous_status_dict)
+        resume_point = get_the_resume_point(pipeline, previous_status_dict)
+        for node in pipeline[:resume_point]:
+            status_dict[node.name] = previous_status_dict[node.name]
+            metadata_dict["step_by_step_report"][node.name] = previous_metadata_dict.get("step_by_step_report", {}).get(node.name, {})
+            metadata_dict["step_by_step_report"][node.name]["resumed"] = True
+        if (resume_point < len(pipeline)):
+            # Groups already completed by the first incomplete step
+            first_incomplete_node = pipeline[resume_point]
+            previous_node_status = previous_status_dict.get(first_incomplete_node.name, {})
+            first_incomplete_node.completed_groups = [tuple(group) for group in previous_node_status.get("completed_groups", [])]
+            if (len(first_incomplete_node.completed_groups) > 0):
+                # Its groups left must be run with the parameters of its completed groups, the ones of the last plan of the interrupted run
+                partially_completed_node = first_incomplete_node
+                previous_plans = previous_metadata_dict.get("global_report", {}).get("deadline_report", {}).get("plans", [])
+                previous_settings = previous_plans[-1]["settings"] if len(previous_plans) > 0 else {}
+            metadata_dict["global_report"]["resumed_from"] = first_incomplete_node.name
+        utils.update_json_file(set_directions.status_file, status_dict)
+        utils.update_json_file(set_directions.metadata_file, metadata_dict)
+
+    # Predict the time of the steps left, choosing their parameters if a deadline is given
+    deadline_planner = None
+    if (kwargs.get("deadline") is not None):
+        deadline_planner = deadline.DeadlinePlanner(cost_model, process_starting_time + kwargs["deadline"] * 60)
+        if (partially_completed_node is not None):
+            deadline_planner.freeze(partially_completed_node, previous_settings)
+        prediction = deadline_planner.plan(pipeline[resume_point:])
+        metadata_dict["global_report"]["deadline_report"] = deadline_planner.report()
+    else:
+        if (partially_completed_node is not None):
+            for step_name, parameter, values in deadline.KNOBS:
+                setting = "{}.{}".format(step_name, parameter)
+                if (step_name == partially_completed_node.name and setting in previous_settings):
+                    deadline.set_the_knob(partially_completed_node, parameter, previous_settings[setting])
+        prediction = cost_model.predict_the_pipeline(pipeline[resume_point:])
+    metadata_dict["global_report"]["prediction"] = prediction
+
+    # Run the process, stopping at the first failed step
+    global_starting_time = time.time()
+    failed_step = None
+    for node_iter, node in enumerate(pipeline[resume_point:]):
+        # The run may have been cancelled since the last step
+        if (kwargs.get("cancel_event") is not None and kwargs["cancel_event"].is_set()):
+            failed_step = node.name
+            status_dict[node.name] = {"status": "cancelled", "progress": 0}
+            metadata_dict["global_report"]["failed_step"] = failed_step
+            metadata_dict["global_report"]["failure_reason"] = "cancelled"
+            utils.update_json_file(set_directions.metadata_file, metadata_dict)
+            print ("The run is cancelled, the steps left are not run")
+            break
         # Run the step
         step_starting_time = time.time()
-        node.run_the_node(set_directions.status_file, status_dict)
+        status_dict["eta"] = history.get_the_eta(prediction, pipeline[resume_point:], node_iter, step_starting_time)
+        utils.update_json_file(set_directions.status_file, status_dict)
+        # The eta of the run follows the progress measured on the step
+        node.predicted_time = prediction["steps"][node.name]["predicted_time"]
+        node.on_progress = lambda step_remaining_time: status_dict.update(
+            eta=history.get_the_eta(prediction, pipeline[resume_point:], node_iter, step_starting_time, step_remaining_time)
+            )
+        if (feature_store is not None):
+            feature_store.prepare_the_node(node)
+        if (kwargs.get("resource_budget") is not None):
+            status_dict[node.name] = {"status": "waiting for resources", "progress": 0}
+            utils.update_json_file(set_directions.status_file, status_dict)
+            memory_demand = None
+            if (node.parameters.get("adaptiveGroupSize", False)):
+                # The groups are planned on the cores and the whole memory of the budget, and the memory of the plan is reserved
+                nb_of_cores, budget_memory = kwargs["resource_budget"].get_the_demand(node.name)
+                memory_demand = scheduler.get_the_planned_memory(history.get_the_nb_of_views(node), float(node.parameters["downscale"]),
+                                                                 min(node.nb_of_jobs, nb_of_cores), kwargs["resource_budget"].memory)
+            with kwargs["resource_budget"].reserve(node.name, memory_demand) as (cores, memory):
+                node.nb_of_jobs = min(node.nb_of_jobs, len(cores))
+                node.core_ids = cores
+                node.available_memory = memory
+                node.run_the_node(set_directions.status_file, status_dict, step_cache=step_cache)
+        else:
+            node.run_the_node(set_directions.status_file, status_dict, step_cache=step_cache)
         step_ending_time = time.time()
         # Stack metadata
         report = node.report()
+        if (feature_store is not None and report["success"]):
+            feature_store.update_the_store(node)
+            report = node.report()
+        # Sizes and checksums of the outputs
+        if (kwargs.get("manifest", False) and report["success"]):
+            report["manifest_report"] = run_under_the_budget(
+                kwargs.get("resource_budget"), "manifest", node.nb_of_jobs,
+                lambda nb_of_workers: verifier.write_the_manifest(
+                    node.output_folder,
+                    utils.concat_and_normalize_paths(set_directions.output_dir, 'manifest', node.name + '.json'),
+                    nb_of_workers
+                    )
+                )
         metadata_dict["step_by_step_report"][node.name] = {
             "time_taken": step_ending_time - step_starting_time,
             "report": report
             }
+        # Plan the steps left again if the step overran
+        if (deadline_planner is not None and deadline_planner.node_done(node, prediction["steps"][node.name]["predicted_time"], step_ending_time - step_starting_time)):
+            remaining_pipeline = pipeline[resume_point + node_iter + 1:]
+            if (len(remaining_pipeline) > 0):
+                prediction["steps"].update(deadline_planner.plan(remaining_pipeline, after=node.name)["steps"])
+                prediction["total"] = sum(step_prediction["predicted_time"] for step_prediction in prediction["steps"].values())
         utils.update_json_file(set_directions.metadata_file, metadata_dict)
+        # Clean the outputs which are not read anymore
+        set_disk_manager.node_done(node, report["success"], set_directions.status_file, status_dict)
+        if (log_streamer is not None and os.path.isfile(node.log_dir)):
+            log_streamer.stream(node.log_dir, utils.concat_and_normalize_paths(set_directions.log_dir, os.path.basename(node.log_dir)))
+        if (not report["success"]):
+            failed_step = node.name
+            status_dict[node.name]["reason"] = get_the_failure_reason(report)
+            status_dict[node.name]["status"] = "cancelled" if status_dict[node.name]["reason"] == "cancelled" else "failed"
+            metadata_dict["global_report"]["failed_step"] = failed_step
+            metadata_dict["global_report"]["failure_reason"] = status_dict[node.name]["reason"]
+            utils.update_json_file(set_directions.metadata_file, metadata_dict)
+            print ("{} failed ({}), the steps left are not run".format(failed_step, status_dict[node.name]["reason"]))
+            break
     global_ending_time = time.time()
+    status_dict["eta"] = history.get_the_eta(prediction, pipeline[resume_point:], len(pipeline[resume_point:]), global_ending_time)
+    utils.update_json_file(set_directions.status_file, status_dict)
     metadata_dict["global_report"]["time_taken"] = global_ending_time - global_starting_time
+    metadata_dict["global_report"]["disk_report"] = set_disk_manager.close()
+    if (log_streamer is not None):
+        metadata_dict["global_report"]["streaming_report"] = log_streamer.close()
     utils.update_json_file(set_directions.metadata_file, metadata_dict)
 
+    if (deadline_planner is not None):
+        metadata_dict["global_report"]["deadline_report"]["met"] = (time.time() <= deadline_planner.deadline)
+        utils.update_json_file(set_directions.metadata_file, metadata_dict)
+
+    # Record the run for the next predictions
+    if (run_history is not None):
+        try:
+            run_history.record_the_run(set_setups, pipeline, metadata_dict, global_starting_time)
+        except sqlite3.Error as error:
+            print ("The run can not be recorded in the run history: {}".format(error))
+
     # Renaming and moving files to fit the given results.json file
     try:
         metadata_dict["global_report"]["results.json_file"] = True
-        metadata_dict["global_report"]["output_file_report"] = utils.fitting_the_json_results_file(set_directions)
+        metadata_dict["global_report"]["output_file_report"] = utils.fitting_the_json_results_file(set_directions, keep_sources=not kwargs.get("move_results", False))
     except:
         metadata_dict["global_report"]["results.json_file"] = False
         metadata_dict["global_report"]["output_file_report"] = utils.output_file_report(set_directions.get_the_process_directions())
 
     utils.update_json_file(set_directions.metadata_file, metadata_dict)
+    utils.close_json_files(set_directions.status_file, set_directions.metadata_file)
+    if (served_run_name is not None):
+        kwargs["status_server"].close_the_run(served_run_name)
 
+    if (failed_step is not None):
+        return 1
     return 0
 
 
+def run_under_the_budget(resource_budget, stage_name, nb_of_workers, function):
+    """ Returns function(nb_of_workers) for a stage run by the wrapper itself with a pool of nb_of_workers workers.
+    If a resource budget (instance of the class ResourceBudget) is given, the stage waits for its resources and the
+    number of workers is limited to the cores reserved.
+    """
+    if (resource_budget is None):
+        return (function(nb_of_workers))
+    with resource_budget.reserve(stage_name) as (cores, memory):
+        return (function(max(1, min(nb_of_workers, len(cores)))))
+
+
+def run_the_ingest_stage(setups, directions, status_dict, metadata_dict, nb_of_workers=None):
+    """ Check the input images, link the valid ones into the images folder given to camera_init and set the number of images.
+    The ingest stage is reported in the status.json and metadata.json files as a step.
+
+    Arguments
+    ----------
+    - setups: an instance of the class Setups
+    - directions: an instance of the class Directions
+    - status_dict: python dictionary representing the status.json file
+    - metadata_dict: python dictionary representing the metadata.json file
+    - nb_of_workers: number of threads checking the images (optional, setups.nb_of_jobs by default)
+
+    Returns
+    ----------
+    The report of the ingest stage (see ingest.ingest_the_images)
+    """
+    status_dict["ingest"] = {"status": "in progress", "progress": 0}
+    utils.update_json_file(directions.status_file, status_dict)
+
+    def update_the_progress(nb_of_checked_files, nb_of_files):
+        status_dict["ingest"]["progress"] = (nb_of_checked_files/nb_of_files)*100
+        utils.update_json_file(directions.status_file, status_dict)
+
+    starting_time = time.time()
+    images_dir = utils.concat_and_normalize_paths(directions.output_dir, 'ingest', 'images')
+    report = ingest.ingest_the_images(directions.input_dir, images_dir, nb_of_workers or setups.nb_of_jobs, on_progress=update_the_progress)
+    ending_time = time.time()
+    report["given_nb_of_images"] = setups.nb_of_images
+    if (setups.nb_of_images is not None and setups.nb_of_images != report["nb_of_images"]):
+        print ("{} images given, {} valid images found".format(setups.nb_of_images, report["nb_of_images"]))
+    directions.images_dir = images_dir
+    setups.nb_of_images = report["nb_of_images"]
+
+    if (report["success"]):
+        status_dict["ingest"] = {"status": "done", "progress": 100}
+    else:
+        status_dict["ingest"] = {"status": "failed", "progress": 100, "reason": report.get("error", "no valid image")}
+    utils.update_json_file(directions.status_file, status_dict)
+    metadata_dict["step_by_step_report"]["ingest"] = {
+        "time_taken": ending_time - starting_time,
+        "report": report
+        }
+    utils.update_json_file(directions.metadata_file, metadata_dict)
+    return (report)
+
+
 def build_the_pipeline(setups, directions, structure, status_dict):
     """ Build the pipeline to run as a list of nodes.
 
@@ -118,32 +457,47 @@ def build_the_pipeline(setups, directions, structure, status_dict):
     for step_number in range(1, len(structure)+1):
         step_name = structure[step_number]
         node_to_add = node.Node(step_name, directions.get_the_process_directions(),
-                                directions.log_dir, setups)
+                                directions.working_log_dir, setups)
         nodes_list.append(node_to_add)
     return (nodes_list)
 
 
-parser = argparse.ArgumentParser(description='Launch alicevision pipeline.')
-parser.add_argument('--bin', metavar='FOLDER', type=str, required=True,
-                    help='Folder which contains Meshroom executable files.')
-parser.add_argument('--input', metavar='FOLDER', type=str, required=True,
-                    help='Input folder.')
-parser.add_argument('--output', metavar='FOLDER', type=str, required=True,
-                    help='Output folder.')
-parser.add_argument('--quality', type=str, required=True,
-                    help='Quality desired. Possible values: DRAFT, MEDIUM, HIGH.')
-parser.add_argument('--outputType', type=str, required=True,
-                    help='Output desired. Possible values: POINT_CLOUD, MESH, FILTERED_MESH, TEXTURED_MESH.')
-parser.add_argument('--nbOfImages', type=int, required=True, help='Number of input pictures.')
-parser.add_argument('--results', metavar='JSON FILE', type=str, required=False,
-                    help='results.json file address if given.')
-parser.add_argument('--metadata', metavar='FOLDER', type=str, required=False,
-                    help='Folder where to write the metadata.json file if wanted. Gives a live report of the running process.')
-parser.add_argument('--status', metavar='FOLDER', type=str, required=True,
-                    help='Folder where to write the status.json file. It gives a live report of the process flow')
-
-args = parser.parse_args()
-
-process(args.bin, args.input, args.output, args.quality, args.outputType, args.nbOfImages,
-        path_to_results_json_file=args.results, path_to_metadata_json_file_directory=args.metadata,
-        path_to_status_json_file_directory=args.status)
+def get_the_resume_point(pipeline, previous_status_dict):
+    """ Returns the index of the first node of the pipeline which has not been completed by the interrupted run.
+    A node is completed if the previous status.json file says so and if its outputs can still be found
+    (or if they have been cleaned by the disk manager, every step reading them being completed then).
+
+    Arguments
+    ----------
+    - pipeline: a list of nodes (instances of the class Node)
+    - previous_status_dict: python dictionary representing the status.json file of the interrupted run
+    """
+    cleaned_folders = [node.output_folder for node in pipeline if previous_status_dict.get(node.name, {}).get("cleaned") is not None]
+    for node_iter, node in enumerate(pipeline):
+        previous_node_status = previous_status_dict.get(node.name, {})
+        if (previous_node_status.get("status") != "done"):
+            return (node_iter)
+        if (previous_node_status.get("cleaned") is not None):
+            continue
+        step_success, locations_report = node.check_locations_existence_and_step_success(ignored_folders=cleaned_folders)
+        if (not step_success):
+            return (node_iter)
+    return (len(pipeline))
+
+
+def get_the_failure_reason(report):
+    """ Returns why the step of the given report failed: the reason of the first subprocess killed (but the ones killed
+    because another group failed), else its return code, else its missing outputs.
+    """
+    for kill in report.get("kills", []):
+        if (kill["reason"] != "step failed"):
+            return ("{}: {}".format(kill["reason"], kill["detail"]) if kill["detail"] else kill["reason"])
+    if (report.get("return_code", 0) != 0):
+        return ("return code {}".format(report["return_code"]))
+    return ("missing outputs")
+
+
+if __name__ == '__main__':
+    # The command line lives in api.py (which imports this module), it is kept here for the existing invocations
+    import api
+    api.run_the_command_line()
@@ -0,0 +1,167 @@
+import threading
+import time
+
+import verifier
+
+""" Live progress and remaining time of the step running.
+
+While a step runs, its progress is measured every PROGRESS_INTERVAL seconds from the first source available:
+    - outputs: the views whose outputs are all in the output folder, for the steps which write outputs for every view
+    (see verifier.EXPECTED_VIEW_OUTPUTS),
+    - groups: the groups completed, for the other steps divided into groups,
+    - log: the last progress line of the log ("12%", "(120/1000)", see log_monitor.get_the_log_progress), for the other steps,
+    - prediction: the time elapsed over the time predicted for the step, if none of the above is available.
+The progress never goes backward. The remaining time is measured from the rate of progress since the first measure,
+weighted against the time predicted for the step in proportion to the work seen so far, and smoothed
+(exponential moving average of a countdown) so that it does not jump at each measure.
+
+Values
+----------
+- PROGRESS_INTERVAL: time between two measures of the progress (in seconds)
+- SMOOTHING: weight of the last measure in the moving average of the remaining time
+- MAX_MEASURED_PROGRESS: maximum progress given while the step runs (in percent)
+- MAX_PREDICTED_PROGRESS: maximum progress given while the step runs when it is derived from the predicted time only (in percent)
+"""
+
+PROGRESS_INTERVAL = 5
+SMOOTHING = 0.3
+MAX_MEASURED_PROGRESS = 99
+MAX_PREDICTED_PROGRESS = 95
+
+
+class ProgressTracker():
+    """ An instance of the class ProgressTracker measures the progress of a running step in a background thread.
+
+    Building arguments
+    ----------
+    - node: the instance of the class Node running
+    - on_update: function called at each measure with the progress (in percent), the remaining time (in seconds, None if unknown)
+    and the source of the progress
+    - predicted_time: time predicted for the step (in seconds, None if unknown)
+    - interval: time between two measures (in seconds)
+
+    Attributes
+    ----------
+    - node: the instance of the class Node running
+    - on_update: function called at each measure
+    - predicted_time: time predicted for the step
+    - interval: time between two measures
+    - starting_time: time when the tracker was started
+    - view_ids: view ids for which the step must write outputs (read at the first measure, None if they can not be read)
+    - first_measure: first fraction measured and the time it was measured at. Format: (fraction, time)
+    - fraction: progress of the step (from 0 to 1)
+    - source: source of the last measure. One of "outputs", "groups", "log", "prediction"
+    - remaining_time: smoothed remaining time (None until it can be estimated)
+    - last_update_time: time of the last measure
+    - lock: threading.Lock making the measures sequential
+    - stopping: threading.Event set when the tracker is stopped
+    - thread: background thread measuring the progress
+    """
+
+    def __init__(self, node, on_update, predicted_time=None, interval=PROGRESS_INTERVAL):
+        self.node = node
+        self.on_update = on_update
+        self.predicted_time = predicted_time
+        self.interval = interval
+        self.starting_time = None
+        self.view_ids = None
+        self.first_measure = None
+        self.fraction = 0
+        self.source = None
+        self.remaining_time = None
+        self.last_update_time = None
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.thread = None
+
+    def start(self):
+        """ Take a first measure and start measuring the progress in a background thread.
+        """
+        self.starting_time = time.time()
+        if (self.node.name in verifier.EXPECTED_VIEW_OUTPUTS):
+            self.view_ids = self.node.get_the_expected_view_ids()
+        self.update()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        return 0
+
+    def run(self):
+        """ Loop of the background thread: measure the progress every interval seconds until stop is called.
+        """
+        while (not self.stopping.wait(self.interval)):
+            self.update()
+
+    def stop(self):
+        """ Stop the background thread.
+        """
+        self.stopping.set()
+        if (self.thread is not None):
+            self.thread.join()
+        return 0
+
+    def measure(self):
+        """ Returns the fraction of the step done (from 0 to 1) and its source (None, None if it can not be measured).
+        """
+        if (self.view_ids is not None and len(self.view_ids) > 0):
+            missing_views = self.node.get_the_missing_view_outputs(self.view_ids)
+            return (1 - len(missing_views) / len(self.view_ids), "outputs")
+        groups_report = self.node.groups_report
+        if (groups_report is not None and self.node.groups_plan is not None):
+            nb_of_completed_groups = len(self.node.completed_groups)
+            nb_of_groups = nb_of_completed_groups + self.node.groups_plan["nb_of_groups"]
+            return ((nb_of_completed_groups + len(groups_report)) / max(1, nb_of_groups), "groups")
+        if (self.node.log_counters is not None and self.node.log_counters.progress is not None):
+            return (self.node.log_counters.progress, "log")
+        return (None, None)
+
+    def update(self):
+        """ Measure the progress, update the remaining time and call on_update.
+        """
+        with self.lock:
+            current_time = time.time()
+            elapsed_time = current_time - self.starting_time
+            fraction, source = self.measure()
+            if (fraction is None):
+                # Only the predicted time is known
+                self.source = "prediction"
+                if (self.predicted_time is None or self.predicted_time <= 0):
+                    self.on_update(0, None, self.source)
+                    return 0
+                progress = min(MAX_PREDICTED_PROGRESS, 100 * elapsed_time / self.predicted_time)
+                self.remaining_time = max(0, self.predicted_time - elapsed_time)
+                self.last_update_time = current_time
+                self.on_update(progress, self.remaining_time, self.source)
+                return 0
+
+            self.source = source
+            self.fraction = max(self.fraction, min(1, fraction))
+            if (self.first_measure is None):
+                # The outputs and groups already there (resumed run) were not done at the rate of this run,
+                # whereas the progress lines of the log start with the subprocess
+                self.first_measure = (0, self.starting_time) if source == "log" else (self.fraction, current_time)
+            first_fraction, first_time = self.first_measure
+            # Remaining time at the rate measured since the first measure
+            measured_remaining_time = None
+            if (self.fraction > first_fraction):
+                measured_remaining_time = (1 - self.fraction) * (current_time - first_time) / (self.fraction - first_fraction)
+            # Remaining time at the predicted rate
+            predicted_remaining_time = None
+            if (self.predicted_time is not None):
+                predicted_remaining_time = (1 - self.fraction) * self.predicted_time
+            if (measured_remaining_time is None):
+                remaining_time = predicted_remaining_time
+            elif (predicted_remaining_time is None):
+                remaining_time = measured_remaining_time
+            else:
+                # The measured rate is trusted as the work seen grows
+                weight = (self.fraction - first_fraction) / max(1e-6, 1 - first_fraction)
+                remaining_time = weight * measured_remaining_time + (1 - weight) * predicted_remaining_time
+            if (remaining_time is not None):
+                if (self.remaining_time is None):
+                    self.remaining_time = remaining_time
+                else:
+                    countdown = max(0, self.remaining_time - (current_time - self.last_update_time))
+                    self.remaining_time = (1 - SMOOTHING) * countdown + SMOOTHING * remaining_time
+            self.last_update_time = current_time
+            self.on_update(min(MAX_MEASURED_PROGRESS, 100 * self.fraction), self.remaining_time, self.source)
+        return 0
@@ -0,0 +1,211 @@
+import contextlib
+import math
+import os
+import threading
+
+import utils
+
+""" Resources needed by each step and global budget shared by the jobs run on the same host.
+
+Values
+----------
+- SINGLE_THREADED_STEPS: steps which only use one core
+- STEP_MEMORY: memory needed by each step and by the stages run by the wrapper itself (ingest, manifest) (in GB). Rough estimates for a few hundred images. The memory needed by the
+steps whose groups are planned from the memory (DepthMap) is computed from their plan instead (see get_the_planned_memory)
+- DEPTH_MAP_BASE_MEMORY, DEPTH_MAP_FULL_RESOLUTION_MEMORY: memory needed by a DepthMap subprocess (in GB),
+which is DEPTH_MAP_BASE_MEMORY + DEPTH_MAP_FULL_RESOLUTION_MEMORY / downscale^2
+- DEPTH_MAP_FULL_RESOLUTION_VIEW_TIME: time taken by DepthMap on one view (in seconds), divided by downscale^2 as well
+- TARGET_GROUP_TIME: time a group should take (in seconds), long enough to make the startup of the subprocess negligible
+- GROUPS_PER_JOB: minimum number of groups per concurrent subprocess, so that the last groups do not leave cores idle
+
+The subprocesses are pinned to the cores planned for them (see get_the_step_cores and split_the_cores) and their
+OMP_NUM_THREADS is the number of these cores, so that concurrent subprocesses do not oversubscribe the cores.
+"""
+
+SINGLE_THREADED_STEPS = [
+    "camera_init",
+    "image_matching",
+    "prepare_dense_scene",
+    "camera_connection"
+]
+
+STEP_MEMORY = {
+    "ingest": 1,
+    "manifest": 0.5,
+    "camera_init": 0.5,
+    "feature_extraction": 2,
+    "image_matching": 1,
+    "feature_matching": 2,
+    "structure_from_motion": 4,
+    "prepare_dense_scene": 1,
+    "camera_connection": 1,
+    "depth_map": 4,
+    "depth_map_filter": 4,
+    "meshing": 8,
+    "mesh_filtering": 2,
+    "texturing": 8
+}
+
+DEPTH_MAP_BASE_MEMORY = 0.5
+DEPTH_MAP_FULL_RESOLUTION_MEMORY = 8
+DEPTH_MAP_FULL_RESOLUTION_VIEW_TIME = 120
+TARGET_GROUP_TIME = 60
+GROUPS_PER_JOB = 2
+
+
+class ResourceBudget():
+    """ An instance of the class ResourceBudget represents the cores and memory shared by the nodes of several jobs.
+    A node waits until the resources it needs are available before running.
+    The steps which are not single-threaded get every core of the budget but one (when there are more than one),
+    so that a single-threaded step of another job can always run beside them.
+    The cores are reserved by id, so that the subprocesses of the jobs are pinned to different cores. If the budget
+    has more cores than the wrapper can run on, the ids are given in turn (core_ids[i % number of cores]).
+
+    Building arguments
+    ----------
+    - nb_of_cores: number of cores of the budget (number of available cores by default)
+    - memory: memory of the budget in GB (available memory by default)
+
+    Attributes
+    ----------
+    - nb_of_cores: number of cores of the budget
+    - memory: memory of the budget in GB
+    - core_ids: id of each core of the budget
+    - free_cores: indices of the cores of the budget not reserved
+    - free_memory: memory not reserved in GB
+    - condition: threading.Condition used to wait for resources
+    """
+
+    def __init__(self, nb_of_cores=None, memory=None):
+        self.nb_of_cores = nb_of_cores or utils.get_the_number_of_cores()
+        self.memory = memory or utils.get_the_available_memory()
+        available_cores = get_the_available_cores()
+        self.core_ids = [available_cores[core_iter % len(available_cores)] for core_iter in range(self.nb_of_cores)]
+        self.free_cores = set(range(self.nb_of_cores))
+        self.free_memory = self.memory
+        self.condition = threading.Condition()
+
+    def get_the_demand(self, step_name, memory=None):
+        """ Returns the resources needed by the given step: (number of cores, memory in GB).
+        The memory is the one of STEP_MEMORY unless it is given. The demand never exceeds the budget.
+        """
+        if (step_name in SINGLE_THREADED_STEPS):
+            nb_of_cores = 1
+        else:
+            nb_of_cores = max(1, self.nb_of_cores - 1)
+        if (memory is None):
+            memory = STEP_MEMORY.get(step_name, 1)
+        memory = min(memory, self.memory)
+        return (nb_of_cores, memory)
+
+    @contextlib.contextmanager
+    def reserve(self, step_name, memory=None):
+        """ Wait until the resources needed by the given step are available and reserve them while the step runs.
+        The memory needed is the one of STEP_MEMORY unless it is given (see get_the_planned_memory).
+        Yields the ids of the cores reserved (sorted, without duplicates) and the memory (in GB) reserved.
+        """
+        nb_of_cores, memory = self.get_the_demand(step_name, memory)
+        with self.condition:
+            while (len(self.free_cores) < nb_of_cores or self.free_memory < memory):
+                self.condition.wait()
+            cores = sorted(self.free_cores)[:nb_of_cores]
+            self.free_cores.difference_update(cores)
+            self.free_memory -= memory
+        try:
+            yield (sorted(set(self.core_ids[core] for core in cores)), memory)
+        finally:
+            with self.condition:
+                self.free_cores.update(cores)
+                self.free_memory += memory
+                self.condition.notify_all()
+
+
+def plan_the_depth_map_groups(nb_of_views, downscale, nb_of_jobs, memory):
+    """ Returns the size of the groups of DepthMap and the number of groups to run at once.
+
+    Arguments
+    ----------
+    - nb_of_views: number of views to process
+    - downscale: downscale factor of the images during DepthMap
+    - nb_of_jobs: maximum number of concurrent subprocesses allowed by the cores
+    - memory: memory available for the subprocesses (in GB)
+
+    Returns
+    ----------
+    A dictionary. Format:
+    {
+        "group_size": ..., "nb_of_groups": ..., "nb_of_jobs": ..., "limited_by": "cores" | "memory" | "groups",
+        "nb_of_views": ..., "downscale": ..., "available_cores": ..., "available_memory": ..., "memory_per_process": ..., "estimated_view_time": ...
+    }
+    """
+    memory_per_process = DEPTH_MAP_BASE_MEMORY + DEPTH_MAP_FULL_RESOLUTION_MEMORY / downscale**2
+    view_time = DEPTH_MAP_FULL_RESOLUTION_VIEW_TIME / downscale**2
+    nb_of_jobs = max(1, nb_of_jobs)
+    nb_of_jobs_in_memory = max(1, int(memory // memory_per_process))
+    max_nb_of_jobs = min(nb_of_jobs, nb_of_jobs_in_memory)
+    # Groups long enough to hide the startup of the subprocesses, but numerous enough to keep every job busy
+    group_size = max(1, int(math.ceil(TARGET_GROUP_TIME / view_time)))
+    group_size = min(group_size, max(1, int(math.ceil(nb_of_views / (GROUPS_PER_JOB * max_nb_of_jobs)))))
+    nb_of_groups = int(math.ceil(nb_of_views / group_size))
+    if (nb_of_groups < max_nb_of_jobs):
+        limited_by = "groups"
+    elif (nb_of_jobs_in_memory < nb_of_jobs):
+        limited_by = "memory"
+    else:
+        limited_by = "cores"
+    return ({
+        "group_size": group_size,
+        "nb_of_groups": nb_of_groups,
+        "nb_of_jobs": max(1, min(max_nb_of_jobs, nb_of_groups)),
+        "limited_by": limited_by,
+        "nb_of_views": nb_of_views,
+        "downscale": downscale,
+        "available_cores": nb_of_jobs,
+        "available_memory": memory,
+        "memory_per_process": memory_per_process,
+        "estimated_view_time": view_time
+    })
+
+
+def get_the_planned_memory(nb_of_views, downscale, nb_of_jobs, memory):
+    """ Returns the memory (in GB) needed by the DepthMap groups planned with the given arguments
+    (see plan_the_depth_map_groups): the memory of one subprocess times the number of subprocesses run at once.
+    """
+    groups_plan = plan_the_depth_map_groups(nb_of_views, downscale, nb_of_jobs, memory)
+    return (groups_plan["nb_of_jobs"] * groups_plan["memory_per_process"])
+
+
+def get_the_available_cores():
+    """ Returns the ids of the cores the wrapper can run on, sorted.
+    """
+    try:
+        return (sorted(os.sched_getaffinity(0)))
+    except AttributeError:
+        return (list(range(os.cpu_count() or 1)))
+
+
+def get_the_step_cores(step_name, cores):
+    """ Returns the cores given to the given step among the given ones: one of them for the SINGLE_THREADED_STEPS, all of them otherwise.
+    The core of a single-threaded step is chosen from the pid of the wrapper, so that the wrappers run beside each other
+    do not pin their single-threaded steps to the same core.
+    """
+    if (step_name in SINGLE_THREADED_STEPS):
+        return ([cores[os.getpid() % len(cores)]])
+    return (list(cores))
+
+
+def split_the_cores(cores, nb_of_jobs):
+    """ Returns nb_of_jobs sets of contiguous cores, one for each concurrent subprocess of a step run on the given cores.
+    The sets are disjoint and cover the cores (the first sets get one more core when the cores can not be split evenly),
+    unless there are more subprocesses than cores: each subprocess then gets one core, shared in turn.
+    """
+    nb_of_jobs = max(1, nb_of_jobs)
+    if (nb_of_jobs >= len(cores)):
+        return ([[cores[job_iter % len(cores)]] for job_iter in range(nb_of_jobs)])
+    core_sets = []
+    start = 0
+    for job_iter in range(nb_of_jobs):
+        size = len(cores) // nb_of_jobs + (1 if job_iter < len(cores) % nb_of_jobs else 0)
+        core_sets.append(list(cores[start:start + size]))
+        start += size
+    return (core_sets)
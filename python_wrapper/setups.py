@@ -1,3 +1,6 @@
+import utils
+
+
 class Setups():
     """ An instance of the class Setups represents a set of setups used to run the process.
 
@@ -6,15 +9,19 @@ class Setups():
     - quality_choice: quality chosen by the user
     - output_type_choice: type of output chosen by the user
     - nb_of_images: number of input pictures
+    - kwargs:
+        + nb_of_jobs: maximum number of subprocesses run concurrently by a step divided into groups (optional, number of available cores by default)
 
     Attributes
     ----------
     - quality: quality chosen by the user
     - output_type: type of output chosen by the user
     - nb_of_images: number of input pictures
+    - nb_of_jobs: maximum number of subprocesses run concurrently by a step divided into groups
     """
 
-    def __init__(self, quality_choice, output_type_choice, nb_of_images):
+    def __init__(self, quality_choice, output_type_choice, nb_of_images, **kwargs):
         self.quality = quality_choice
         self.output_type = output_type_choice
         self.nb_of_images = nb_of_images
+        self.nb_of_jobs = kwargs.get("nb_of_jobs") or utils.get_the_number_of_cores()
@@ -0,0 +1,293 @@
+import collections
+import http.server
+import ipaddress
+import json
+import os
+import re
+import socket
+import socketserver
+import stat
+import threading
+import urllib.parse
+
+import utils
+
+""" Local status API: the status.json and metadata.json documents of the runs, served from memory with push updates.
+
+The server listens either on a Unix domain socket (a path, which can be shared with other containers through a volume)
+or on a loopback TCP address ("localhost:port"). It is fed by the background writers of the .json files (see json_writer.py):
+each write gives the new content of the document and its changes, numbered in sequence. The requests are:
+    - GET /runs: the runs served and the sequence number of each of their documents. Format: {run_name: {document: sequence}}
+    - GET /runs/<run_name>/<document>: the document (status or metadata), its sequence number in the X-Sequence header,
+    - GET /runs/<run_name>/<document>?since=<sequence>&timeout=<seconds>: long-poll. Waits until there is a change after the
+    given sequence number (at most MAX_POLL_TIMEOUT seconds). Format:
+        {"sequence": ..., "closed": ..., "events": [changes after the sequence number]}
+        or {"sequence": ..., "closed": ..., "document": ...} if the changes are not kept anymore,
+    - GET /runs/<run_name>/<document>/events: server-sent events. A "snapshot" event gives the document, then each change
+    is sent as a "change" event, and an "end" event is sent once the run is over. The id of each event is its sequence
+    number: the stream restarts after the Last-Event-ID header (or the since parameter) if given.
+The changes have the format of the lines of the event logs: {"time": ..., "path": [key, sub_key], "value": ...}
+
+Values
+----------
+- MAX_EVENTS: number of changes kept for each document, for the subscribers which are behind
+- MAX_POLL_TIMEOUT: maximum time a long-poll request waits for a change (in seconds)
+- KEEPALIVE_INTERVAL: time after which a comment is sent on an idle event stream (in seconds)
+"""
+
+MAX_EVENTS = 1000
+MAX_POLL_TIMEOUT = 60
+KEEPALIVE_INTERVAL = 15
+
+# Loopback TCP address given as host:port
+TCP_ADDRESS_PATTERN = re.compile(r'^([\w.\-]+):(\d+)$')
+
+
+class DocumentFeed():
+    """ An instance of the class DocumentFeed keeps the last content of a document and its last changes.
+
+    Attributes
+    ----------
+    - content: last content written (json string)
+    - sequence: sequence number of the last change
+    - events: last MAX_EVENTS changes. Format: collections.deque of (sequence, json string)
+    - closed: True once the run is over
+    - condition: threading.Condition protecting the attributes above, notified at each change
+    """
+
+    def __init__(self):
+        self.content = '{}'
+        self.sequence = 0
+        self.events = collections.deque(maxlen=MAX_EVENTS)
+        self.closed = False
+        self.condition = threading.Condition()
+
+    def publish(self, content, events):
+        """ Stack a write of the document: its content and its changes (lines of the event log).
+        """
+        with self.condition:
+            self.content = content
+            for event in events:
+                self.sequence += 1
+                self.events.append((self.sequence, event.strip()))
+            self.condition.notify_all()
+        return 0
+
+    def close(self):
+        """ Mark the run as over.
+        """
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        return 0
+
+    def get_the_changes(self, since):
+        """ Returns the sequence number, the content and the changes after the given sequence number.
+        Format of the changes: [(sequence, json string), ...], None if they are not kept anymore
+        (or if the sequence number is ahead of the feed, given by a previous server).
+        """
+        with self.condition:
+            if (since == self.sequence):
+                return (self.sequence, self.content, [])
+            if (since > self.sequence):
+                return (self.sequence, self.content, None)
+            if (len(self.events) == 0 or self.events[0][0] > since + 1):
+                return (self.sequence, self.content, None)
+            return (self.sequence, self.content, [(sequence, event) for sequence, event in self.events if sequence > since])
+
+    def wait_for_a_change(self, since, timeout):
+        """ Wait until there is a change after the given sequence number or the run is over, timeout seconds at most.
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: self.sequence != since or self.closed, timeout)
+        return 0
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """ HTTP server on a Unix domain socket, handling each request in a thread of its own.
+    """
+    daemon_threads = True
+
+
+class ThreadingTCPHTTPServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    """ HTTP server on a TCP address, handling each request in a thread of its own.
+    """
+    daemon_threads = True
+
+
+class StatusRequestHandler(http.server.BaseHTTPRequestHandler):
+    """ Handler of the requests of the status server (see the module documentation).
+    """
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        path = [part for part in url.path.split('/') if part]
+        query = urllib.parse.parse_qs(url.query)
+        status_server = self.server.status_server
+        if (path in ([], ["runs"])):
+            self.send_the_body(json.dumps(status_server.get_the_runs()))
+            return
+        if (len(path) not in (3, 4) or path[0] != "runs" or (len(path) == 4 and path[3] != "events")):
+            self.send_error(404)
+            return
+        feed = status_server.get_the_feed(path[1], path[2])
+        if (feed is None):
+            self.send_error(404, "No such run or document")
+            return
+        try:
+            since = int(self.headers.get("Last-Event-ID") or query.get("since", [-1])[0])
+            timeout = min(MAX_POLL_TIMEOUT, float(query.get("timeout", [MAX_POLL_TIMEOUT])[0]))
+        except ValueError:
+            self.send_error(400, "Invalid since or timeout parameter")
+            return
+        if (len(path) == 4):
+            self.stream_the_events(feed, since)
+        elif (since < 0):
+            sequence, content, changes = feed.get_the_changes(0)
+            self.send_the_body(content, sequence)
+        else:
+            feed.wait_for_a_change(since, timeout)
+            sequence, content, changes = feed.get_the_changes(since)
+            if (changes is None):
+                body = '{{"sequence": {}, "closed": {}, "document": {}}}'.format(sequence, json.dumps(feed.closed), content)
+            else:
+                body = '{{"sequence": {}, "closed": {}, "events": [{}]}}'.format(
+                    sequence, json.dumps(feed.closed), ', '.join(event for event_sequence, event in changes))
+            self.send_the_body(body, sequence)
+
+    def send_the_body(self, body, sequence=None):
+        """ Send the given json string as the response.
+        """
+        data = body.encode('utf-8')
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        if (sequence is not None):
+            self.send_header("X-Sequence", str(sequence))
+        self.end_headers()
+        self.wfile.write(data)
+        return 0
+
+    def stream_the_events(self, feed, since):
+        """ Send the changes of the feed as server-sent events until the run is over or the client is gone.
+        A snapshot of the document is sent first if no sequence number is given, or if the changes after it are not kept anymore.
+        """
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        try:
+            while True:
+                sequence, content, changes = feed.get_the_changes(max(0, since))
+                if (since < 0 or changes is None):
+                    self.wfile.write("id: {}\nevent: snapshot\ndata: {}\n\n".format(sequence, content).encode('utf-8'))
+                elif (len(changes) > 0):
+                    for event_sequence, event in changes:
+                        self.wfile.write("id: {}\nevent: change\ndata: {}\n\n".format(event_sequence, event).encode('utf-8'))
+                elif (feed.closed):
+                    self.wfile.write("event: end\ndata: {}\n\n".encode('utf-8'))
+                    self.wfile.flush()
+                    return
+                else:
+                    # Nothing new: tell the client the stream is still alive
+                    self.wfile.write(": keepalive\n\n".encode('utf-8'))
+                self.wfile.flush()
+                since = sequence
+                feed.wait_for_a_change(since, KEEPALIVE_INTERVAL)
+        except (BrokenPipeError, ConnectionResetError):
+            return
+
+    def log_message(self, format, *args):
+        # The requests are not logged (the clients of a Unix socket have no address either)
+        return
+
+
+class StatusServer():
+    """ An instance of the class StatusServer serves the status.json and metadata.json documents of one or several runs
+    from memory, on a Unix domain socket or on a loopback TCP address, in a background thread.
+
+    Building arguments
+    ----------
+    - address: path to a Unix domain socket, or "host:port" with a loopback host (port 0 for any free port)
+
+    Attributes
+    ----------
+    - address: address the server listens on (with the port chosen for a TCP address)
+    - socket_file: path to the Unix domain socket (None for a TCP address)
+    - feeds: feeds of the documents of each run. Format: {run_name: {document: instance of the class DocumentFeed}}
+    - lock: threading.Lock protecting feeds
+    - server: the underlying socketserver server
+    - thread: background thread serving the requests
+    """
+
+    def __init__(self, address):
+        self.feeds = {}
+        self.lock = threading.Lock()
+        tcp_address = TCP_ADDRESS_PATTERN.match(address)
+        if (tcp_address is not None):
+            host, port = tcp_address.group(1), int(tcp_address.group(2))
+            if (not ipaddress.ip_address(socket.gethostbyname(host)).is_loopback):
+                raise ValueError("The status server only listens on a loopback address, not on {}".format(host))
+            self.socket_file = None
+            self.server = ThreadingTCPHTTPServer((host, port), StatusRequestHandler)
+            self.address = "{}:{}".format(host, self.server.server_address[1])
+        else:
+            self.socket_file = os.path.abspath(address)
+            # Socket left by a previous run
+            if (os.path.exists(self.socket_file) and stat.S_ISSOCK(os.stat(self.socket_file).st_mode)):
+                os.remove(self.socket_file)
+            self.server = ThreadingUnixHTTPServer(self.socket_file, StatusRequestHandler)
+            self.address = self.socket_file
+        self.server.status_server = self
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        print ("Status server listening on {}".format(self.address))
+
+    def add_the_run(self, run_name, files):
+        """ Serve the documents of a run, fed by the writers of their .json files. Format of files: {document: path_to_the_json_file}
+        Returns the name the run is served under (run_name, with a suffix if a run still running already has this name).
+        """
+        with self.lock:
+            served_name = run_name
+            suffix = 1
+            while (served_name in self.feeds and not all(feed.closed for feed in self.feeds[served_name].values())):
+                suffix += 1
+                served_name = "{}-{}".format(run_name, suffix)
+            self.feeds[served_name] = dict((document, DocumentFeed()) for document in files)
+        for document in files:
+            utils.watch_json_file(files[document], self.feeds[served_name][document].publish)
+        return (served_name)
+
+    def close_the_run(self, run_name):
+        """ Mark the run as over: the event streams of its documents are ended (the documents are still served).
+        """
+        with self.lock:
+            feeds = list(self.feeds.get(run_name, {}).values())
+        for feed in feeds:
+            feed.close()
+        return 0
+
+    def get_the_feed(self, run_name, document):
+        """ Returns the feed of the given document of the given run (None if there is none).
+        """
+        with self.lock:
+            return (self.feeds.get(run_name, {}).get(document))
+
+    def get_the_runs(self):
+        """ Returns the runs served and the sequence number of each of their documents. Format: {run_name: {document: sequence}}
+        """
+        with self.lock:
+            return (dict((run_name, dict((document, feed.sequence) for document, feed in feeds.items())) for run_name, feeds in self.feeds.items()))
+
+    def close(self):
+        """ End the event streams, stop serving and remove the Unix domain socket.
+        """
+        with self.lock:
+            run_names = list(self.feeds)
+        for run_name in run_names:
+            self.close_the_run(run_name)
+        self.server.shutdown()
+        self.server.server_close()
+        if (self.socket_file is not None and os.path.exists(self.socket_file)):
+            os.remove(self.socket_file)
+        return 0
@@ -0,0 +1,59 @@
+import os
+import queue
+import threading
+import time
+
+import utils
+
+""" Asynchronous streaming of files from the scratch folder back to the output folder.
+
+The files are delivered one after the other by a background thread (see utils.deliver_the_file) while the next steps run.
+"""
+
+
+class Streamer():
+    """ An instance of the class Streamer copies files to their destination in a background thread.
+
+    Attributes
+    ----------
+    - queue: files waiting to be delivered. Format: (source_file, destination_file)
+    - report: report on the files delivered. Format: {"nb_of_files": ..., "bytes_moved": ..., "time_taken": ..., "failed": [source_file, ...]}
+    - thread: background thread delivering the files
+    """
+
+    def __init__(self):
+        self.queue = queue.Queue()
+        self.report = {"nb_of_files": 0, "bytes_moved": 0, "time_taken": 0, "failed": []}
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stream(self, source_file, destination_file):
+        """ Ask for the source file to be delivered at the destination. Returns immediately.
+        """
+        self.queue.put((source_file, destination_file))
+        return 0
+
+    def run(self):
+        """ Loop of the background thread: deliver the files in the order they were given until close is called.
+        """
+        while True:
+            item = self.queue.get()
+            if (item is None):
+                return
+            source_file, destination_file = item
+            starting_time = time.time()
+            try:
+                os.makedirs(os.path.dirname(destination_file), exist_ok=True)
+                method, bytes_moved = utils.deliver_the_file(source_file, destination_file)
+                self.report["nb_of_files"] += 1
+                self.report["bytes_moved"] += bytes_moved
+            except:
+                self.report["failed"].append(source_file)
+            self.report["time_taken"] += time.time() - starting_time
+
+    def close(self):
+        """ Wait until every file has been delivered and stop the background thread. Returns the report.
+        """
+        self.queue.put(None)
+        self.thread.join()
+        return (self.report)
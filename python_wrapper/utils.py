@@ -1,6 +1,27 @@
+import atexit
+import concurrent.futures
+import errno
+import fcntl
+import hashlib
 import json
 import os
 import shutil
+import threading
+
+import json_writer
+
+# Size of the chunks read to hash the files
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# Size of the chunks moved at once by copy_file_range and sendfile, and of the buffer of the buffered copy
+COPY_CHUNK_SIZE = 64 * 1024 * 1024
+BUFFERED_COPY_SIZE = 1024 * 1024
+
+# ioctl sharing the extents of a file with another one (reflink, on btrfs, xfs, ...)
+FICLONE = 0x40049409
+
+# Errors meaning that a delivery method is not possible between the two files, the next method is tried then
+UNSUPPORTED_METHOD_ERRNOS = [errno.EXDEV, errno.EPERM, errno.EMLINK, errno.EOPNOTSUPP, errno.ENOTTY, errno.EINVAL, errno.ENOSYS, errno.EBADF, errno.ETXTBSY]
 
 
 def create_folder(direction):
@@ -19,6 +40,50 @@ def concat_and_normalize_paths(path, *paths):
     return (os.path.normpath(os.path.join(path, *paths)))
 
 
+def get_the_number_of_cores():
+    """ Returns the number of cores available for the process.
+    """
+    try:
+        return (len(os.sched_getaffinity(0)))
+    except AttributeError:
+        return (os.cpu_count() or 1)
+
+
+def get_the_available_memory():
+    """ Returns the memory available on the host in GB, read from /proc/meminfo (total physical memory if it can not be read).
+    """
+    try:
+        with open('/proc/meminfo', 'r') as meminfo:
+            for line in meminfo:
+                if (line.startswith('MemAvailable:')):
+                    return (int(line.split()[1]) / 1024**2)
+    except:
+        pass
+    return (os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') / 1024**3)
+
+
+def get_the_file_hash(file_path):
+    """ Returns the hash (sha256) of the content of the given file.
+    """
+    file_hash = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b''):
+            file_hash.update(chunk)
+    return (file_hash.hexdigest())
+
+
+def link_or_copy_file(source_file, destination_file):
+    """ Hardlink the source file at the destination (replacing it if it exists). Copy it if hardlinks are not possible.
+    """
+    if (os.path.lexists(destination_file)):
+        os.remove(destination_file)
+    try:
+        os.link(source_file, destination_file)
+    except OSError:
+        shutil.copy2(source_file, destination_file)
+    return 0
+
+
 def get_file_direction(file_direction_to_test):
     """ Returns the file direction given in input if it exists. None otherwise.
     """
@@ -28,8 +93,47 @@ def get_file_direction(file_direction_to_test):
         return
 
 
-def fitting_the_json_results_file(directions):
+def get_the_view_ids(sfm_file_direction):
+    """ Returns the list of the view ids (sorted as aliceVision does) listed in the given .sfm file. None if it can not be read.
+    """
+    try:
+        with open(sfm_file_direction, 'r') as sfm_file:
+            sfm_data = json.load(sfm_file)
+        return (sorted((str(view["viewId"]) for view in sfm_data["views"]), key=int))
+    except:
+        return
+
+
+def get_the_reconstructed_view_ids(sfm_file_direction):
+    """ Returns the list of the view ids (sorted as aliceVision does) whose pose is listed in the given .sfm file
+    (every view if the file lists no poses at all). None if it can not be read.
+    """
+    try:
+        with open(sfm_file_direction, 'r') as sfm_file:
+            sfm_data = json.load(sfm_file)
+        if ("poses" not in sfm_data):
+            return (sorted((str(view["viewId"]) for view in sfm_data["views"]), key=int))
+        pose_ids = set(str(pose["poseId"]) for pose in sfm_data["poses"])
+        return (sorted((str(view["viewId"]) for view in sfm_data["views"] if str(view.get("poseId")) in pose_ids), key=int))
+    except:
+        return
+
+
+def get_the_view_paths(sfm_file_direction):
+    """ Returns the paths to the images of the views listed in the given .sfm file. Format: {view_id: path}. None if it can not be read.
+    """
+    try:
+        with open(sfm_file_direction, 'r') as sfm_file:
+            sfm_data = json.load(sfm_file)
+        return (dict((str(view["viewId"]), view["path"]) for view in sfm_data["views"]))
+    except:
+        return
+
+
+def fitting_the_json_results_file(directions, keep_sources=True):
     """ Rename and move the output files to fit the results.json file.
+    The files are delivered in parallel, without copying their content when possible (see deliver_the_file).
+    The output files are kept in the output folder if keep_sources is True (the step outputs stay complete for a resumed run).
     """
     # Converting the results.json file for python
     with open(directions.results_file, 'r') as results:
@@ -47,24 +151,91 @@ def fitting_the_json_results_file(directions):
         }
 
     moving_files_report = {}
-    # Moving and renaming the files
-    for key in converted_results:
-        old_dir = old_dirs_tab[key]
-        moving_files_report[key] = {}
-        moving_files_report[key]["exists"] = True if (old_dir is not None) else False
-        moving_files_report[key]["current_dir"] = old_dir
 
+    def move_the_file(key):
+        old_dir = old_dirs_tab[key]
         new_dir = concat_and_normalize_paths(directions.output_dir, '..', converted_results[key]["location"], converted_results[key]["name"])
         try:
-            shutil.copyfile(old_dir, new_dir)
+            method, bytes_moved = deliver_the_file(old_dir, new_dir, keep_source=keep_sources)
             moving_files_report[key]["moving_success"] = True
             moving_files_report[key]["new_dir"] = new_dir
+            moving_files_report[key]["method"] = method
+            moving_files_report[key]["bytes_moved"] = bytes_moved
         except:
             moving_files_report[key]["moving_success"] = False
             moving_files_report[key]["new_dir"] = None
+
+    # Moving and renaming the files
+    for key in converted_results:
+        old_dir = old_dirs_tab[key]
+        moving_files_report[key] = {}
+        moving_files_report[key]["exists"] = True if (old_dir is not None) else False
+        moving_files_report[key]["current_dir"] = old_dir
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, len(converted_results))) as executor:
+        list(executor.map(move_the_file, converted_results))
     return (moving_files_report)
 
 
+def deliver_the_file(source_file, destination_file, keep_source=True):
+    """ Deliver the source file at the destination with the cheapest method possible. The methods tried are, in order:
+        - rename: the file is moved (only if keep_source is False),
+        - hardlink: the destination shares the inode of the source,
+        - reflink: the destination shares the extents of the source (copy-on-write filesystems),
+        - copy_file_range, then sendfile: the content is copied by the kernel,
+        - buffered copy.
+    An existing destination file is replaced.
+
+    Returns
+    ----------
+    The method used and the number of bytes copied (0 for rename, hardlink and reflink).
+    """
+    if (not keep_source):
+        try:
+            os.rename(source_file, destination_file)
+            return ("rename", 0)
+        except OSError as error:
+            if (error.errno not in UNSUPPORTED_METHOD_ERRNOS):
+                raise
+    try:
+        temporary_file = '{}.tmp-{}'.format(destination_file, os.getpid())
+        os.link(source_file, temporary_file)
+        os.replace(temporary_file, destination_file)
+        return ("hardlink", 0)
+    except OSError as error:
+        if (error.errno not in UNSUPPORTED_METHOD_ERRNOS):
+            raise
+    with open(source_file, 'rb') as source, open(destination_file, 'wb') as destination:
+        try:
+            fcntl.ioctl(destination.fileno(), FICLONE, source.fileno())
+            return ("reflink", 0)
+        except OSError as error:
+            if (error.errno not in UNSUPPORTED_METHOD_ERRNOS):
+                raise
+        size = os.fstat(source.fileno()).st_size
+        # copy_file_range is only available from python 3.8
+        for method in ("copy_file_range", "sendfile"):
+            if (not hasattr(os, method)):
+                continue
+            try:
+                bytes_moved = 0
+                while (bytes_moved < size):
+                    if (method == "copy_file_range"):
+                        nb_of_bytes = os.copy_file_range(source.fileno(), destination.fileno(), COPY_CHUNK_SIZE, bytes_moved, bytes_moved)
+                    else:
+                        nb_of_bytes = os.sendfile(destination.fileno(), source.fileno(), bytes_moved, COPY_CHUNK_SIZE)
+                    if (nb_of_bytes == 0):
+                        break
+                    bytes_moved += nb_of_bytes
+                return (method, bytes_moved)
+            except OSError as error:
+                if (error.errno not in UNSUPPORTED_METHOD_ERRNOS):
+                    raise
+                destination.seek(0)
+                destination.truncate()
+        shutil.copyfileobj(source, destination, BUFFERED_COPY_SIZE)
+        return ("buffered_copy", size)
+
+
 def output_file_report(process_directions):
     """ Returns a report on the output files (existence and location)
 
@@ -107,16 +278,91 @@ def output_file_report(process_directions):
     return (output_file_report)
 
 
+def read_json_file(file):
+    """ Returns the python dictionary represented by the given .json file. An empty dictionary if it can not be read.
+    """
+    try:
+        with open(file, 'r') as json_file:
+            return (json.load(json_file))
+    except:
+        return ({})
+
+
+# Background writers of the .json files. Format: {path_to_the_file: instance of the class JsonFileWriter}
+JSON_FILE_WRITERS = {}
+JSON_FILE_WRITERS_LOCK = threading.Lock()
+
+
 def update_json_file(file, dictionary):
     """ Updates the .json file if it exists.
+    The file is written in the background: successive updates are coalesced and each write is atomic.
+    See json_writer.py for more details.
 
     Arguments
     ----------
     - file: path to the file to update
     - dictionary: a python dictionary representig the json file to update
     """
-    try:
-        with open(file, 'w') as file:
-            json.dump(dictionary, file)
-    except:
-        print ("No such .json file.")
+    with JSON_FILE_WRITERS_LOCK:
+        if (file not in JSON_FILE_WRITERS):
+            JSON_FILE_WRITERS[file] = json_writer.JsonFileWriter(file)
+        writer = JSON_FILE_WRITERS[file]
+    writer.update(dictionary)
+    return 0
+
+
+def watch_json_file(file, listener):
+    """ Call the given function after each write of the .json file with the content written and its changes
+    (lines of its event log, see json_writer.py).
+    """
+    with JSON_FILE_WRITERS_LOCK:
+        if (file not in JSON_FILE_WRITERS):
+            JSON_FILE_WRITERS[file] = json_writer.JsonFileWriter(file)
+        writer = JSON_FILE_WRITERS[file]
+    writer.add_listener(listener)
+    return 0
+
+
+def unwatch_json_file(file, listener):
+    """ Stop calling the given function after each write of the .json file (see watch_json_file).
+    """
+    with JSON_FILE_WRITERS_LOCK:
+        writer = JSON_FILE_WRITERS.get(file)
+    if (writer is not None):
+        writer.remove_listener(listener)
+    return 0
+
+
+def close_json_files(*files):
+    """ Write the last state of the given .json files and stop their background writers.
+    """
+    for file in files:
+        with JSON_FILE_WRITERS_LOCK:
+            writer = JSON_FILE_WRITERS.pop(file, None)
+        if (writer is not None):
+            writer.close()
+    return 0
+
+
+def close_all_json_files():
+    """ Write the last state of every .json file still open and stop their background writers.
+    Called at exit: the writers run in daemon threads, their last update would be lost otherwise.
+    """
+    with JSON_FILE_WRITERS_LOCK:
+        files = list(JSON_FILE_WRITERS)
+    close_json_files(*files)
+    return 0
+
+
+atexit.register(close_all_json_files)
+
+
+def remove_json_event_logs(*files):
+    """ Remove the NDJSON event logs of the given .json files so that a new run starts new logs.
+    """
+    for file in files:
+        try:
+            os.remove(json_writer.get_the_events_file(file))
+        except FileNotFoundError:
+            pass
+    return 0
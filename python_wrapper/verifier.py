@@ -0,0 +1,137 @@
+import concurrent.futures
+import json
+import os
+
+import utils
+
+""" Verification of the outputs of the steps.
+
+The folders are read with os.scandir and the searches stop at the first match. The steps which write one output
+per view are checked view by view: the expected outputs of each step are listed in EXPECTED_VIEW_OUTPUTS.
+aliceVision skips the views without neighbour cameras in DepthMap and DepthMapFilter, so the views missing for the
+steps of OPTIONAL_VIEW_OUTPUT_STEPS are only reported as a warning, unless no view has its outputs.
+
+Values
+----------
+- EXPECTED_VIEW_OUTPUTS: outputs written for each view. Format: {step_name: (intern location of the outputs, [file name patterns])}
+Each pattern is formatted with the view id (and the describer type for feature_extraction).
+- OPTIONAL_VIEW_OUTPUT_STEPS: steps which may leave views without outputs
+- MAX_MISSING_VIEWS_REPORTED: maximum number of views without outputs listed in the report
+"""
+
+EXPECTED_VIEW_OUTPUTS = {
+    "feature_extraction": ("output", ["{view_id}.{describer_type}.feat", "{view_id}.{describer_type}.desc"]),
+    "prepare_dense_scene": ("output", ["{view_id}.exr"]),
+    "depth_map": ("output", ["{view_id}_depthMap.exr"]),
+    "depth_map_filter": ("output", ["{view_id}_depthMap.exr"])
+}
+
+OPTIONAL_VIEW_OUTPUT_STEPS = ["depth_map", "depth_map_filter"]
+
+MAX_MISSING_VIEWS_REPORTED = 20
+
+
+def find_a_file(folder, extension=None):
+    """ Returns the path to a file of the given folder tree (with the given extension if given). None if there is none.
+    The files of a folder are looked at before its subfolders and the search stops at the first match.
+    """
+    folders_to_visit = [folder]
+    while (len(folders_to_visit) > 0):
+        subfolders = []
+        try:
+            with os.scandir(folders_to_visit.pop()) as entries:
+                for entry in entries:
+                    if (entry.is_dir(follow_symlinks=False)):
+                        subfolders.append(entry.path)
+                    elif (extension is None or os.path.splitext(entry.name)[1] == extension):
+                        return (entry.path)
+        except OSError:
+            continue
+        folders_to_visit.extend(subfolders)
+    return
+
+
+def get_the_missing_view_outputs(folder, view_ids, patterns):
+    """ Returns the list of the view ids for which one of the files given by the patterns is missing in the folder.
+    """
+    try:
+        with os.scandir(folder) as entries:
+            file_names = set(entry.name for entry in entries)
+    except OSError:
+        file_names = set()
+    missing_views = []
+    for view_id in view_ids:
+        for pattern in patterns:
+            if (pattern.format(view_id=view_id) not in file_names):
+                missing_views.append(view_id)
+                break
+    return (missing_views)
+
+
+def are_the_missing_views_tolerated(step_name, nb_of_missing_views, nb_of_views):
+    """ Returns True if the step may leave the given number of views (out of nb_of_views) without outputs.
+    """
+    if (nb_of_missing_views == 0):
+        return (True)
+    return (step_name in OPTIONAL_VIEW_OUTPUT_STEPS and nb_of_missing_views < nb_of_views)
+
+
+def get_the_view_ids_of_the_images(folder):
+    """ Returns the view ids of the images written by prepare_dense_scene in the given folder (<view_id>.exr files), sorted.
+    """
+    view_ids = []
+    try:
+        with os.scandir(folder) as entries:
+            for entry in entries:
+                view_id, extension = os.path.splitext(entry.name)
+                if (extension == '.exr' and view_id.isdigit()):
+                    view_ids.append(view_id)
+    except OSError:
+        pass
+    return (sorted(view_ids, key=int))
+
+
+def get_the_tree_files(folder):
+    """ Returns the files of the given folder tree. Format: [(path relative to the folder, path), ...]
+    """
+    tree_files = []
+    folders_to_visit = [folder]
+    while (len(folders_to_visit) > 0):
+        current_folder = folders_to_visit.pop()
+        try:
+            with os.scandir(current_folder) as entries:
+                for entry in entries:
+                    if (entry.is_dir(follow_symlinks=False)):
+                        folders_to_visit.append(entry.path)
+                    else:
+                        tree_files.append((os.path.relpath(entry.path, folder), entry.path))
+        except OSError:
+            continue
+    return (sorted(tree_files))
+
+
+def write_the_manifest(folder, manifest_file, nb_of_workers):
+    """ Write the size and the checksum (sha256) of every file of the given folder tree in the manifest file.
+    The checksums are computed in a pool of nb_of_workers threads. Format of the manifest:
+        {path relative to the folder: {"size": ..., "sha256": ...}, ...}
+
+    Returns
+    ----------
+    A report. Format: {"manifest_file": ..., "nb_of_files": ..., "total_size": ...}
+    """
+    tree_files = get_the_tree_files(folder)
+
+    def get_the_file_entry(file_path):
+        return ({"size": os.path.getsize(file_path), "sha256": utils.get_the_file_hash(file_path)})
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, nb_of_workers)) as executor:
+        entries = list(executor.map(get_the_file_entry, [file_path for relative_path, file_path in tree_files]))
+    manifest = dict((relative_path, entry) for (relative_path, file_path), entry in zip(tree_files, entries))
+    os.makedirs(os.path.dirname(manifest_file), exist_ok=True)
+    with open(manifest_file, 'w') as manifest_json:
+        json.dump(manifest, manifest_json, indent=4, sort_keys=True)
+    return ({
+        "manifest_file": manifest_file,
+        "nb_of_files": len(manifest),
+        "total_size": sum(entry["size"] for entry in manifest.values())
+    })
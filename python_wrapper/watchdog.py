@@ -0,0 +1,77 @@
+import time
+
+import history
+
+""" Time limits and stall detection of the subprocesses run by the steps.
+
+Each subprocess (each group for the steps divided into groups) is given:
+    - a time limit, only if a time_limit_factor is given: time_limit_factor times its time predicted from the default rates
+    of the cost model (see history.py), which scale with the number of views processed and the cost parameters of the quality,
+    and at least MIN_TIME_LIMIT. The default rates are not calibrated on the host, hence no time limit by default and a floor of hours,
+    - a stall time: the subprocess is stalled if it has written nothing on stderr and its process tree has used no CPU
+    time for that long.
+The subprocess tree of a subprocess which exceeds either is killed (see Node.kill_the_process).
+
+Values
+----------
+- MIN_TIME_LIMIT: minimum time limit of a subprocess (in seconds)
+- DEFAULT_STALL_TIME: default stall time (in minutes)
+"""
+
+MIN_TIME_LIMIT = 2 * 3600
+DEFAULT_STALL_TIME = 30
+
+
+class Watchdog():
+    """ An instance of the class Watchdog checks a running subprocess against its time limit and its stall time.
+
+    Building arguments
+    ----------
+    - time_limit: time limit of the subprocess in seconds (None for no limit)
+    - stall_time: stall time in seconds (None for no stall detection)
+    - monitor: the instance of the class LogMonitor reading the stderr of the subprocess
+
+    Attributes
+    ----------
+    - time_limit: time limit of the subprocess
+    - stall_time: stall time
+    - monitor: the instance of the class LogMonitor reading the stderr of the subprocess
+    - starting_time: time when the subprocess started
+    - last_cpu_time: CPU time used by the process tree at the last sample
+    - last_cpu_activity_time: time when the process tree was last seen using CPU time
+    """
+
+    def __init__(self, time_limit, stall_time, monitor):
+        self.time_limit = time_limit
+        self.stall_time = stall_time
+        self.monitor = monitor
+        self.starting_time = time.time()
+        self.last_cpu_time = 0
+        self.last_cpu_activity_time = self.starting_time
+
+    def check(self, sampler):
+        """ Check the subprocess from a sample of its process tree (instance of the class ProcessSampler).
+        Returns the reason why it must be killed and a detail (None, None if it must not).
+        """
+        current_time = time.time()
+        cpu_time = sampler.get_the_cpu_time()
+        if (cpu_time > self.last_cpu_time):
+            self.last_cpu_time = cpu_time
+            self.last_cpu_activity_time = current_time
+        if (self.time_limit is not None and current_time - self.starting_time > self.time_limit):
+            return ("time limit", "running for more than {:.0f} s".format(self.time_limit))
+        if (self.stall_time is not None):
+            last_activity_time = max(self.last_cpu_activity_time, self.monitor.last_line_time or self.starting_time)
+            if (current_time - last_activity_time > self.stall_time):
+                return ("stalled", "no output and no CPU time for {:.0f} s".format(current_time - last_activity_time))
+        return (None, None)
+
+
+def get_the_time_limit(step_name, step_parameters, nb_of_views, nb_of_cores, time_limit_factor):
+    """ Returns the time limit of a subprocess of the given step processing nb_of_views views on nb_of_cores cores
+    (in seconds, None if time_limit_factor is None or 0).
+    """
+    if (not time_limit_factor):
+        return
+    predicted_time, source = history.CostModel().predict_the_step(step_name, step_parameters, nb_of_views, nb_of_cores)
+    return (max(MIN_TIME_LIMIT, time_limit_factor * predicted_time))
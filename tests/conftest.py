@@ -0,0 +1,21 @@
+""" The modules of the wrapper import each other as top-level modules (they are run from the python_wrapper folder).
+"""
+import os
+import sys
+import types
+
+import pytest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TESTS_DIR, '..', 'python_wrapper'))
+
+
+@pytest.fixture
+def make_a_node():
+    """ Returns a function building a fake node: an object with the attributes of a Node read by the cache, the feature store,
+    the cost model and the deadline planner. Other attributes are given as keyword arguments.
+    """
+    def make(step_name, parameters=None, nb_of_images=10, nb_of_jobs=4, **attributes):
+        return (types.SimpleNamespace(name=step_name, parameters=parameters if parameters is not None else {}, nb_of_images=nb_of_images,
+                                      nb_of_jobs=nb_of_jobs, selected_views=None, groups_plan=None, available_memory=None, **attributes))
+    return (make)
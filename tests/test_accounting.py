@@ -0,0 +1,31 @@
+import asyncio
+import subprocess
+import sys
+
+import accounting
+
+# Burns CPU time with 50 MB allocated, long enough to be sampled
+BUSY_PROCESS = "import time\nmemory = bytearray(50 * 1024 * 1024)\nend = time.time() + 0.5\nwhile time.time() < end:\n    pass\n"
+
+
+def test_the_event_loop_gives_the_fields_of_wait4():
+    running_process = subprocess.Popen([sys.executable, '-c', BUSY_PROCESS])
+    report = accounting.wait_and_account(running_process)
+
+    async def run_on_the_loop():
+        loop_process = await asyncio.create_subprocess_exec(sys.executable, '-c', BUSY_PROCESS)
+        return (await accounting.wait_and_account_on_the_loop(loop_process))
+
+    # With python < 3.8, the subprocesses can only be watched from the event loop of the main thread
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        loop_report = loop.run_until_complete(run_on_the_loop())
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+    assert sorted(loop_report) == sorted(report)
+    for resources in (report, loop_report):
+        assert resources["user_time"] + resources["system_time"] > 0.2
+        assert resources["max_rss"] > 50 * 1024 * 1024
+        assert resources["nb_of_processes"] == 1
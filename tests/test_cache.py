@@ -0,0 +1,147 @@
+import os
+import shutil
+
+import cache
+
+
+def write_a_file(file_path, content):
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    with open(file_path, 'w') as file:
+        file.write(content)
+    return (file_path)
+
+
+def get_a_run(run_dir, make_a_node):
+    """ Returns the root folders of a run with a binary, an input image and the nodes of two chained steps.
+    """
+    run_roots = {"output": os.path.join(run_dir, "output"), "input": os.path.join(run_dir, "input")}
+    binary_name = write_a_file(os.path.join(run_dir, "bin", "aliceVision_step"), "binary")
+    write_a_file(os.path.join(run_roots["input"], "image.jpg"), "image")
+    first_node = make_a_node(
+        "camera_init", {"a": "1"}, binary_name=binary_name,
+        output_folder=os.path.join(run_roots["output"], "camera_init"),
+        intern_locations={"imageFolder": run_roots["input"], "output": os.path.join(run_roots["output"], "camera_init", "cameraInit.sfm")}
+        )
+    second_node = make_a_node(
+        "feature_extraction", {"b": "2"}, binary_name=binary_name,
+        output_folder=os.path.join(run_roots["output"], "feature_extraction"),
+        intern_locations={"input": first_node.intern_locations["output"], "output": os.path.join(run_roots["output"], "feature_extraction")}
+        )
+    write_a_file(first_node.intern_locations["output"], run_roots["input"] + "/image.jpg")
+    return (run_roots, first_node, second_node)
+
+
+def get_the_keys(step_cache, nodes):
+    return ([step_cache.get_the_key(node) for node in nodes])
+
+
+def test_the_keys_do_not_depend_on_the_run_folders(tmp_path, make_a_node):
+    first_run = get_a_run(str(tmp_path / "first"), make_a_node)
+    second_run = get_a_run(str(tmp_path / "second"), make_a_node)
+    first_keys = get_the_keys(cache.StepCache(str(tmp_path / "cache"), 10**6, first_run[0]), first_run[1:])
+    second_keys = get_the_keys(cache.StepCache(str(tmp_path / "cache"), 10**6, second_run[0]), second_run[1:])
+    assert first_keys == second_keys
+
+
+def test_the_keys_follow_the_inputs(tmp_path, make_a_node):
+    run_roots, first_node, second_node = get_a_run(str(tmp_path / "run"), make_a_node)
+    keys = get_the_keys(cache.StepCache(str(tmp_path / "cache"), 10**6, run_roots), [first_node, second_node])
+    # The outputs of the previous step are identified by its key, not read
+    write_a_file(first_node.intern_locations["output"], "rewritten")
+    assert get_the_keys(cache.StepCache(str(tmp_path / "cache"), 10**6, run_roots), [first_node, second_node]) == keys
+    # A new input image changes every key downstream
+    write_a_file(os.path.join(run_roots["input"], "image.jpg"), "another image")
+    new_keys = get_the_keys(cache.StepCache(str(tmp_path / "cache"), 10**6, run_roots), [first_node, second_node])
+    assert new_keys[0] != keys[0] and new_keys[1] != keys[1]
+    # New parameters change the key of the step
+    second_node.parameters = {"b": "3"}
+    assert get_the_keys(cache.StepCache(str(tmp_path / "cache"), 10**6, run_roots), [first_node, second_node])[1] != new_keys[1]
+
+
+def test_an_uncacheable_step_chains_the_folders_it_writes(tmp_path, make_a_node):
+    run_roots, first_node, second_node = get_a_run(str(tmp_path / "run"), make_a_node)
+    step_cache = cache.StepCache(str(tmp_path / "cache"), 10**6, run_roots)
+    step_cache.get_the_key(first_node)
+    first_folder_key = step_cache.folder_keys[first_node.output_folder]
+    second_node.name = cache.UNCACHEABLE_STEPS[0]
+    assert step_cache.get_the_key(second_node) is None
+    assert step_cache.folder_keys[first_node.output_folder] != first_folder_key
+
+
+def test_store_and_restore_in_another_run(tmp_path, make_a_node):
+    first_run_roots, first_node, second_node = get_a_run(str(tmp_path / "first"), make_a_node)
+    step_cache = cache.StepCache(str(tmp_path / "cache"), 10**6, first_run_roots)
+    key = step_cache.get_the_key(first_node)
+    step_cache.store(key, first_node.name, first_node.output_folder)
+
+    second_run_roots, first_node, second_node = get_a_run(str(tmp_path / "second"), make_a_node)
+    step_cache = cache.StepCache(str(tmp_path / "cache"), 10**6, second_run_roots)
+    assert step_cache.get_the_key(first_node) == key
+    os.remove(first_node.intern_locations["output"])
+    assert step_cache.restore(key, first_node.output_folder)
+    # The paths to the folders of the first run are replaced by the ones of this run, the cache entry is untouched
+    with open(first_node.intern_locations["output"], 'r') as restored_file:
+        assert restored_file.read() == second_run_roots["input"] + "/image.jpg"
+    with open(os.path.join(step_cache.get_the_entry_dir(key), "output", "cameraInit.sfm"), 'r') as entry_file:
+        assert entry_file.read() == first_run_roots["input"] + "/image.jpg"
+    assert not step_cache.restore("unknown", first_node.output_folder)
+
+
+def test_the_least_recently_used_entries_are_evicted(tmp_path):
+    step_cache = cache.StepCache(str(tmp_path / "cache"), 25, {})
+    for entry_iter, key in enumerate(["first", "second"]):
+        write_a_file(str(tmp_path / key / "output.bin"), "x" * 10)
+        step_cache.store(key, "step", str(tmp_path / key))
+        os.utime(os.path.join(step_cache.get_the_entry_dir(key), "entry.json"), (entry_iter, entry_iter))
+    # Restoring an entry marks it as recently used
+    assert step_cache.restore("first", str(tmp_path / "restored"))
+    write_a_file(str(tmp_path / "third" / "output.bin"), "x" * 10)
+    step_cache.store("third", "step", str(tmp_path / "third"))
+    assert sorted(os.listdir(step_cache.cache_dir)) == ["first", "third"]
+    # An entry bigger than the cache is not stored
+    write_a_file(str(tmp_path / "big" / "output.bin"), "x" * 30)
+    step_cache.store("big", "step", str(tmp_path / "big"))
+    assert not os.path.isdir(step_cache.get_the_entry_dir("big"))
+
+
+def test_the_entries_computed_from_a_removed_entry_are_removed(tmp_path, make_a_node):
+    run_roots, first_node, second_node = get_a_run(str(tmp_path / "run"), make_a_node)
+    write_a_file(os.path.join(second_node.output_folder, "features.bin"), "features")
+    step_cache = cache.StepCache(str(tmp_path / "cache"), 10**6, run_roots)
+    first_key, second_key = get_the_keys(step_cache, [first_node, second_node])
+    assert step_cache.upstream_keys[second_key] == [first_key]
+    # The entry of a step is not stored without the entries of the steps it was computed from
+    step_cache.store(second_key, second_node.name, second_node.output_folder)
+    assert not os.path.isdir(step_cache.get_the_entry_dir(second_key))
+    step_cache.store(first_key, first_node.name, first_node.output_folder)
+    step_cache.store(second_key, second_node.name, second_node.output_folder)
+    assert sorted(os.listdir(step_cache.cache_dir)) == sorted([first_key, second_key])
+    # The first step would be run again (it may give other outputs): the entry of the second step is invalid
+    step_cache.remove_the_entries([first_key])
+    assert os.listdir(step_cache.cache_dir) == []
+
+
+def test_an_entry_whose_upstream_entry_is_gone_is_not_restored(tmp_path, make_a_node):
+    run_roots, first_node, second_node = get_a_run(str(tmp_path / "run"), make_a_node)
+    write_a_file(os.path.join(second_node.output_folder, "features.bin"), "features")
+    step_cache = cache.StepCache(str(tmp_path / "cache"), 10**6, run_roots)
+    first_key, second_key = get_the_keys(step_cache, [first_node, second_node])
+    step_cache.store(first_key, first_node.name, first_node.output_folder)
+    step_cache.store(second_key, second_node.name, second_node.output_folder)
+    # Removed by another process, or by a version of the cache which did not remove the dependent entries
+    shutil.rmtree(step_cache.get_the_entry_dir(first_key))
+    assert not step_cache.restore(second_key, str(tmp_path / "restored"))
+    assert os.listdir(step_cache.cache_dir) == []
+
+
+def test_the_files_linked_from_the_feature_store_are_not_detached(tmp_path):
+    stored_file = write_a_file(str(tmp_path / "store" / "hash.sift.feat"), "features")
+    computed_file = write_a_file(str(tmp_path / "entry" / "2.sift.feat"), "features")
+    linked_file = str(tmp_path / "feature_extraction" / "1.sift.feat")
+    shared_file = str(tmp_path / "feature_extraction" / "2.sift.feat")
+    os.makedirs(str(tmp_path / "feature_extraction"))
+    os.link(stored_file, linked_file)
+    os.link(computed_file, shared_file)
+    cache.detach_the_tree(str(tmp_path / "feature_extraction"), ignored_files={linked_file})
+    assert os.stat(linked_file).st_nlink == 2
+    assert os.stat(shared_file).st_nlink == 1
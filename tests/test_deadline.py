@@ -0,0 +1,113 @@
+import time
+import types
+
+import deadline
+import history
+
+
+def get_the_pipeline(make_a_node):
+    """ Returns nodes with the MEDIUM parameters of the steps lowered to fit a deadline.
+    """
+    step_parameters = {
+        "feature_extraction": {"describerPreset": "normal"},
+        "depth_map": {"downscale": "2"},
+        "meshing": {"maxPoints": "5000000"},
+        "texturing": {"downscale": "2"}
+    }
+    return ([make_a_node(step_name, parameters, nb_of_images=100) for step_name, parameters in step_parameters.items()])
+
+
+def test_the_preset_is_kept_when_the_deadline_is_far(make_a_node):
+    pipeline = get_the_pipeline(make_a_node)
+    planner = deadline.DeadlinePlanner(history.CostModel(), time.time() + 10**6)
+    planner.plan(pipeline)
+    plan_report = planner.report()["plans"][0]
+    assert plan_report["feasible"]
+    assert plan_report["settings"] == {
+        "depth_map.downscale": "2", "texturing.downscale": "2", "meshing.maxPoints": "5000000", "feature_extraction.describerPreset": "normal"
+    }
+
+
+def test_the_parameters_are_lowered_to_fit(make_a_node):
+    pipeline = get_the_pipeline(make_a_node)
+    cost_model = history.CostModel()
+    preset_time = cost_model.predict_the_pipeline(pipeline)["total"]
+    planner = deadline.DeadlinePlanner(cost_model, time.time() + preset_time / 2)
+    prediction = planner.plan(pipeline)
+    assert planner.plans[0]["feasible"]
+    assert prediction["total"] <= preset_time / 2
+    # DepthMap is the most expensive step: its downscale factor is raised first
+    assert int(planner.plans[0]["settings"]["depth_map.downscale"]) > 2
+
+
+def test_the_quickest_parameters_when_the_deadline_can_not_be_met(make_a_node):
+    pipeline = get_the_pipeline(make_a_node)
+    planner = deadline.DeadlinePlanner(history.CostModel(), time.time() - 1)
+    planner.plan(pipeline)
+    plan_report = planner.plans[0]
+    assert not plan_report["feasible"]
+    for step_name, parameter, values in deadline.KNOBS:
+        assert plan_report["settings"]["{}.{}".format(step_name, parameter)] == values[-1]
+
+
+def test_a_new_plan_starts_from_the_preset(make_a_node):
+    pipeline = get_the_pipeline(make_a_node)
+    cost_model = history.CostModel()
+    planner = deadline.DeadlinePlanner(cost_model, time.time() - 1)
+    planner.plan(pipeline)
+    planner.deadline = time.time() + 10**6
+    planner.plan(pipeline[1:], after=pipeline[0].name)
+    assert planner.plans[1]["after"] == "feature_extraction"
+    assert planner.plans[1]["settings"]["depth_map.downscale"] == "2"
+
+
+def test_the_knobs_of_a_frozen_step_are_kept(make_a_node):
+    pipeline = get_the_pipeline(make_a_node)
+    planner = deadline.DeadlinePlanner(history.CostModel(), time.time() - 1)
+    # The interrupted run had lowered the downscale factor of DepthMap to 4
+    planner.freeze(pipeline[1], {"depth_map.downscale": "4"})
+    planner.plan(pipeline[1:])
+    plan_report = planner.plans[0]
+    assert plan_report["settings"]["depth_map.downscale"] == "4"
+    assert plan_report["settings"]["texturing.downscale"] == "8"
+    assert plan_report["frozen"] == ["depth_map.downscale"]
+    assert pipeline[1].parameters["downscale"] == "4"
+
+
+def test_overrun_and_slowdown(make_a_node):
+    planner = deadline.DeadlinePlanner(history.CostModel(), time.time())
+    assert planner.get_the_slowdown() == 1.0
+    step_node = make_a_node("depth_map")
+    # 20 % over the prediction but less than MIN_OVERRUN seconds
+    assert not planner.node_done(step_node, 100, 100 + deadline.MIN_OVERRUN - 1)
+    assert planner.node_done(step_node, 100, 200)
+    assert planner.get_the_slowdown() == 2.0
+    # Never less than 1
+    planner.node_done(step_node, 100, 10)
+    assert planner.get_the_slowdown() == 1.0
+
+
+def test_set_the_knob_copies_the_parameters(make_a_node):
+    preset_parameters = {"downscale": "2"}
+    step_node = make_a_node("depth_map", preset_parameters)
+    step_node.groups_plan = {"nb_of_jobs": 2}
+    deadline.set_the_knob(step_node, "downscale", "4")
+    assert step_node.parameters["downscale"] == "4"
+    assert preset_parameters["downscale"] == "2"
+    assert step_node.groups_plan is None
+
+
+def test_the_steps_without_history_are_reported(tmp_path, capsys, make_a_node):
+    planner = deadline.DeadlinePlanner(history.CostModel(), time.time() + 10**6)
+    planner.plan(get_the_pipeline(make_a_node))
+    assert sorted(planner.plans[0]["uncalibrated_steps"]) == ["depth_map", "feature_extraction", "meshing", "texturing"]
+    assert "WARNING" in capsys.readouterr().out
+
+    run_history = history.RunHistory(str(tmp_path / "history.sqlite"))
+    for step_node in get_the_pipeline(make_a_node):
+        metadata_dict = {"global_report": {}, "step_by_step_report": {step_node.name: {"time_taken": 10, "report": {"success": True}}}}
+        run_history.record_the_run(types.SimpleNamespace(quality="HIGH", output_type="MESH", nb_of_images=100), [step_node], metadata_dict, time.time())
+    planner = deadline.DeadlinePlanner(history.CostModel(run_history), time.time() + 10**6)
+    planner.plan(get_the_pipeline(make_a_node))
+    assert planner.plans[0]["uncalibrated_steps"] == []
+    assert "WARNING" not in capsys.readouterr().out
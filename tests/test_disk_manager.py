@@ -0,0 +1,90 @@
+import os
+
+import disk_manager
+
+
+def get_a_pipeline(output_dir, make_a_node):
+    """ Returns the nodes of a pipeline whose steps read the outputs of the previous ones:
+    feature_extraction reads camera_init, feature_matching reads both, structure_from_motion reads all three.
+    """
+    def get_the_folder(step_name):
+        return (os.path.join(output_dir, step_name))
+    pipeline = [
+        make_a_node("camera_init", output_folder=get_the_folder("camera_init"), intern_locations={
+            "imageFolder": os.path.join(output_dir, "..", "input"), "output": os.path.join(get_the_folder("camera_init"), "cameraInit.sfm")}),
+        make_a_node("feature_extraction", output_folder=get_the_folder("feature_extraction"), intern_locations={
+            "input": os.path.join(get_the_folder("camera_init"), "cameraInit.sfm"), "output": get_the_folder("feature_extraction")}),
+        make_a_node("feature_matching", output_folder=get_the_folder("feature_matching"), intern_locations={
+            "input": os.path.join(get_the_folder("camera_init"), "cameraInit.sfm"), "featuresFolders": get_the_folder("feature_extraction"),
+            "output": get_the_folder("feature_matching")}),
+        make_a_node("structure_from_motion", output_folder=get_the_folder("structure_from_motion"), intern_locations={
+            "input": os.path.join(get_the_folder("camera_init"), "cameraInit.sfm"), "featuresFolders": get_the_folder("feature_extraction"),
+            "matchesFolders": get_the_folder("feature_matching"), "output": os.path.join(get_the_folder("structure_from_motion"), "sfm.abc")})
+    ]
+    for step_node in pipeline:
+        os.makedirs(step_node.output_folder)
+        with open(os.path.join(step_node.output_folder, "output.bin"), 'wb') as output_file:
+            output_file.write(b"x" * 10000)
+    return (pipeline)
+
+
+def test_the_last_consumers(tmp_path, make_a_node):
+    pipeline = get_a_pipeline(str(tmp_path / "output"), make_a_node)
+    assert disk_manager.get_the_last_consumers(pipeline) == {
+        "camera_init": "structure_from_motion",
+        "feature_extraction": "structure_from_motion",
+        "feature_matching": "structure_from_motion"
+    }
+    # The last step reading a folder is its last consumer, the folders read by no step have none
+    assert disk_manager.get_the_last_consumers(pipeline[:3]) == {"camera_init": "feature_matching", "feature_extraction": "feature_matching"}
+
+
+def test_a_step_written_in_the_folder_of_another_does_not_consume_it(tmp_path, make_a_node):
+    pipeline = get_a_pipeline(str(tmp_path / "output"), make_a_node)
+    # Like camera_connection, which writes in the prepare_dense_scene folder
+    nested_node = make_a_node("camera_connection", output_folder=os.path.join(pipeline[2].output_folder, "connections"),
+                              intern_locations={"input": pipeline[2].output_folder})
+    assert "feature_matching" not in disk_manager.get_the_last_consumers(pipeline[:3] + [nested_node])
+
+
+def test_the_folders_are_deleted_after_their_last_consumer(tmp_path, make_a_node):
+    pipeline = get_a_pipeline(str(tmp_path / "output"), make_a_node)
+    status_dict = dict((step_node.name, {"status": "done"}) for step_node in pipeline)
+    manager = disk_manager.DiskManager(pipeline, str(tmp_path / "output"), keep=["feature_extraction"], method="delete")
+    for step_node in pipeline[:3]:
+        manager.node_done(step_node, True, str(tmp_path / "status.json"), status_dict)
+    assert all(os.path.isdir(step_node.output_folder) for step_node in pipeline)
+    # A failed consumer cleans nothing
+    manager.node_done(pipeline[3], False, str(tmp_path / "status.json"), status_dict)
+    assert os.path.isdir(pipeline[0].output_folder)
+    manager.node_done(pipeline[3], True, str(tmp_path / "status.json"), status_dict)
+    disk_report = manager.close()
+    # The kept steps and the deliverables are not cleaned
+    assert sorted(os.listdir(str(tmp_path / "output"))) == ["feature_extraction", "structure_from_motion"]
+    assert sorted(disk_report["cleaned_steps"]) == ["camera_init", "feature_matching"]
+    assert disk_report["cleaned_steps"]["camera_init"] == {"method": "delete", "size": 10000, "after": "structure_from_motion"}
+    assert disk_report["freed"] == 20000
+    assert status_dict["camera_init"]["cleaned"] == "delete"
+    assert "cleaned" not in status_dict["feature_extraction"]
+    assert disk_report["peak_disk_usage"] >= disk_report["final_disk_usage"]
+
+
+def test_the_folders_are_compressed(tmp_path, make_a_node):
+    pipeline = get_a_pipeline(str(tmp_path / "output"), make_a_node)
+    manager = disk_manager.DiskManager(pipeline, str(tmp_path / "output"), method="compress")
+    for step_node in pipeline:
+        manager.node_done(step_node, True, str(tmp_path / "status.json"), {})
+    disk_report = manager.close()
+    assert os.path.isfile(str(tmp_path / "output" / "camera_init.tar.gz"))
+    assert not os.path.isdir(pipeline[0].output_folder)
+    assert disk_report["cleaned_steps"]["camera_init"]["compressed_size"] < 10000
+
+
+def test_the_steps_cleaned_by_an_interrupted_run_are_not_cleaned_again(tmp_path, make_a_node):
+    pipeline = get_a_pipeline(str(tmp_path / "output"), make_a_node)
+    manager = disk_manager.DiskManager(pipeline, str(tmp_path / "output"), method="delete")
+    manager.mark_the_cleaned_steps({"camera_init": {"status": "done", "cleaned": "compress"}})
+    manager.node_done(pipeline[3], True, str(tmp_path / "status.json"), {})
+    disk_report = manager.close()
+    assert disk_report["cleaned_steps"]["camera_init"]["resumed"]
+    assert os.path.isdir(pipeline[0].output_folder)
@@ -0,0 +1,79 @@
+import math
+import time
+import types
+
+import pytest
+
+import history
+
+
+def record_a_run(run_history, step_node, time_taken, success=True, resumed=False):
+    setups = types.SimpleNamespace(quality="MEDIUM", output_type="MESH", nb_of_images=step_node.nb_of_images)
+    metadata_dict = {
+        "global_report": {"time_taken": time_taken},
+        "step_by_step_report": {step_node.name: {"time_taken": time_taken, "resumed": resumed, "report": {"success": success}}}
+    }
+    return (run_history.record_the_run(setups, [step_node], metadata_dict, time.time()))
+
+
+def test_fit_the_power_law():
+    a, b = history.fit_the_power_law([(x, 3 * x**2) for x in (10, 100, 1000)])
+    assert a == pytest.approx(3)
+    assert b == pytest.approx(2)
+    # A single number of views: linear
+    assert history.fit_the_power_law([(10, 20), (10, 40)]) == (3.0, 1.0)
+    # The exponent is bounded
+    assert history.fit_the_power_law([(x, x**5) for x in (10, 100)])[1] == history.MAX_EXPONENT
+
+
+def test_cost_factor_and_key():
+    assert history.get_the_cost_factor("depth_map", {"downscale": "4"}) == 0.25
+    assert history.get_the_cost_factor("meshing", {"maxPoints": "2500000"}) == 0.5
+    assert history.get_the_cost_factor("feature_extraction", {"describerPreset": "high"}) == 2
+    assert history.get_the_cost_factor("camera_init", {}) == 1
+    assert history.get_the_cost_key("depth_map", {"downscale": "4", "nbGPUs": "0"}) == '["4"]'
+    assert history.get_the_cost_key("camera_init", {"sensorDatabase": "x"}) == '[]'
+
+
+def test_default_prediction():
+    cost_model = history.CostModel()
+    predicted_time, source = cost_model.predict_the_step("depth_map", {"downscale": "2"}, 10, 4)
+    assert source == "default"
+    assert predicted_time == pytest.approx(history.DEFAULT_STEP_RATES["depth_map"] * 10 / 4)
+    # A single-threaded step does not go faster with more cores
+    predicted_time, source = cost_model.predict_the_step("camera_init", {}, 10, 4)
+    assert predicted_time == pytest.approx(history.DEFAULT_STEP_RATES["camera_init"] * 10)
+
+
+def test_prediction_from_the_history(tmp_path, make_a_node):
+    run_history = history.RunHistory(str(tmp_path / "history.sqlite"))
+    for nb_of_images in (10, 100):
+        record_a_run(run_history, make_a_node("depth_map", {"downscale": "2"}, nb_of_images), 2 * nb_of_images)
+    # Failed and reused steps are not used by the model
+    record_a_run(run_history, make_a_node("depth_map", {"downscale": "2"}, 1000), 1, success=False)
+    record_a_run(run_history, make_a_node("depth_map", {"downscale": "2"}, 1000), 1, resumed=True)
+    assert len(run_history.get_the_step_runs("depth_map")) == 2
+
+    cost_model = history.CostModel(run_history)
+    predicted_time, source = cost_model.predict_the_step("depth_map", {"downscale": "2"}, 1000, 4)
+    assert source == "history"
+    assert predicted_time == pytest.approx(2000)
+    # Other cost parameters: the runs of the step, scaled by the cost factor
+    predicted_time, source = cost_model.predict_the_step("depth_map", {"downscale": "4"}, 1000, 4)
+    assert source == "history_of_the_step"
+    assert predicted_time == pytest.approx(500)
+    assert cost_model.predict_the_step("meshing", {"maxPoints": "5000000"}, 10, 4)[1] == "default"
+
+
+def test_eta(make_a_node):
+    pipeline = [make_a_node("camera_init"), make_a_node("depth_map", {"downscale": "2"})]
+    prediction = {"steps": {"camera_init": {"predicted_time": 10}, "depth_map": {"predicted_time": 30}}, "total": 40}
+    eta = history.get_the_eta(prediction, pipeline, 1, time.time(), step_remaining_time=15)
+    assert eta["remaining_time"] == pytest.approx(15)
+    assert eta["progress"] == pytest.approx(100 * 25 / 40)
+    # The step running can not count for less than nothing
+    eta = history.get_the_eta(prediction, pipeline, 1, time.time() - 1000)
+    assert eta["remaining_time"] == 0
+    eta = history.get_the_eta(prediction, pipeline, 2, time.time())
+    assert eta["remaining_time"] == 0 and eta["progress"] == 100
+    assert not math.isnan(history.get_the_eta({"steps": {}, "total": 0}, [], 0, time.time())["progress"])
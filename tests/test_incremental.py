@@ -0,0 +1,46 @@
+import os
+
+import incremental
+
+
+def get_a_store(store_dir):
+    """ Returns a store of a run with four views, the fourth being new, where the matches of the first two are stored.
+    """
+    feature_store = incremental.FeatureStore(store_dir)
+    feature_store.features_key = "features"
+    feature_store.views = [("1", "hash_1"), ("2", "hash_2"), ("3", "hash_3"), ("4", "hash_4")]
+    feature_store.new_view_ids = ["4"]
+    matches_key = incremental.get_the_parameters_key({"features_key": feature_store.features_key})
+    os.makedirs(os.path.join(store_dir, "matches"))
+    with open(os.path.join(store_dir, "matches", "{}.txt".format(matches_key)), 'w') as matches_file:
+        incremental.write_the_matches(matches_file, "hash_2", "hash_1", [("sift", ["0 0\n"])])
+    return (feature_store)
+
+
+def test_the_pairs_of_previous_views_missing_from_the_store_are_matched(tmp_path, make_a_node):
+    feature_store = get_a_store(str(tmp_path / "store"))
+    image_pairs_list = str(tmp_path / "imageMatches.txt")
+    with open(image_pairs_list, 'w') as file:
+        file.write("1 2 3 4\n2 3\n")
+    node = make_a_node("feature_matching", output_folder=str(tmp_path / "feature_matching"), intern_locations={"imagePairsList": image_pairs_list})
+    feature_store.prepare_the_node(node)
+    with open(node.intern_locations["imagePairsList"], 'r') as file:
+        assert file.read() == "1 3 4\n2 3\n"
+    assert node.incremental_report["new_pairs"] == 3
+
+
+def test_the_matches_computed_are_not_reused(tmp_path, make_a_node):
+    feature_store = get_a_store(str(tmp_path / "store"))
+    node = make_a_node("feature_matching", output_folder=str(tmp_path / "feature_matching"), intern_locations={"imagePairsList": str(tmp_path / "imageMatches.txt")})
+    open(node.intern_locations["imagePairsList"], 'w').close()
+    feature_store.prepare_the_node(node)
+    with open(os.path.join(node.output_folder, "0.matches.txt"), 'w') as matches_file:
+        incremental.write_the_matches(matches_file, "1", "3", [("sift", ["1 1\n"])])
+        incremental.write_the_matches(matches_file, "3", "4", [("sift", ["2 2\n"])])
+    feature_store.update_the_store(node)
+    # Only the pair stored by a previous run is reused, the pairs computed are stored
+    assert node.incremental_report["reused_pairs"] == 1
+    reused_pairs = [(view_i, view_j) for view_i, view_j, descriptors_matches
+                    in incremental.read_the_matches(os.path.join(node.output_folder, "reused.matches.txt"))]
+    assert reused_pairs == [("1", "2")]
+    assert len(feature_store.read_the_stored_pairs()) == 3
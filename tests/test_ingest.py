@@ -0,0 +1,149 @@
+import io
+import os
+import struct
+import zlib
+
+import ingest
+
+
+def get_a_jpeg():
+    """ Returns a minimal JPEG file: frame header of a 2x2 gray image, start of scan, scan data and end of image.
+    """
+    frame_header = b'\xff\xc0' + struct.pack('>HBHHB', 11, 8, 2, 2, 1) + b'\x01\x11\x00'
+    start_of_scan = b'\xff\xda' + struct.pack('>HB', 8, 1) + b'\x01\x00\x00\x3f\x00'
+    return (b'\xff\xd8' + frame_header + start_of_scan + b'\x12\x34' + b'\xff\xd9')
+
+
+def get_a_png_chunk(chunk_type, chunk_data):
+    return (struct.pack('>I', len(chunk_data)) + chunk_type + chunk_data + struct.pack('>I', zlib.crc32(chunk_type + chunk_data) & 0xffffffff))
+
+
+def get_a_png(image_data=None):
+    """ Returns a 2x2 RGB PNG file (its inflated image data can be given).
+    """
+    if (image_data is None):
+        image_data = 2 * (b'\x00' + 6 * b'\x80')
+    return (ingest.PNG_SIGNATURE + get_a_png_chunk(b'IHDR', struct.pack('>IIBBBBB', 2, 2, 8, 2, 0, 0, 0))
+            + get_a_png_chunk(b'IDAT', zlib.compress(image_data)) + get_a_png_chunk(b'IEND', b''))
+
+
+def get_a_tiff(tags=(256, 257)):
+    """ Returns a little-endian TIFF header and a first IFD holding the given tags.
+    """
+    ifd = struct.pack('<H', len(tags)) + b''.join(struct.pack('<HHII', tag, 3, 1, 2) for tag in tags) + struct.pack('<I', 0)
+    return (b'II*\x00' + struct.pack('<I', 8) + ifd)
+
+
+def check(check_function, data):
+    """ Run the given check on the given data as on a file.
+    """
+    return (check_function(io.BytesIO(data), len(data)))
+
+
+def test_valid_images():
+    assert check(ingest.check_the_jpeg, get_a_jpeg()) is None
+    assert check(ingest.check_the_png, get_a_png()) is None
+    assert check(ingest.check_the_tiff, get_a_tiff()) is None
+
+
+def test_corrupt_jpeg():
+    assert check(ingest.check_the_jpeg, b'\x89PNG') == "not a JPEG file"
+    assert check(ingest.check_the_jpeg, get_a_jpeg()[:-2]) == "truncated scan (no end of image)"
+    assert check(ingest.check_the_jpeg, get_a_jpeg()[:10]) == "truncated segment"
+    assert check(ingest.check_the_jpeg, b'\xff\xd8\xff\xd9') == "end of image before the scan"
+
+
+def test_corrupt_png():
+    png_data = get_a_png()
+    assert check(ingest.check_the_png, png_data[:-12]) == "truncated file (no IEND chunk)"
+    # A byte changed in the IHDR chunk
+    assert check(ingest.check_the_png, png_data[:20] + b'\x07' + png_data[21:]) == "bad CRC in IHDR chunk"
+    assert check(ingest.check_the_png, get_a_png(b'\x00' * 7)) == "image data of 7 bytes instead of 14"
+
+
+def test_corrupt_tiff():
+    assert check(ingest.check_the_tiff, get_a_tiff(tags=(256,))) == "no image dimensions"
+    assert check(ingest.check_the_tiff, get_a_tiff()[:12]) == "truncated IFD"
+    assert check(ingest.check_the_tiff, b'II*\x00' + struct.pack('<I', 100)) == "first IFD outside of the file"
+
+
+def test_end_of_image_followed_by_a_trailer():
+    # Data appended after the end of image (e.g. a video), longer than a block read from the end
+    jpeg_data = get_a_jpeg() + b'\x00' * (2 * ingest.JPEG_TRAILER_BLOCK_SIZE + 1)
+    assert check(ingest.check_the_jpeg, jpeg_data) is None
+    # End of image marker across two blocks
+    jpeg_data = get_a_jpeg() + b'\x00' * (ingest.JPEG_TRAILER_BLOCK_SIZE - 1)
+    assert check(ingest.check_the_jpeg, jpeg_data) is None
+    assert check(ingest.check_the_jpeg, get_a_jpeg()[:-2] + b'\x00' * ingest.JPEG_TRAILER_BLOCK_SIZE) == "truncated scan (no end of image)"
+
+
+def test_check_the_image(tmp_path):
+    for file_name, content in [("notes.txt", b'text'), ("empty.jpg", b''), ("image.exr", b'exr'), ("image.JPG", get_a_jpeg())]:
+        (tmp_path / file_name).write_bytes(content)
+    assert ingest.check_the_image(str(tmp_path / "notes.txt")) == (None, "not an image", None)
+    assert ingest.check_the_image(str(tmp_path / "empty.jpg")) == ("JPEG", "empty file", 0)
+    assert ingest.check_the_image(str(tmp_path / "image.exr"))[:2] == ("EXR", None)
+    assert ingest.check_the_image(str(tmp_path / "image.JPG")) == ("JPEG", None, len(get_a_jpeg()))
+
+
+def test_ingest_the_images(tmp_path):
+    input_dir = tmp_path / "input"
+    input_dir.mkdir()
+    (input_dir / "a.jpg").write_bytes(get_a_jpeg())
+    (input_dir / "b.jpg").write_bytes(get_a_jpeg())
+    (input_dir / "c.png").write_bytes(get_a_png())
+    (input_dir / "d.png").write_bytes(get_a_png()[:-12])
+    (input_dir / "e.txt").write_bytes(b'text')
+    images_dir = str(tmp_path / "images")
+    progress = []
+    report = ingest.ingest_the_images(str(input_dir), images_dir, 2, on_progress=lambda nb_of_checked_files, nb_of_files: progress.append(nb_of_checked_files))
+    assert report["success"]
+    assert report["nb_of_files"] == 5
+    assert report["nb_of_images"] == 2
+    assert report["formats"] == {"JPEG": 1, "PNG": 1}
+    assert report["dropped"] == {
+        "b.jpg": "duplicate of a.jpg",
+        "d.png": "truncated file (no IEND chunk)",
+        "e.txt": "not an image"
+    }
+    assert sorted(os.listdir(images_dir)) == ["a.jpg", "c.png"]
+    assert report["link_methods"] == {"hardlink": 2}
+    assert progress[-1] == 5
+    assert ingest.count_the_images(str(input_dir)) == 4
+
+
+def test_missing_input_folder(tmp_path):
+    report = ingest.ingest_the_images(str(tmp_path / "missing"), str(tmp_path / "images"), 1)
+    assert not report["success"]
+    assert report["nb_of_images"] == 0
+    assert report["error"].startswith("input folder unreadable")
+    assert ingest.count_the_images(str(tmp_path / "missing")) == 0
+
+
+def test_only_the_images_of_the_same_size_are_hashed(tmp_path, monkeypatch):
+    input_dir = tmp_path / "input"
+    input_dir.mkdir()
+    (input_dir / "a.jpg").write_bytes(get_a_jpeg())
+    (input_dir / "b.jpg").write_bytes(get_a_jpeg()[:-2] + b'\x00\xff\xd9')
+    (input_dir / "c.png").write_bytes(get_a_png())
+    hashed_paths = []
+    get_the_content_hash = ingest.get_the_content_hash
+    monkeypatch.setattr(ingest, "get_the_content_hash", lambda file_path: hashed_paths.append(file_path) or get_the_content_hash(file_path))
+    report = ingest.ingest_the_images(str(input_dir), str(tmp_path / "images"), 1)
+    assert report["nb_of_images"] == 3
+    assert hashed_paths == []
+
+
+def test_the_images_are_symlinked_across_filesystems(tmp_path, monkeypatch):
+    input_dir = tmp_path / "input"
+    input_dir.mkdir()
+    (input_dir / "a.jpg").write_bytes(get_a_jpeg())
+
+    def link_across_filesystems(source, destination):
+        raise OSError(18, "Invalid cross-device link")
+
+    monkeypatch.setattr(os, "link", link_across_filesystems)
+    images_dir = str(tmp_path / "images")
+    report = ingest.ingest_the_images(str(input_dir), images_dir, 1)
+    assert report["link_methods"] == {"symlink": 1}
+    assert os.readlink(os.path.join(images_dir, "a.jpg")) == str(input_dir / "a.jpg")
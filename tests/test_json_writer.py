@@ -0,0 +1,40 @@
+import json
+
+import utils
+
+
+def test_a_listener_removed_is_not_called(tmp_path):
+    json_file = str(tmp_path / "status.json")
+    contents = []
+
+    def listener(content, events):
+        contents.append(json.loads(content))
+
+    utils.watch_json_file(json_file, listener)
+    utils.update_json_file(json_file, {"step": 1})
+    utils.close_json_files(json_file)
+    assert contents == [{"step": 1}]
+    utils.watch_json_file(json_file, listener)
+    utils.unwatch_json_file(json_file, listener)
+    utils.update_json_file(json_file, {"step": 2})
+    utils.close_json_files(json_file)
+    assert contents == [{"step": 1}]
+    # Unknown files and listeners are ignored
+    utils.unwatch_json_file(str(tmp_path / "other.json"), listener)
+
+
+def test_a_failing_listener_does_not_stop_the_writes(tmp_path):
+    json_file = str(tmp_path / "status.json")
+    contents = []
+
+    def failing_listener(content, events):
+        raise RuntimeError("Event loop is closed")
+
+    utils.watch_json_file(json_file, failing_listener)
+    utils.watch_json_file(json_file, lambda content, events: contents.append(json.loads(content)))
+    utils.update_json_file(json_file, {"step": 1})
+    utils.JSON_FILE_WRITERS[json_file].flush()
+    utils.update_json_file(json_file, {"step": 2})
+    utils.close_json_files(json_file)
+    assert contents == [{"step": 1}, {"step": 2}]
+    assert utils.read_json_file(json_file) == {"step": 2}
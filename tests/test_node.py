@@ -0,0 +1,98 @@
+import os
+import sys
+import time
+
+import cache
+import directions
+import node
+import setups
+import watchdog
+
+# Stub of a binary writing the file given by --output, running the given action, then exiting with the given return code
+STUB_BINARY = """#!{python}
+import os
+import sys
+import time
+output = sys.argv[sys.argv.index('--output') + 1]
+os.makedirs(os.path.dirname(output), exist_ok=True)
+with open(output, 'w') as output_file:
+    output_file.write('partial')
+{action}
+sys.exit({return_code})
+"""
+
+
+def get_the_camera_init_node(run_dir, return_code, action="pass"):
+    """ Returns the camera_init node of a run whose binary is a stub running the given action and exiting with the given return code.
+    """
+    for folder in ("bin", "input", "output"):
+        os.makedirs(os.path.join(run_dir, folder), exist_ok=True)
+    binary_file = os.path.join(run_dir, "bin", "aliceVision_cameraInit")
+    with open(binary_file, 'w') as binary:
+        binary.write(STUB_BINARY.format(python=sys.executable, action=action, return_code=return_code))
+    os.chmod(binary_file, 0o755)
+    with open(os.path.join(run_dir, "input", "image.jpg"), 'w') as image:
+        image.write("image")
+    set_setups = setups.Setups("DRAFT", "MESH", 1, nb_of_jobs=1)
+    set_directions = directions.Directions(os.path.join(run_dir, "bin"), os.path.join(run_dir, "input"), os.path.join(run_dir, "output"),
+                                           os.path.join(run_dir, "output", "log"), results_dir=None, metadata_dir=run_dir, status_dir=run_dir)
+    os.makedirs(set_directions.log_dir, exist_ok=True)
+    return (node.Node("camera_init", set_directions.get_the_process_directions(), set_directions.log_dir, set_setups))
+
+
+def run_the_node_with_a_cache(tmp_path, return_code):
+    step_node = get_the_camera_init_node(str(tmp_path / "run"), return_code)
+    step_cache = cache.StepCache(str(tmp_path / "cache"), 10**6, {"output": str(tmp_path / "run" / "output")})
+    step_node.run_the_node(str(tmp_path / "run" / "status.json"), {}, step_cache)
+    return (step_node, step_cache)
+
+
+def test_a_successful_step_is_stored(tmp_path):
+    step_node, step_cache = run_the_node_with_a_cache(tmp_path, 0)
+    assert step_node.return_code == 0
+    assert os.path.isdir(step_cache.get_the_entry_dir(step_node.cache_report["key"]))
+
+
+def test_a_failed_step_is_not_stored(tmp_path):
+    step_node, step_cache = run_the_node_with_a_cache(tmp_path, 1)
+    # The outputs are there, but the subprocess failed
+    assert step_node.check_locations_existence_and_step_success()[0]
+    assert step_node.return_code == 1
+    assert not os.path.isdir(step_cache.get_the_entry_dir(step_node.cache_report["key"]))
+    assert not step_node.report()["success"]
+
+
+def run_a_hanging_node(tmp_path, action, **attributes):
+    """ Run a camera_init node whose binary runs the given action then sleeps. Returns the node and the time it took.
+    """
+    step_node = get_the_camera_init_node(str(tmp_path / "run"), 0, action="{}\ntime.sleep(60)".format(action))
+    for name, value in attributes.items():
+        setattr(step_node, name, value)
+    starting_time = time.time()
+    step_node.run_the_node(str(tmp_path / "run" / "status.json"), {})
+    return (step_node, time.time() - starting_time)
+
+
+def test_a_stalled_subprocess_is_killed(tmp_path):
+    step_node, time_taken = run_a_hanging_node(tmp_path, "pass", stall_time=1)
+    assert time_taken < 30
+    assert [kill["reason"] for kill in step_node.kills] == ["stalled"]
+    assert step_node.return_code != 0
+    assert not step_node.report()["success"]
+
+
+def test_a_subprocess_is_killed_at_its_time_limit(tmp_path, monkeypatch):
+    monkeypatch.setattr(watchdog, "MIN_TIME_LIMIT", 1)
+    # Busy writing on stderr: never stalled
+    step_node, time_taken = run_a_hanging_node(
+        tmp_path, "while True:\n    sys.stderr.write('working\\n')\n    sys.stderr.flush()\n    time.sleep(0.1)", time_limit_factor=10**-6, stall_time=1)
+    assert time_taken < 30
+    assert [kill["reason"] for kill in step_node.kills] == ["time limit"]
+    assert not step_node.report()["success"]
+
+
+def test_a_subprocess_writing_a_fatal_line_is_killed(tmp_path):
+    step_node, time_taken = run_a_hanging_node(tmp_path, "sys.stderr.write('[fatal] out of memory\\n')\nsys.stderr.flush()")
+    assert time_taken < 30
+    assert step_node.kills[0]["reason"] == "fatal line"
+    assert "out of memory" in step_node.kills[0]["detail"]
@@ -0,0 +1,91 @@
+import threading
+
+import scheduler
+
+
+def test_depth_map_groups_limited_by_the_memory():
+    # 8.5 GB per subprocess at full resolution: 2 subprocesses fit in 17 GB
+    groups_plan = scheduler.plan_the_depth_map_groups(100, 1, 8, 17)
+    assert groups_plan["memory_per_process"] == 8.5
+    assert groups_plan["nb_of_jobs"] == 2
+    assert groups_plan["limited_by"] == "memory"
+    assert groups_plan["group_size"] * groups_plan["nb_of_groups"] >= 100
+
+
+def test_depth_map_groups_limited_by_the_cores():
+    groups_plan = scheduler.plan_the_depth_map_groups(1000, 16, 4, 64)
+    assert groups_plan["limited_by"] == "cores"
+    assert groups_plan["nb_of_jobs"] == 4
+    # At least GROUPS_PER_JOB groups for each subprocess
+    assert groups_plan["group_size"] == 125
+    assert groups_plan["nb_of_groups"] == 8
+
+
+def test_depth_map_groups_limited_by_the_groups():
+    groups_plan = scheduler.plan_the_depth_map_groups(3, 2, 8, 64)
+    assert groups_plan["limited_by"] == "groups"
+    assert groups_plan["group_size"] == 1
+    assert groups_plan["nb_of_jobs"] == 3
+
+
+def test_depth_map_groups_with_too_little_memory():
+    groups_plan = scheduler.plan_the_depth_map_groups(10, 1, 4, 1)
+    assert groups_plan["nb_of_jobs"] == 1
+
+
+def test_planned_memory():
+    groups_plan = scheduler.plan_the_depth_map_groups(100, 1, 8, 17)
+    assert scheduler.get_the_planned_memory(100, 1, 8, 17) == groups_plan["nb_of_jobs"] * groups_plan["memory_per_process"]
+
+
+def test_split_the_cores():
+    assert scheduler.split_the_cores([0, 1, 2, 3, 4], 2) == [[0, 1, 2], [3, 4]]
+    assert scheduler.split_the_cores([0, 1, 2, 3], 1) == [[0, 1, 2, 3]]
+    # More subprocesses than cores: one core each, shared in turn
+    assert scheduler.split_the_cores([4, 5], 3) == [[4], [5], [4]]
+
+
+def test_step_cores():
+    assert scheduler.get_the_step_cores("meshing", [2, 3]) == [2, 3]
+    step_cores = scheduler.get_the_step_cores("camera_init", [2, 3])
+    assert len(step_cores) == 1 and step_cores[0] in [2, 3]
+
+
+def test_demand():
+    resource_budget = scheduler.ResourceBudget(4, 10)
+    assert resource_budget.get_the_demand("camera_init") == (1, scheduler.STEP_MEMORY["camera_init"])
+    assert resource_budget.get_the_demand("meshing") == (3, scheduler.STEP_MEMORY["meshing"])
+    assert resource_budget.get_the_demand("depth_map", 6) == (3, 6)
+    # Never more than the budget
+    assert resource_budget.get_the_demand("depth_map", 20) == (3, 10)
+    assert scheduler.ResourceBudget(1, 10).get_the_demand("meshing") == (1, scheduler.STEP_MEMORY["meshing"])
+
+
+def test_reserve_and_release():
+    resource_budget = scheduler.ResourceBudget(4, 10)
+    with resource_budget.reserve("meshing") as (core_ids, memory):
+        assert memory == scheduler.STEP_MEMORY["meshing"]
+        assert len(resource_budget.free_cores) == 1
+        assert resource_budget.free_memory == 10 - memory
+        # A single-threaded step fits beside it
+        with resource_budget.reserve("camera_init") as (single_core_ids, single_memory):
+            assert len(single_core_ids) == 1
+            assert len(resource_budget.free_cores) == 0
+    assert resource_budget.free_cores == set(range(4))
+    assert resource_budget.free_memory == 10
+
+
+def test_reserve_waits_for_the_resources():
+    resource_budget = scheduler.ResourceBudget(4, 10)
+    reserved = threading.Event()
+
+    def reserve_the_meshing():
+        with resource_budget.reserve("meshing"):
+            reserved.set()
+
+    with resource_budget.reserve("texturing"):
+        thread = threading.Thread(target=reserve_the_meshing)
+        thread.start()
+        assert not reserved.wait(0.2)
+    thread.join(5)
+    assert reserved.is_set()
@@ -0,0 +1,53 @@
+import json
+import os
+
+import verifier
+
+
+def write_files(folder, file_names):
+    os.makedirs(folder, exist_ok=True)
+    for file_name in file_names:
+        with open(os.path.join(folder, file_name), 'w') as file:
+            file.write(file_name)
+    return 0
+
+
+def test_missing_view_outputs(tmp_path):
+    folder = str(tmp_path)
+    write_files(folder, ["1.sift.feat", "1.sift.desc", "2.sift.feat"])
+    patterns = ["{view_id}.sift.feat", "{view_id}.sift.desc"]
+    assert verifier.get_the_missing_view_outputs(folder, ["1", "2", "3"], patterns) == ["2", "3"]
+    assert verifier.get_the_missing_view_outputs(str(tmp_path / "missing"), ["1"], patterns) == ["1"]
+
+
+def test_tolerated_missing_views():
+    assert verifier.are_the_missing_views_tolerated("feature_extraction", 0, 10)
+    assert not verifier.are_the_missing_views_tolerated("feature_extraction", 1, 10)
+    # DepthMap skips the views without neighbour cameras, but not all of them
+    assert verifier.are_the_missing_views_tolerated("depth_map", 3, 10)
+    assert not verifier.are_the_missing_views_tolerated("depth_map_filter", 10, 10)
+
+
+def test_view_ids_of_the_images(tmp_path):
+    write_files(str(tmp_path), ["10.exr", "9.exr", "mvs.ini", "a.exr"])
+    assert verifier.get_the_view_ids_of_the_images(str(tmp_path)) == ["9", "10"]
+
+
+def test_find_a_file(tmp_path):
+    write_files(str(tmp_path / "sub"), ["mesh.obj"])
+    write_files(str(tmp_path), ["log.txt"])
+    assert verifier.find_a_file(str(tmp_path), '.obj') == str(tmp_path / "sub" / "mesh.obj")
+    assert verifier.find_a_file(str(tmp_path)) == str(tmp_path / "log.txt")
+    assert verifier.find_a_file(str(tmp_path), '.abc') is None
+
+
+def test_manifest(tmp_path):
+    write_files(str(tmp_path / "step" / "sub"), ["b.bin"])
+    write_files(str(tmp_path / "step"), ["a.bin"])
+    manifest_file = str(tmp_path / "manifest" / "step.json")
+    report = verifier.write_the_manifest(str(tmp_path / "step"), manifest_file, 2)
+    assert report == {"manifest_file": manifest_file, "nb_of_files": 2, "total_size": len("a.bin") + len("b.bin")}
+    with open(manifest_file, 'r') as manifest_json:
+        manifest = json.load(manifest_json)
+    assert sorted(manifest) == ["a.bin", os.path.join("sub", "b.bin")]
+    assert len(manifest["a.bin"]["sha256"]) == 64
@@ -0,0 +1,50 @@
+import types
+
+import watchdog
+
+
+class FakeSampler():
+    """ Sampler of a process tree whose CPU time is set by the test.
+    """
+
+    def __init__(self):
+        self.cpu_time = 0
+
+    def get_the_cpu_time(self):
+        return (self.cpu_time)
+
+
+def get_a_watchdog(time_limit, stall_time, elapsed_time):
+    """ Returns a watchdog of a subprocess started elapsed_time seconds ago, which has written no line, and a sampler of its tree.
+    """
+    process_watchdog = watchdog.Watchdog(time_limit, stall_time, types.SimpleNamespace(last_line_time=None))
+    process_watchdog.starting_time -= elapsed_time
+    process_watchdog.last_cpu_activity_time -= elapsed_time
+    return (process_watchdog, FakeSampler())
+
+
+def test_the_time_limit():
+    process_watchdog, sampler = get_a_watchdog(100, None, 50)
+    assert process_watchdog.check(sampler) == (None, None)
+    process_watchdog.starting_time -= 60
+    assert process_watchdog.check(sampler)[0] == "time limit"
+
+
+def test_cpu_time_and_output_are_activity():
+    process_watchdog, sampler = get_a_watchdog(None, 30, 60)
+    assert process_watchdog.check(sampler)[0] == "stalled"
+    # The tree used CPU time since the last sample
+    sampler.cpu_time = 1
+    assert process_watchdog.check(sampler) == (None, None)
+    process_watchdog.last_cpu_activity_time -= 60
+    assert process_watchdog.check(sampler)[0] == "stalled"
+    # A line was written on stderr
+    process_watchdog.monitor.last_line_time = process_watchdog.last_cpu_activity_time + 59
+    assert process_watchdog.check(sampler) == (None, None)
+
+
+def test_no_limit_by_default():
+    process_watchdog, sampler = get_a_watchdog(None, None, 10**6)
+    assert process_watchdog.check(sampler) == (None, None)
+    assert watchdog.get_the_time_limit("depth_map", {"downscale": "2"}, 10, 4, None) is None
+    assert watchdog.get_the_time_limit("camera_init", {}, 1, 1, 1) == watchdog.MIN_TIME_LIMIT